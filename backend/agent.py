@@ -1,49 +1,278 @@
 """
 ReAct Agent for orchestrating SQL, RAG, and ML tools
 """
-from typing import List, AsyncIterator, Dict, Any
-from langchain_openai import ChatOpenAI
+import asyncio
+import functools
+import time
+import uuid
+from typing import List, AsyncIterator, Dict, Any, Optional
+from langchain_core.messages import AIMessageChunk, SystemMessage
 from langchain_core.tools import Tool
 from langgraph.prebuilt import create_react_agent
 from config import Config
+from checkpoints import CheckpointThreads, create_checkpointer
+from metrics import agent_requests, agent_steps, llm_cost, llm_tokens
+from query_cache import normalize_question
+from sessions import Session, get_session, session_scope
+from single_flight import SingleFlight, StreamSingleFlight
+from tracing import TracingCallback, start_trace
+from usage import usage_store, usage_summary
 from utils import (
     QueryLogger,
-    get_httpx_client,
-    reset_tool_usage,
     get_tool_usage_status,
+    get_chat_model,
+    model_routing_telemetry,
+    record_stage,
+    timed_stage,
 )
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Progress shown to the user while a tool runs
+TOOL_STATUS_MESSAGES = {
+    "SQL_Query": "Converting natural language to SQL...",
+    "Semantic_Search": "Semantic search in progress...",
+    "ML_Prediction": "Running appropriate algorithm and statistical analysis to perform the prediction...",
+}
+
+
+def _is_tool_error(message) -> bool:
+    """Tool results reporting a failure; the tools return errors as text instead of raising"""
+    if getattr(message, "status", None) == "error":
+        return True
+    content = message.content if isinstance(message.content, str) else ""
+    return content.startswith("Error") or content.startswith('{"error"')
+
 
 class PromotionAnalysisAgent:
     """ReAct Agent for FMCG Promotion Analysis"""
     
-    def __init__(self, tools: List[Tool], schema_description: str, few_shot_examples: str = ""):
+    def __init__(
+        self,
+        tools: List[Tool],
+        schema_description: str,
+        few_shot_examples: str = "",
+        schema_retriever=None,
+        dataset_version: str = None,
+        checkpointer=None,
+        answer_cache=None,
+    ):
         self.tools = tools
         self.schema_description = schema_description
+        self.schema_retriever = schema_retriever
         self.few_shot_examples = few_shot_examples
+        self.dataset_version = dataset_version
+        self.system_prompt = self._compile_system_prompt()
         
-        # Create ChatOpenAI with standard OpenAI API
-        http_client = get_httpx_client()
-        http_async_client = get_httpx_client(async_mode=True)
-        self.llm = ChatOpenAI(
-            model=Config.LLM_MODEL,
-            temperature=Config.LLM_TEMPERATURE,
-            openai_api_key=Config.OPENAI_API_KEY,
-            http_client=http_client,
-            http_async_client=http_async_client
-        )
+        # Final answers are reused for repeated questions until the data is re-synced
+        self.answer_cache = answer_cache if Config.ANSWER_CACHE_ENABLED else None
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate(dataset_version)
         
-        # Create managed ReAct agent via LangGraph prebuilt
-        self.agent = create_react_agent(self.llm, self.tools)
-    
+        # Identical questions arriving while one is running attach to that run
+        self.query_flights = SingleFlight() if Config.AGENT_COALESCE_REQUESTS else None
+        self.stream_flights = StreamSingleFlight() if Config.AGENT_COALESCE_REQUESTS else None
+        
+        # Planner role: tool selection and final answer synthesis
+        self.llm = get_chat_model("planner", "agent_planning", stream_usage=True)
+        
+        # Every completed step is checkpointed, so a run's final state can be read back
+        # and an interrupted run resumed without re-executing finished LLM calls and tools
+        if checkpointer is None and Config.AGENT_CHECKPOINTS_ENABLED:
+            checkpointer = create_checkpointer()
+        self.checkpointer = checkpointer
+        self.threads = CheckpointThreads(checkpointer) if checkpointer is not None else None
+        
+        # Independent tool calls requested in one turn are executed concurrently by the
+        # tool node, so a multi-tool step costs about as much as its slowest tool
+        planner = self.llm.bind_tools(self.tools, parallel_tool_calls=Config.AGENT_PARALLEL_TOOL_CALLS)
+        
+        # Create managed ReAct agent via LangGraph prebuilt; the static prefix is
+        # the system message so it stays byte-identical across questions
+        self.agent = create_react_agent(
+            planner, self.tools, prompt=SystemMessage(self.system_prompt), checkpointer=self.checkpointer
+        )
 
-    
-    
-    def query(self, question: str) -> dict:
-        """Execute query through the agent"""
+    def _compile_system_prompt(self) -> str:
+        """Static prompt prefix, built once per dataset version.
+
+        Everything here is identical for every question so the provider can
+        serve it from its prompt cache. Tool descriptions are already sent in
+        the tool schema and are not repeated; per-question context goes in the
+        user message after this prefix.
+        """
+        if self.schema_retriever is not None:
+            column_names = ", ".join(doc.name for doc in self.schema_retriever.columns)
+            dataset_context = f"Table: {Config.TABLE_NAME}\nColumns: {column_names}"
+        else:
+            dataset_context = self.schema_description
+        prefix_parts = [
+            "You are an expert FMCG Promotion Analysis Assistant.",
+            f"DATASET CONTEXT:\n{dataset_context}",
+            "Guidelines: Use SQL_Query for aggregations/comparisons, Semantic_Search for similarity, and ML_Prediction for forecasts.",
+            "When a question needs several tools whose inputs do not depend on each other (e.g. numbers from SQL_Query and similar campaigns from Semantic_Search), call them together in the same step; they run in parallel.",
+            "CONVERSATIONS: In a conversation, earlier tool results are kept as session views named result_<n>. To refine or reuse one, name it in the tool input (e.g. SQL_Query: \"from result_1, only Region SEA, by Customer\") instead of recomputing it from the base table.",
+            "IMPORTANT: Do NOT include the generated SQL query in your final answer. Only show the results and analysis.",
+            "FORMATTING: The output will be displayed in a narrow chat window (offcanvas). Keep lines concise, use bullet points, and avoid wide tables or long paragraphs.",
+        ]
+        if self.few_shot_examples:
+            prefix_parts.append("EXAMPLES (learn the style and tool selection):\n" + self.few_shot_examples)
+        system_prompt = "\n\n".join(prefix_parts)
+        logger.info(f"Compiled system prompt for dataset version {self.dataset_version} ({len(system_prompt)} chars)")
+        return system_prompt
+
+    def _compose_input(self, question: str) -> str:
+        """Per-question user message: relevant columns (when pruned), the conversation so far and the question"""
+        if self.schema_retriever is None:
+            return f"{self._session_context()}Question: {question}"
+        return f"RELEVANT COLUMNS:\n{self._schema_context(question)}\n\n{self._session_context()}Question: {question}"
+
+    async def _acompose_input(self, question: str) -> str:
+        """_compose_input with the question embedded over the async client"""
+        if self.schema_retriever is None:
+            return f"{self._session_context()}Question: {question}"
+        embedding = await self.schema_retriever.aembed_question(question)
+        return f"RELEVANT COLUMNS:\n{self._schema_context(question, embedding)}\n\n{self._session_context()}Question: {question}"
+
+    @staticmethod
+    def _session_context() -> str:
+        """Compacted earlier turns and the result views of the current session"""
+        session = get_session()
+        if session is None:
+            return ""
+        parts = []
+        history = session.history()
+        if history:
+            parts.append(f"CONVERSATION SO FAR:\n{history}")
+        views = session.describe_views()
+        if views:
+            parts.append(f"SESSION RESULT VIEWS:\n{views}")
+        return "".join(f"{part}\n\n" for part in parts)
+
+    def _schema_context(self, question: str, embedding=None) -> str:
+        """Dataset context for the prompt, pruned to the question when a retriever is available"""
+        if self.schema_retriever is None:
+            return self.schema_description
+        try:
+            return self.schema_retriever.describe(question, embedding)
+        except Exception as e:
+            logger.warning(f"Schema retrieval failed, using full schema: {e}")
+            return self.schema_description
+
+    @staticmethod
+    def _run_config(thread_id: str) -> dict:
+        # The tracing callback records one span per graph step of the current request;
+        # max_concurrency bounds the threads that run one step's tool calls side by side
+        return {
+            "configurable": {"thread_id": thread_id},
+            "callbacks": [TracingCallback(llm=False, graph=True)],
+            "max_concurrency": Config.AGENT_MAX_PARALLEL_TOOLS,
+        }
+
+    @staticmethod
+    def _final_text(messages: list) -> str:
+        """Content of the last message when it is the planner's answer"""
+        if not messages:
+            return ""
+        final_msg = messages[-1]
+        if getattr(final_msg, "type", None) != "ai" or getattr(final_msg, "tool_calls", None):
+            return ""
+        return final_msg.content if isinstance(final_msg.content, str) else ""
+
+    def _answer_cache_applies(self) -> bool:
+        # Within a session an answer depends on the conversation, not only on the question
+        return self.answer_cache is not None and get_session() is None
+
+    def _cached_answer(self, question: str) -> tuple:
+        """(cached answer or None, question embedding)"""
+        # The retriever memoizes the embedding, so schema pruning reuses it on a miss
+        embed = self.schema_retriever.embed_question if self.schema_retriever is not None else None
+        with timed_stage("answer_cache") as span:
+            answer, embedding = self.answer_cache.lookup(question, self.dataset_version, embed)
+            if span is not None:
+                span.attributes["hit"] = answer is not None
+        return answer, embedding
+
+    async def _acached_answer(self, question: str) -> tuple:
+        aembed = self.schema_retriever.aembed_question if self.schema_retriever is not None else None
+        with timed_stage("answer_cache") as span:
+            answer, embedding = await self.answer_cache.alookup(question, self.dataset_version, aembed)
+            if span is not None:
+                span.attributes["hit"] = answer is not None
+        return answer, embedding
+
+    def _remember_answer(self, question: str, answer: str, embedding, messages: list):
+        """Cache a final answer unless one of the tools it was built on failed"""
+        if not self._answer_cache_applies() or not answer:
+            return
+        if any(getattr(m, "type", None) == "tool" and _is_tool_error(m) for m in messages):
+            logger.info("[ANSWER CACHE] Not caching an answer built on a failed tool call")
+            return
+        self.answer_cache.store(question, answer, self.dataset_version, embedding)
+
+    def _start_thread(self, thread_id: str, owner: Optional[str] = None):
+        """Register a run before its first checkpoint so only its owner can resume it"""
+        if self.threads is not None:
+            self.threads.claim(thread_id, owner)
+
+    def _finish_thread(self, thread_id: str, completed: bool = True):
+        """Drop a run's checkpoints; completed runs are kept only when configured to"""
+        if self.threads is None:
+            return
+        try:
+            self.threads.release(thread_id, keep_checkpoints=completed and Config.AGENT_CHECKPOINT_KEEP_COMPLETED)
+        except Exception as e:
+            logger.warning(f"Could not delete checkpoints for run {thread_id}: {e}")
+
+    def _flight_key(self, question: str) -> tuple:
+        return normalize_question(question), self.dataset_version
+
+    def query(self, question: str, session: Optional[Session] = None) -> dict:
+        """Execute query through the agent; concurrent identical questions share one run.
+
+        Questions in a session see its earlier turns and result views and
+        never share a run with other requests.
+        """
+        if session is not None:
+            with session_scope(session):
+                result = self._traced_query(question)
+            if not result["output"].startswith("Error: "):
+                session.add_turn(question, result["output"])
+            return dict(result, session_id=session.session_id)
+        if self.query_flights is None:
+            return self._traced_query(question)
+        result, shared = self.query_flights.do(self._flight_key(question), lambda: self._traced_query(question))
+        return dict(result, coalesced=shared)
+
+    def _traced_query(self, question: str) -> dict:
+        with start_trace(question) as trace:
+            result = self._query(question)
+        result["trace_id"] = trace.trace_id
+        status = "error" if result["output"].startswith("Error: ") else "ok"
+        result["usage"] = self._account(trace, "query", status, result.get("cached", False))
+        usage_store.record(trace, result["usage"], status, result.get("cached", False))
+        return result
+
+    @staticmethod
+    def _account(trace, mode: str, status: str, cached: bool) -> dict:
+        """Usage summary of a finished request, also counted in the process metrics"""
+        usage = usage_summary(trace)
+        agent_requests.inc(mode=mode, status=status, cached=str(cached).lower())
+        agent_steps.observe(len(trace.spans_of_kind("agent_step")), mode=mode)
+        for role, role_usage in usage["by_role"].items():
+            llm_tokens.inc(role_usage["input_tokens"] - role_usage["cached_tokens"], role=role, kind="uncached_input")
+            llm_tokens.inc(role_usage["cached_tokens"], role=role, kind="cached")
+            llm_tokens.inc(role_usage["output_tokens"], role=role, kind="output")
+            llm_cost.inc(role_usage["cost_usd"], role=role)
+        logger.info(
+            f"[USAGE] {trace.trace_id} status={status} cached={cached} llm_calls={usage['llm_calls']} "
+            f"tokens={usage['input_tokens']}/{usage['cached_tokens']}/{usage['output_tokens']} "
+            f"cost=${usage['cost_usd']:.6f} tools={usage['tools']}"
+        )
+        return usage
+
+    def _query(self, question: str) -> dict:
         logger.info(f"\n{'='*80}")
         logger.info(f"[NEW QUERY] {question}")
         logger.info(f"{'='*80}\n")
@@ -54,27 +283,32 @@ class PromotionAnalysisAgent:
         print()
 
         try:
-            reset_tool_usage()
-            # Compose context inline to steer few-shot and dataset context
-            tools_desc = "\n".join([f"{tool.name}: {tool.description}" for tool in self.tools])
-            prefix_parts = [
-                "You are an expert FMCG Promotion Analysis Assistant.",
-                f"DATASET CONTEXT:\n{self.schema_description}",
-                "You have access to the following tools:",
-                tools_desc,
-                "Guidelines: Use SQL_Query for aggregations/comparisons, Semantic_Search for similarity, and ML_Prediction for forecasts.",
-                "IMPORTANT: Do NOT include the generated SQL query in your final answer. Only show the results and analysis.",
-                "FORMATTING: The output will be displayed in a narrow chat window (offcanvas). Keep lines concise, use bullet points, and avoid wide tables or long paragraphs.",
-            ]
-            if self.few_shot_examples:
-                prefix_parts.append("EXAMPLES (learn the style and tool selection):\n" + self.few_shot_examples)
-            composed_input = "\n\n".join(prefix_parts) + f"\n\nQuestion: {question}"
-
-            graph_result = self.agent.invoke({
-                "messages": [
-                    {"role": "user", "content": composed_input}
-                ]
-            })
+            question_embedding = None
+            if self._answer_cache_applies():
+                cached_answer, question_embedding = self._cached_answer(question)
+                if cached_answer is not None:
+                    print(f"{'='*80}")
+                    print("✅ FINAL ANSWER (cached)")
+                    print(f"{'='*80}")
+                    print(f"{cached_answer}\n")
+                    return {"output": cached_answer, "intermediate_steps": [], "cached": True}
+
+            # Static context lives in the system message; only per-question context goes here
+            composed_input = self._compose_input(question)
+
+            thread_id = uuid.uuid4().hex
+            self._start_thread(thread_id)
+            # Synchronous runs never hand out their thread_id, so a failed one cannot be resumed
+            completed = False
+            try:
+                graph_result = self.agent.invoke({
+                    "messages": [
+                        {"role": "user", "content": composed_input}
+                    ]
+                }, self._run_config(thread_id))
+                completed = True
+            finally:
+                self._finish_thread(thread_id, completed)
 
             # Extract final text from LangGraph result
             final_output = None
@@ -86,7 +320,10 @@ class PromotionAnalysisAgent:
                     final_output = getattr(final_msg, "content", None) or final_msg.get("content")
             except Exception:
                 pass
-            if not final_output:
+            model_routing_telemetry.record_outcome("planner", bool(final_output))
+            if final_output:
+                self._remember_answer(question, final_output, question_embedding, messages)
+            else:
                 final_output = str(graph_result)
 
             QueryLogger.log_agent_action(action=question, observation=final_output)
@@ -108,9 +345,10 @@ class PromotionAnalysisAgent:
             print(f"{final_output}\n")
             print(f"[TOOL USAGE] {tool_usage_message}\n")
 
-            return {"output": final_output, "intermediate_steps": []}
+            return {"output": final_output, "intermediate_steps": [], "cached": False}
             
         except Exception as e:
+            model_routing_telemetry.record_outcome("planner", False)
             error_msg = f"Agent execution error: {str(e)}"
             logger.error(error_msg)
             print(f"\n{'='*80}")
@@ -142,147 +380,224 @@ class PromotionAnalysisAgent:
         
         return tool_usage
     
-    async def query_stream(self, question: str) -> AsyncIterator[Dict[str, Any]]:
-        """Execute query through the agent with streaming support"""
+    async def query_stream(self, question: str, resume_thread_id: Optional[str] = None,
+                           session: Optional[Session] = None, owner: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Execute query through the agent, streaming answer tokens as they are generated.
+
+        Yields {"type": "run"} with the run's thread_id, {"type": "status"}
+        when the planner picks a tool, {"type": "content"} deltas for each
+        answer token, {"type": "reset"} when text already streamed turns out
+        to precede a tool call and must be discarded, and a final
+        {"type": "done"} with the full text and time-to-first-token. Passing the thread_id back as resume_thread_id
+        continues an interrupted run from its last completed step; only the
+        owner that started it (the session, or the caller identity passed as
+        owner) can resume it, until Config.AGENT_CHECKPOINT_TTL_SECONDS. A
+        {"type": "trace"} event with the request's timing breakdown
+        precedes "done". Answer cache hits skip the run: the cached answer
+        is replayed as one "content" event and "done" carries cached=True.
+        "done" and "error" carry the request's LLM token, cost and time usage.
+        Concurrent identical questions subscribe to one shared run and
+        each receive all of its events, except within a session, whose
+        answers depend on the conversation; "done" then carries session_id.
+        """
+        if session is not None:
+            events = self._session_stream(question, resume_thread_id, session, owner or f"session:{session.session_id}")
+        elif resume_thread_id or self.stream_flights is None:
+            events = self._traced_stream(question, resume_thread_id, owner)
+        else:
+            events = self.stream_flights.subscribe(self._flight_key(question), lambda: self._traced_stream(question, owner=owner))
+        async for event in events:
+            yield event
+
+    async def _session_stream(self, question: str, resume_thread_id: Optional[str], session: Session,
+                              owner: Optional[str]) -> AsyncIterator[Dict[str, Any]]:
+        with session_scope(session):
+            async for event in self._traced_stream(question, resume_thread_id, owner):
+                if event["type"] == "done":
+                    session.add_turn(question, event["content"])
+                    event["session_id"] = session.session_id
+                yield event
+
+    async def _traced_stream(self, question: str, resume_thread_id: Optional[str] = None,
+                             owner: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        with start_trace(question) as trace:
+            async for event in self._query_stream(question, resume_thread_id, owner):
+                if event["type"] == "run":
+                    event["trace_id"] = trace.trace_id
+                elif event["type"] == "done":
+                    breakdown = trace.breakdown()
+                    yield {
+                        "type": "trace",
+                        "trace_id": trace.trace_id,
+                        "stages": breakdown["stages"],
+                        "llm_tokens": breakdown["llm_tokens"]
+                    }
+                if event["type"] in ("done", "error"):
+                    status = "ok" if event["type"] == "done" else "error"
+                    cached = event.get("cached", False)
+                    event["usage"] = self._account(trace, "stream", status, cached)
+                    # Written off the event loop without delaying the final event
+                    asyncio.get_running_loop().run_in_executor(
+                        None, functools.partial(
+                            usage_store.record, trace, event["usage"], status, cached,
+                            total_ms=event.get("total_ms"), ttft_ms=event.get("ttft_ms"),
+                        )
+                    )
+                yield event
+
+    async def _query_stream(self, question: str, resume_thread_id: Optional[str] = None,
+                            owner: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
         logger.info(f"\n{'='*80}")
         logger.info(f"[NEW QUERY] {question}")
         logger.info(f"{'='*80}\n")
         
-        import asyncio
-        
+        thread_id = resume_thread_id or uuid.uuid4().hex
+        config = self._run_config(thread_id)
         try:
-            reset_tool_usage()
-            
-            # Compose context inline to steer few-shot and dataset context
-            tools_desc = "\n".join([f"{tool.name}: {tool.description}" for tool in self.tools])
-            prefix_parts = [
-                "You are an expert FMCG Promotion Analysis Assistant.",
-                f"DATASET CONTEXT:\n{self.schema_description}",
-                "You have access to the following tools:",
-                tools_desc,
-                "Guidelines: Use SQL_Query for aggregations/comparisons, Semantic_Search for similarity, and ML_Prediction for forecasts.",
-                "IMPORTANT: Do NOT include the generated SQL query in your final answer. Only show the results and analysis.",
-                "FORMATTING: The output will be displayed in a narrow chat window (offcanvas). Keep lines concise, use bullet points, and avoid wide tables or long paragraphs.",
-            ]
-            if self.few_shot_examples:
-                prefix_parts.append("EXAMPLES (learn the style and tool selection):\n" + self.few_shot_examples)
-            composed_input = "\n\n".join(prefix_parts) + f"\n\nQuestion: {question}"
-            
-            # Map tool status to user-friendly messages
-            status_messages = {
-                "SQL TOOL USED": "Converting natural language to SQL...",
-                "RAG TOOL USED": "Semantic search in progress...",
-                "ML TOOL USED": "Running appropriate algorithm and statistical analysis to perform the prediction..."
-            }
+            start = time.perf_counter()
+            first_token_at = None
+            accumulated_text = ""
+            question_embedding = None
+            tool_messages = []
             
-            # Track last tool status
-            last_tool_status = None
+            if not resume_thread_id and self._answer_cache_applies():
+                cached_answer, question_embedding = await self._acached_answer(question)
+                if cached_answer is not None:
+                    # Replayed at once: the whole answer is the first token
+                    total = time.perf_counter() - start
+                    record_stage("time_to_first_token", total)
+                    QueryLogger.log_agent_action(action=question, observation=cached_answer)
+                    yield {
+                        "type": "content",
+                        "content": cached_answer
+                    }
+                    yield {
+                        "type": "done",
+                        "content": cached_answer,
+                        "ttft_ms": round(total * 1000, 1),
+                        "total_ms": round(total * 1000, 1),
+                        "thread_id": None,
+                        "cached": True
+                    }
+                    return
             
-            # Monitor tool usage while agent runs
-            async def monitor_status():
-                nonlocal last_tool_status
-                while True:
-                    await asyncio.sleep(0.2)  # Check every 200ms
-                    current_status = get_tool_usage_status()
-                    if current_status != last_tool_status and current_status != "INCUBATOR RESPONSE (NO TOOL USED)":
-                        last_tool_status = current_status
-                        status_msg = status_messages.get(current_status, "Processing...")
-                        yield {
-                            "type": "status",
-                            "message": status_msg
-                        }
+            if resume_thread_id and self.checkpointer is not None:
+                # Runs of other callers look exactly like missing ones
+                if not await asyncio.to_thread(self.threads.owns, thread_id, owner):
+                    raise ValueError(f"No checkpointed run {resume_thread_id} to resume")
+                state = await self.agent.aget_state(config)
+                if not state.values:
+                    raise ValueError(f"No checkpointed run {resume_thread_id} to resume")
+                await asyncio.to_thread(self._start_thread, thread_id, owner)
+                # None resumes from the last checkpoint instead of starting over
+                graph_input = None
+                logger.info(f"[STREAM] Resuming run {thread_id} at {state.next or 'end'}")
+            else:
+                # Static context lives in the system message; only per-question context goes here
+                composed_input = await self._acompose_input(question)
+                graph_input = {"messages": [{"role": "user", "content": composed_input}]}
+                await asyncio.to_thread(self._start_thread, thread_id, owner)
             
-            # Run agent in background and monitor status
-            accumulated_text = ""
+            # Sent first so a client that disconnects mid-run can still resume it
+            yield {
+                "type": "run",
+                "thread_id": thread_id
+            }
             
-            # Stream from agent
-            async for event in self.agent.astream({
-                "messages": [
-                    {"role": "user", "content": composed_input}
-                ]
-            }):
-                # Check tool status
-                current_status = get_tool_usage_status()
-                if current_status != last_tool_status and current_status != "INCUBATOR RESPONSE (NO TOOL USED)":
-                    last_tool_status = current_status
-                    status_msg = status_messages.get(current_status, "Processing...")
+            # "messages" yields LLM tokens as they arrive, "updates" yields each finished node
+            async for mode, chunk in self.agent.astream(
+                graph_input,
+                config,
+                stream_mode=["messages", "updates"],
+            ):
+                if mode == "messages":
+                    message, metadata = chunk
+                    # Only the planner's tokens are the answer; LLM calls inside tools also stream here
+                    if metadata.get("langgraph_node") != "agent" or not isinstance(message, AIMessageChunk):
+                        continue
+                    if message.tool_call_chunks and accumulated_text:
+                        # Text ahead of a tool call is planning, not the answer: take it back
+                        accumulated_text, first_token_at = "", None
+                        yield {"type": "reset"}
+                    if message.tool_call_chunks or not isinstance(message.content, str) or not message.content:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        logger.info(f"[STREAM] First token after {first_token_at - start:.3f}s")
+                    accumulated_text += message.content
                     yield {
-                        "type": "status",
-                        "message": status_msg
+                        "type": "content",
+                        "content": message.content
                     }
+                    continue
                 
-                # Process event for content
-                for node_name, node_output in event.items():
-                    if isinstance(node_output, dict):
-                        if "messages" in node_output:
-                            for msg in node_output["messages"]:
-                                # Check for tool calls
-                                if hasattr(msg, "tool_calls") and msg.tool_calls:
-                                    for tool_call in msg.tool_calls:
-                                        tool_name = tool_call.get("name", "") if isinstance(tool_call, dict) else getattr(tool_call, "name", "")
-                                        tool_status_map = {
-                                            "SQL_Query": "Converting natural language to SQL...",
-                                            "Semantic_Search": "Semantic search in progress...",
-                                            "ML_Prediction": "Running appropriate algorithm and statistical analysis to perform the prediction..."
-                                        }
-                                        status_msg = tool_status_map.get(tool_name, "Processing...")
-                                        yield {
-                                            "type": "status",
-                                            "message": status_msg
-                                        }
-                                
-                                # Extract content ONLY from AI messages, not tool responses
-                                # Check if this is an AI message (not a tool message)
-                                msg_type = getattr(msg, "type", None) or (msg.get("type") if isinstance(msg, dict) else None)
-                                
-                                # Only process if it's an AI message or if type is not set (assume AI)
-                                is_tool_message = msg_type == "tool" or (hasattr(msg, "name") and msg.name)
-                                
-                                if not is_tool_message and hasattr(msg, "content") and msg.content:
-                                    content = str(msg.content)
-                                    # Skip empty content or tool output patterns
-                                    if content and content != accumulated_text and not content.startswith("Results ("):
-                                        new_content = content[len(accumulated_text):] if accumulated_text else content
-                                        accumulated_text = content
-                                        if new_content:
-                                            yield {
-                                                "type": "content",
-                                                "content": new_content
-                                            }
-            
-            # Ensure we have final output
-            if not accumulated_text:
-                # Get final result synchronously as fallback
-                final_result = self.agent.invoke({
-                    "messages": [{"role": "user", "content": composed_input}]
-                })
-                if isinstance(final_result, dict) and "messages" in final_result:
-                    messages = final_result["messages"]
-                    if messages:
-                        final_msg = messages[-1]
-                        accumulated_text = getattr(final_msg, "content", None) or final_msg.get("content", "")
-                        if accumulated_text:
+                for node_name, node_output in chunk.items():
+                    if node_name == "tools" and isinstance(node_output, dict):
+                        tool_messages.extend(node_output.get("messages", []))
+                    if node_name != "agent" or not isinstance(node_output, dict):
+                        continue
+                    for msg in node_output.get("messages", []):
+                        if getattr(msg, "tool_calls", None) and accumulated_text:
+                            accumulated_text, first_token_at = "", None
+                            yield {"type": "reset"}
+                        for tool_call in getattr(msg, "tool_calls", None) or []:
+                            yield {
+                                "type": "status",
+                                "message": TOOL_STATUS_MESSAGES.get(tool_call.get("name", ""), "Processing...")
+                            }
+                        # Models that do not stream deliver the answer only as a finished message
+                        if not accumulated_text and not getattr(msg, "tool_calls", None) and isinstance(msg.content, str) and msg.content:
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                            accumulated_text = msg.content
                             yield {
                                 "type": "content",
                                 "content": accumulated_text
                             }
             
+            # Nothing streamed (e.g. a resumed run that had already answered): read the
+            # final state from the checkpoint instead of running the graph again
+            if not accumulated_text and self.checkpointer is not None:
+                state = await self.agent.aget_state(config)
+                accumulated_text = self._final_text(state.values.get("messages", []))
+                if accumulated_text:
+                    yield {
+                        "type": "content",
+                        "content": accumulated_text
+                    }
+            model_routing_telemetry.record_outcome("planner", bool(accumulated_text))
+            await asyncio.to_thread(self._finish_thread, thread_id)
+            if not resume_thread_id:
+                self._remember_answer(question, accumulated_text, question_embedding, tool_messages)
+            
             QueryLogger.log_agent_action(action=question, observation=accumulated_text)
             
+            total = time.perf_counter() - start
+            ttft = (first_token_at - start) if first_token_at is not None else None
+            if ttft is not None:
+                record_stage("time_to_first_token", ttft)
+            logger.info(f"[STREAM] Completed in {total:.3f}s (time to first token: {ttft if ttft is None else round(ttft, 3)}s)")
+            
             # Final completion
             yield {
                 "type": "done",
-                "content": accumulated_text
+                "content": accumulated_text,
+                "ttft_ms": None if ttft is None else round(ttft * 1000, 1),
+                "total_ms": round(total * 1000, 1),
+                "thread_id": thread_id,
+                "cached": False
             }
             
         except Exception as e:
+            model_routing_telemetry.record_outcome("planner", False)
             error_msg = f"Agent execution error: {str(e)}"
             logger.error(error_msg)
             yield {
                 "type": "error",
-                "message": error_msg
+                "message": error_msg,
+                # Checkpoints up to the failure are kept until they expire; the owner can resume with this id
+                "thread_id": thread_id if self.checkpointer is not None else None
             }
 
-
 if __name__ == "__main__":
     pass
\ No newline at end of file
@@ -7,11 +7,23 @@ from main import PromotionAnalysisSystem
 import os
 import json
 import asyncio
+from datetime import date
+from typing import Optional
 
 from adls_manager import ADLSManager
-from fastapi import FastAPI, Depends
+from utils import (
+    InstrumentedExecutor, cancellation_scope, dataframe_to_records, model_routing_telemetry,
+    prompt_cache_telemetry, run_blocking, run_in_executor,
+)
+from metrics import MetricsMiddleware, metrics
+from tracing import trace_store
+from usage import usage_store
+from config import Config
+from query_cache import result_cache, result_store
+from fastapi import FastAPI, Depends, Query, Request
 from fastapi import HTTPException
-from app.auth import router as auth_router
+from app.auth import ALGORITHM, SECRET_KEY, router as auth_router
+from jose import JWTError, jwt
 from app.database import engine
 from app import models
 
@@ -22,6 +34,8 @@ app = FastAPI()
 
 app.include_router(auth_router)
 
+app.add_middleware(MetricsMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -36,6 +50,8 @@ app.add_middleware(
 
 class QueryRequest(BaseModel):
     question: str
+    resume_thread_id: Optional[str] = None  # Continue an interrupted /query/stream run (same caller or session only)
+    session_id: Optional[str] = None  # Ask as the next turn of a conversation from POST /sessions
 
 system = None
 current_csv_path = None
@@ -87,8 +103,17 @@ async def manual_sync_trigger():
             print(f"Manual Sync: New file detected: {current_csv_path}. Rebuilding system...")
             
             # Re-initialize system with force_rebuild=True
-            system = PromotionAnalysisSystem(current_csv_path, force_rebuild=True)
+            old_sessions = system.sessions if system else None
+            system = PromotionAnalysisSystem(
+                current_csv_path,
+                force_rebuild=True,
+                sql_cache=system.sql_cache if system else None,
+                answer_cache=system.answer_cache if system else None,
+            )
             system.initialize()
+            # Session views were built on the previous data
+            if old_sessions is not None:
+                old_sessions.close()
             
             return {"status": "success", "message": "New file detected and system rebuilt.", "file": current_csv_path}
         else:
@@ -97,26 +122,190 @@ async def manual_sync_trigger():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Synchronous /query agent runs; owned here so its backlog can be observed
+query_executor = InstrumentedExecutor(max_workers=Config.QUERY_EXECUTOR_WORKERS, thread_name_prefix="query")
+
+def _shared_runs_in_flight():
+    agent = system.agent if system is not None else None
+    if agent is None:
+        return None
+    flights = {("query",): agent.query_flights, ("stream",): agent.stream_flights}
+    return {mode: f.stats()["in_flight"] for mode, f in flights.items() if f is not None}
+
+def _cache_entries():
+    if system is None:
+        return None
+    caches = {"result": result_cache, "answer": system.answer_cache, "sql": system.sql_cache}
+    return {(name,): cache.stats()["entries"] for name, cache in caches.items() if cache is not None}
+
+metrics.gauge("query_executor_queue_depth", "/query requests waiting for a query worker", lambda: query_executor.queued)
+metrics.gauge("shared_runs_in_flight", "Coalesced agent runs currently executing, by mode", _shared_runs_in_flight, labels=("mode",))
+metrics.gauge("cache_entries", "Entries held per cache", _cache_entries, labels=("cache",))
+metrics.gauge(
+    "sessions_active", "Live conversation sessions",
+    lambda: system.sessions.stats()["sessions"] if system is not None and system.sessions is not None else None,
+)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Counters, histograms and gauges of every pipeline stage in the Prometheus text format"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/admin/prompt-cache")
+async def prompt_cache_stats():
+    """Cached vs. uncached prompt tokens across all LLM calls since startup"""
+    return prompt_cache_telemetry.snapshot()
+
+@app.get("/admin/answer-cache")
+async def answer_cache_stats():
+    """Entries and hit/miss counts of the final-answer cache"""
+    if system is None or system.answer_cache is None:
+        raise HTTPException(status_code=503, detail="System not initialized")
+    return system.answer_cache.stats()
+
+@app.delete("/admin/answer-cache")
+async def clear_answer_cache():
+    """Forget all cached answers, e.g. after fixing a tool or prompt"""
+    if system is None or system.answer_cache is None:
+        raise HTTPException(status_code=503, detail="System not initialized")
+    system.answer_cache.clear()
+    return {"status": "success"}
+
+@app.get("/admin/coalescing")
+async def coalescing_stats():
+    """In-flight shared runs and how many requests attached to one instead of starting their own"""
+    if system is None or system.agent is None:
+        raise HTTPException(status_code=503, detail="System not initialized")
+    agent = system.agent
+    return {
+        "query": agent.query_flights.stats() if agent.query_flights else None,
+        "stream": agent.stream_flights.stats() if agent.stream_flights else None,
+    }
+
+@app.get("/admin/traces")
+async def list_traces(limit: int = 50):
+    """Most recent request traces, newest first"""
+    return {"traces": trace_store.recent(max(1, min(limit, Config.TRACE_MAX_STORED)))}
+
+@app.get("/admin/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """All spans of one request as JSON, with its per-stage timing breakdown"""
+    trace = trace_store.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired trace_id")
+    return trace.to_dict()
+
+@app.get("/admin/usage")
+async def usage_report(group_by: str = "question_type", limit: int = 20):
+    """Requests, tokens, cost and latency percentiles per question type, status, cache hit or day"""
+    try:
+        groups = await asyncio.to_thread(usage_store.summary, group_by, max(1, min(limit, 500)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"group_by": group_by, "groups": groups}
+
+@app.get("/admin/model-routing")
+async def model_routing_stats():
+    """Model and endpoint per LLM role with call latency, errors and task accuracy since startup"""
+    return model_routing_telemetry.snapshot()
+
+def _resolve_session(session_id: Optional[str]):
+    if session_id is None:
+        return None
+    if system is None or system.sessions is None:
+        raise HTTPException(status_code=404, detail="Sessions are disabled")
+    session = system.sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return session
+
+def _caller(http_request: Request, session) -> str:
+    """Identity that owns a streamed run: its session, else the signed-in user, else the client address"""
+    if session is not None:
+        return f"session:{session.session_id}"
+    scheme, _, token = http_request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            email = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+            if email:
+                return f"user:{email}"
+        except JWTError:
+            pass
+    return f"client:{http_request.client.host if http_request.client else 'unknown'}"
+
+@app.post("/sessions")
+async def create_session():
+    """Start a conversation; pass its session_id to /query or /query/stream for follow-up questions"""
+    if system is None or system.sessions is None:
+        raise HTTPException(status_code=404, detail="Sessions are disabled")
+    return {"session_id": system.sessions.create().session_id, "ttl_seconds": system.sessions.ttl}
+
+@app.get("/sessions/{session_id}")
+async def get_session_state(session_id: str):
+    """Turns of a conversation and the result views its follow-up questions can refer to"""
+    return _resolve_session(session_id).to_dict()
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if system is None or system.sessions is None or not system.sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return {"status": "deleted"}
+
 @app.post("/query")
-async def ask_agent(request: QueryRequest):
-    result = system.query(request.question)
-    return {"answer": result["output"]}
+async def ask_agent(request: QueryRequest, http_request: Request):
+    session = _resolve_session(request.session_id)
+
+    def run_query():
+        with cancellation_scope() as scope:
+            scopes.append(scope)
+            return system.query(request.question, session=session)
+
+    # Run the agent off the event loop so one slow query does not block the server
+    scopes = []
+    task = asyncio.ensure_future(run_in_executor(query_executor, run_query))
+    while not task.done():
+        await asyncio.wait({task}, timeout=0.5)
+        if not task.done() and await http_request.is_disconnected():
+            for scope in scopes:
+                scope.cancel()
+            break
+    result = await task
+    return {
+        "answer": result["output"],
+        "trace_id": result.get("trace_id"),
+        "cached": result.get("cached", False),
+        "coalesced": result.get("coalesced", False),
+        "usage": result.get("usage"),
+        "session_id": result.get("session_id"),
+    }
 
 @app.post("/query/stream")
-async def ask_agent_stream(request: QueryRequest):
+async def ask_agent_stream(request: QueryRequest, http_request: Request):
     """Streaming endpoint for real-time responses"""
+    session = _resolve_session(request.session_id)
+    owner = _caller(http_request, session)
+
     async def generate():
-        try:
-            async for event in system.agent.query_stream(request.question):
-                # Format as Server-Sent Events
-                data = json.dumps(event)
-                yield f"data: {data}\n\n"
-        except Exception as e:
-            error_event = {
-                "type": "error",
-                "message": str(e)
-            }
-            yield f"data: {json.dumps(error_event)}\n\n"
+        completed = False
+        with cancellation_scope() as scope:
+            try:
+                async for event in system.agent.query_stream(
+                    request.question, request.resume_thread_id, session=session, owner=owner
+                ):
+                    # Format as Server-Sent Events
+                    data = json.dumps(event)
+                    yield f"data: {data}\n\n"
+                completed = True
+            except Exception as e:
+                error_event = {
+                    "type": "error",
+                    "message": str(e)
+                }
+                yield f"data: {json.dumps(error_event)}\n\n"
+            finally:
+                if not completed:
+                    # Client disconnected (generator closed/cancelled): stop running queries
+                    scope.cancel()
     
     return StreamingResponse(
         generate(),
@@ -128,6 +317,69 @@ async def ask_agent_stream(request: QueryRequest):
         }
     )
 
+@app.get("/api/timeline")
+async def get_timeline(
+    start: date,
+    end: date,
+    bucket: Optional[str] = None,
+    region: Optional[str] = None,
+    status: Optional[str] = None,
+    year: Optional[int] = None,
+    rag: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=Config.TIMELINE_LIMIT_MAX),
+):
+    """Promotion bars active between start and end, optionally bucketed for zoomed-out views"""
+    if not system or not system.timeline:
+        raise HTTPException(status_code=503, detail="Timeline index not initialized")
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+
+    filters = {
+        "Region": region,
+        "Promotion_Status": status,
+        "Promo_Year": year,
+        "Actual_RAG": rag,
+    }
+    try:
+        # DuckDB queries run off the event loop
+        if bucket:
+            return await run_blocking(system.timeline.query_buckets, start, end, bucket, filters)
+        return await run_blocking(system.timeline.query_active, start, end, filters, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/facets")
+async def get_facets(request: Request):
+    """Distinct values with counts per categorical column, narrowed by the current selection.
+
+    Selection is passed as repeated query parameters named after columns,
+    e.g. /api/facets?Region=SEA&Region=Europe&Promo_Year=2024
+    """
+    if not system or not system.facets:
+        raise HTTPException(status_code=503, detail="Facet catalog not initialized")
+
+    selection = {}
+    for key, value in request.query_params.multi_items():
+        selection.setdefault(key, []).append(value)
+    # Filtered facets query DuckDB off the event loop
+    return await run_blocking(system.facets.get, selection)
+
+@app.get("/api/results/{result_id}")
+async def get_result(result_id: str, offset: int = 0, limit: int = 500):
+    """Page through a full SQL result that was summarized for the agent"""
+    entry = result_store.get(result_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+    table = entry.table
+    page = table.slice(max(offset, 0), max(min(limit, 5000), 0)).to_pandas()
+    return {
+        "result_id": result_id,
+        "sql": entry.sql,
+        "total": table.num_rows,
+        "offset": offset,
+        "rows": dataframe_to_records(page),
+    }
+
 @app.get("/data/csv")
 async def get_csv_data():
     """Serve the promotion CSV data for frontend visualizations"""
@@ -152,7 +404,7 @@ if os.getenv("ENVIRONMENT") == "production":
         async def serve_spa(full_path: str):
             # API routes are handled automatically before this catch-all
             # This check is technically redundant if defined last, but good for safety
-            if full_path.startswith("api/") or full_path.startswith("query") or full_path.startswith("admin/") or full_path.startswith("data/"):
+            if full_path.startswith("api/") or full_path.startswith("query") or full_path.startswith("admin/") or full_path.startswith("data/") or full_path.startswith("sessions") or full_path == "metrics":
                 raise HTTPException(status_code=404, detail="Not Found")
             
             # Serve static files if they exist directly (e.g., assets)
@@ -0,0 +1,250 @@
+"""
+Deterministic OpenAI-compatible stub server (chat completions and embeddings) for offline benchmarks
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+import numpy as np
+
+
+def _hash_embedding(tokens: List, dimensions: int) -> List[float]:
+    """Bag-of-tokens hashed into a fixed-size unit vector, so similar texts score similarly"""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for token in tokens:
+        digest = hashlib.md5(str(token).encode()).digest()
+        index = int.from_bytes(digest[:4], "little") % dimensions
+        vector[index] += 1.0 if digest[4] % 2 else -1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def _message_text(message: Dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+class StubLLM:
+    """Scripted responses keyed on the benchmark corpus.
+
+    - Agent turns (requests with tools): the first turn calls the corpus
+      entry's tool with its tool_input (or every call listed in its
+      tool_calls, in one turn); once tool results are present the stub
+      answers with a short summary of them.
+    - SQL prompts return the entry's scripted SQL, scenario extraction
+      prompts return its scenario, anything else gets a fixed analysis text.
+    """
+
+    def __init__(self, corpus: List[Dict], chat_latency: float = 0.0, embedding_latency: float = 0.0,
+                 per_token_latency: float = 0.0, dimensions: int = 256):
+        self.corpus = corpus
+        self.chat_latency = chat_latency
+        self.embedding_latency = embedding_latency
+        self.per_token_latency = per_token_latency
+        self.dimensions = dimensions
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _calls(entry: Dict) -> List[Dict]:
+        if entry.get("tool_calls"):
+            return entry["tool_calls"]
+        return [{"tool": entry["tool"], "tool_input": entry["tool_input"]}] if entry.get("tool") else []
+
+    def _entry_for(self, text: str) -> Optional[Dict]:
+        for entry in self.corpus:
+            if entry["question"] in text or any(call["tool_input"] in text for call in self._calls(entry)):
+                return entry
+        return None
+
+    def chat(self, body: Dict) -> Dict:
+        """Return an assistant message dict: {"content": ..., "tool_calls": [...]}"""
+        messages = body.get("messages", [])
+        last = messages[-1] if messages else {}
+        prompt = "\n".join(_message_text(m) for m in messages)
+
+        if body.get("tools"):
+            if last.get("role") == "tool":
+                results = []
+                for message in reversed(messages):
+                    if message.get("role") != "tool":
+                        break
+                    results.append(_message_text(message)[:300])
+                return {"content": "Summary of the findings: " + " | ".join(reversed(results))}
+            entry = self._entry_for(_message_text(last))
+            calls = self._calls(entry) if entry is not None else []
+            if not calls:
+                return {"content": "I can answer that without looking up data."}
+            with self._lock:
+                call_id = f"call_{self.requests}"
+            return {
+                "content": "",
+                "tool_calls": [{
+                    "id": f"{call_id}_{i}",
+                    "type": "function",
+                    "function": {"name": call["tool"], "arguments": json.dumps({"__arg1": call["tool_input"]})},
+                } for i, call in enumerate(calls)],
+            }
+
+        entry = self._entry_for(prompt)
+        if "You are a SQL expert" in prompt:
+            return {"content": (entry or {}).get("sql", "SELECT COUNT(*) AS row_count FROM promotions")}
+        if "Extract the scenario parameters" in prompt:
+            return {"content": (entry or {}).get("scenario", "Region=SEA")}
+        return {"content": "Analysis: the retrieved promotions show stable uplift with a few outliers."}
+
+    def embed(self, inputs) -> List[List[float]]:
+        if isinstance(inputs, (str, int)) or (isinstance(inputs, list) and inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        vectors = []
+        for item in inputs:
+            tokens = item.lower().split() if isinstance(item, str) else item
+            vectors.append(_hash_embedding(tokens, self.dimensions))
+        return vectors
+
+
+class _Handler(BaseHTTPRequestHandler):
+    stub: StubLLM = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: Dict, status: int = 200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        with self.stub._lock:
+            self.stub.requests += 1
+            request_id = self.stub.requests
+
+        if self.path.rstrip("/").endswith("/embeddings"):
+            time.sleep(self.stub.embedding_latency)
+            vectors = self.stub.embed(body.get("input", []))
+            self._send_json({
+                "object": "list",
+                "model": body.get("model", "stub-embedding"),
+                "data": [{"object": "embedding", "index": i, "embedding": v} for i, v in enumerate(vectors)],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            })
+            return
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+            return
+
+        message = self.stub.chat(body)
+        content = message.get("content") or ""
+        tool_calls = message.get("tool_calls")
+        prompt_tokens = sum(len(_message_text(m)) // 4 for m in body.get("messages", []))
+        completion_tokens = max(1, len(content) // 4)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        finish_reason = "tool_calls" if tool_calls else "stop"
+        created = int(time.time())
+        model = body.get("model", "stub-chat")
+
+        time.sleep(self.stub.chat_latency)
+        if not body.get("stream"):
+            time.sleep(self.stub.per_token_latency * completion_tokens)
+            reply = {"role": "assistant", "content": content}
+            if tool_calls:
+                reply["tool_calls"] = tool_calls
+            self._send_json({
+                "id": f"chatcmpl-stub-{request_id}",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": reply, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+            return
+
+        # Server-sent events, one chunk per word so token streaming can be measured
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        def send(delta: Dict, finish: Optional[str] = None, extra: Optional[Dict] = None):
+            chunk = {
+                "id": f"chatcmpl-stub-{request_id}",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            if extra:
+                chunk.update(extra)
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+
+        send({"role": "assistant", "content": ""})
+        if tool_calls:
+            send({"tool_calls": [dict(call, index=i) for i, call in enumerate(tool_calls)]})
+        for i, word in enumerate(content.split(" ")):
+            time.sleep(self.stub.per_token_latency)
+            send({"content": word if i == 0 else " " + word})
+        send({}, finish=finish_reason)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self.wfile.write(f"data: {json.dumps({'id': f'chatcmpl-stub-{request_id}', 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': [], 'usage': usage})}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class StubLLMServer:
+    """Runs StubLLM behind a local HTTP server exposing /v1/chat/completions and /v1/embeddings"""
+
+    def __init__(self, stub: StubLLM, host: str = "127.0.0.1", port: int = 0):
+        handler = type("StubHandler", (_Handler,), {"stub": stub})
+        self.stub = stub
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubLLMServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the deterministic LLM stub")
+    parser.add_argument("--corpus", default="benchmark/corpus.json")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--chat-latency", type=float, default=0.0)
+    parser.add_argument("--embedding-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        corpus = json.load(f)["questions"]
+    server = StubLLMServer(StubLLM(corpus, args.chat_latency, args.embedding_latency), port=args.port).start()
+    print(f"LLM stub listening on {server.url} (set OPENAI_BASE_URL to this)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
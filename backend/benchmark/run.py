@@ -0,0 +1,234 @@
+"""
+Offline per-stage latency benchmark for the agent pipeline against the local LLM stub
+
+Usage (from backend/):
+    python -m benchmark.run                       # compare against benchmark/baseline.json
+    python -m benchmark.run --update-baseline     # record a new baseline
+    python -m benchmark.run --chat-latency 0.2    # inject model latency
+    python -m benchmark.run --stream --token-latency 0.02   # token streaming, reports time to first token
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from config import Config
+from utils import collect_stage_timings, model_routing_telemetry, record_stage
+from benchmark.llm_stub import StubLLM, StubLLMServer
+from benchmark.synthetic_data import write_csv
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS = os.path.join(HERE, "corpus.json")
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+
+STAGE_ORDER = [
+    "total", "time_to_first_token", "agent_planning", "sql_generation", "duckdb_execution",
+    "embedding", "faiss_search", "interpretation", "scenario_extraction", "ml_analysis",
+]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def _configure(workdir: str, base_url: str):
+    """Point the system at the stub and a scratch database; disable cross-question caches"""
+    Config.OPENAI_API_KEY = "benchmark-stub"
+    Config.OPENAI_BASE_URL = base_url
+    Config.DUCKDB_PATH = os.path.join(workdir, "benchmark.duckdb")
+    Config.FAISS_INDEX_PATH = os.path.join(workdir, "faiss_index")
+    Config.SQL_TEMP_DIRECTORY = os.path.join(workdir, "duckdb_tmp")
+    Config.LOG_FILE = os.path.join(workdir, "agent_logs.txt")
+    Config.AGENT_CHECKPOINT_PATH = os.path.join(workdir, "agent_checkpoints.sqlite")
+    Config.USAGE_DB_PATH = os.path.join(workdir, "usage.duckdb")
+    Config.SQL_CACHE_ENABLED = False
+    Config.RESULT_CACHE_ENABLED = False
+    Config.ML_CACHE_ENABLED = False
+    Config.ANSWER_CACHE_ENABLED = False
+    # Only the local stub is reachable; ADLS is never touched
+    Config.AZURE_STORAGE_ACCOUNT_NAME = Config.AZURE_STORAGE_ACCOUNT_KEY = Config.AZURE_STORAGE_CONTAINER_NAME = ""
+
+
+def _collect(samples: Dict[str, List[float]], timings: list):
+    # Sum repeated calls (e.g. planning before and after the tool) per question
+    per_question: Dict[str, float] = defaultdict(float)
+    for stage, seconds in timings:
+        per_question[stage] += seconds
+    for stage, seconds in per_question.items():
+        samples[stage].append(seconds * 1000)
+
+
+async def _run_streaming(system, corpus: List[Dict], repeat: int, samples: Dict[str, List[float]]):
+    """One event loop for the whole run: the shared async HTTP client is bound to it"""
+    for _ in range(repeat):
+        for entry in corpus:
+            with collect_stage_timings() as timings:
+                start = time.perf_counter()
+                async for _event in system.agent.query_stream(entry["question"]):
+                    pass
+                record_stage("total", time.perf_counter() - start)
+            _collect(samples, timings)
+
+
+def run_benchmark(corpus: List[Dict], repeat: int, chat_latency: float, embedding_latency: float,
+                  rows: int, verbose: bool = False, stream: bool = False,
+                  token_latency: float = 0.0) -> Dict[str, Dict[str, float]]:
+    """Run the corpus through PromotionAnalysisSystem and return per-stage p50/p95 in milliseconds"""
+    stub = StubLLM(corpus, chat_latency=chat_latency, embedding_latency=embedding_latency,
+                   per_token_latency=token_latency)
+    server = StubLLMServer(stub).start()
+    samples: Dict[str, List[float]] = defaultdict(list)
+    quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with tempfile.TemporaryDirectory(prefix="drishti-bench-") as workdir:
+            _configure(workdir, server.url)
+            csv_path = write_csv(os.path.join(workdir, "promotions.csv"), rows=rows)
+
+            # Imported after configuration so module-level clients pick up the stub URL
+            from main import PromotionAnalysisSystem
+
+            with quiet:
+                system = PromotionAnalysisSystem(csv_path, force_rebuild=True)
+                system.initialize()
+                if stream:
+                    asyncio.run(_run_streaming(system, corpus, repeat, samples))
+                else:
+                    for _ in range(repeat):
+                        for entry in corpus:
+                            with collect_stage_timings() as timings:
+                                start = time.perf_counter()
+                                system.query(entry["question"])
+                                record_stage("total", time.perf_counter() - start)
+                            _collect(samples, timings)
+                if system.conn is not None:
+                    system.conn.close()
+    finally:
+        server.stop()
+
+    return {
+        stage: {
+            "p50_ms": round(_percentile(values, 50), 2),
+            "p95_ms": round(_percentile(values, 95), 2),
+            "count": len(values),
+        }
+        for stage, values in samples.items()
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict, tolerance: float,
+            slack_ms: float) -> List[str]:
+    """Stages whose p50 or p95 exceeds baseline * (1 + tolerance) + slack_ms"""
+    regressions = []
+    for stage, expected in baseline.get("stages", {}).items():
+        actual = results.get(stage)
+        if actual is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            limit = expected[metric] * (1 + tolerance) + slack_ms
+            if actual[metric] > limit:
+                regressions.append(
+                    f"{stage} {metric}: {actual[metric]:.1f} ms > {limit:.1f} ms (baseline {expected[metric]:.1f} ms)"
+                )
+    return regressions
+
+
+def print_report(results: Dict[str, Dict[str, float]], baseline: Dict):
+    stages = [s for s in STAGE_ORDER if s in results] + sorted(s for s in results if s not in STAGE_ORDER)
+    expected = baseline.get("stages", {})
+    print(f"{'stage':<20}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'base p50':>11}{'base p95':>11}")
+    for stage in stages:
+        r = results[stage]
+        b = expected.get(stage, {})
+        print(
+            f"{stage:<20}{r['count']:>7}{r['p50_ms']:>11.1f}{r['p95_ms']:>11.1f}"
+            f"{b.get('p50_ms', float('nan')):>11.1f}{b.get('p95_ms', float('nan')):>11.1f}"
+        )
+
+
+def print_role_report():
+    print(f"{'role':<14}{'model':<24}{'calls':>7}{'p50 s':>9}{'accuracy':>10}")
+    for role, stats in model_routing_telemetry.snapshot().items():
+        accuracy = "-" if stats["accuracy"] is None else f"{stats['accuracy']:.0%}"
+        print(f"{role:<14}{stats['model']:<24}{stats['calls']:>7}{stats['latency_s'].get('p50', 0.0):>9.3f}{accuracy:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage latency benchmark with a local LLM stub")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="Question corpus JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="Write results as the new baseline")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the corpus")
+    parser.add_argument("--rows", type=int, default=2000, help="Synthetic dataset rows")
+    parser.add_argument("--chat-latency", type=float, default=0.0, help="Injected seconds per chat completion")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Injected seconds per embedding call")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Injected seconds per generated token")
+    parser.add_argument("--stream", action="store_true", help="Use the token-streaming query path")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed relative slowdown vs. baseline")
+    parser.add_argument("--slack-ms", type=float, default=25.0, help="Allowed absolute slowdown in ms")
+    parser.add_argument("--verbose", action="store_true", help="Show system output while running")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        corpus = json.load(f)["questions"]
+
+    results = run_benchmark(corpus, args.repeat, args.chat_latency, args.embedding_latency, args.rows,
+                            args.verbose, args.stream, args.token_latency)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    print()
+    print_role_report()
+
+    settings = {
+        "rows": args.rows, "stream": args.stream, "chat_latency": args.chat_latency,
+        "embedding_latency": args.embedding_latency, "token_latency": args.token_latency,
+    }
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "settings": dict(settings, repeat=args.repeat),
+                "stages": results,
+            }, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if not baseline:
+        print("\nNo baseline found; run with --update-baseline to record one.")
+        return 0
+    recorded = baseline.get("settings", {})
+    if any(recorded.get(key, value) != value for key, value in settings.items()):
+        print("\nWARNING: settings differ from the baseline's; comparison may be meaningless.")
+
+    regressions = compare(results, baseline, args.tolerance, args.slack_ms)
+    if regressions:
+        print("\nREGRESSIONS:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+    print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
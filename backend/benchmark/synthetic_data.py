@@ -0,0 +1,60 @@
+"""
+Seeded synthetic promotions CSV with the columns the benchmark corpus queries
+"""
+import random
+from datetime import date, timedelta
+import pandas as pd
+
+REGIONS = ["Europe", "LATAM", "NA", "SEA"]
+COUNTRIES = ["BR", "DE", "US", "VN"]
+CATEGORIES = ["Drinks", "Snacks"]
+BRANDS = ["A", "B", "C"]
+STATUSES = ["COMPLETED", "ONGOING", "PLANNED"]
+RAG = ["Green", "Amber", "Red"]
+CUSTOMERS = ["Tesco", "Walmart", "Lotus"]
+PRODUCTS = ["Chips 100g", "Cola 1L"]
+
+
+def generate(rows: int = 2000, seed: int = 7) -> pd.DataFrame:
+    """Promotion rows with dates formatted like the source data (DD-MM-YYYY)"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(rows):
+        start = date(2024, 1, 1) + timedelta(days=rng.randrange(0, 700))
+        end = start + timedelta(days=rng.randrange(3, 45))
+        week = start + timedelta(days=rng.randrange(0, (end - start).days + 1))
+        records.append({
+            "Promo_Year": start.year,
+            "Region": rng.choice(REGIONS),
+            "Country": rng.choice(COUNTRIES),
+            "Category": rng.choice(CATEGORIES),
+            "Brand": rng.choice(BRANDS),
+            "Week": week.strftime("%d-%m-%Y"),
+            "PromoID": f"P{i // 3}",
+            "Promotion_Status": rng.choice(STATUSES),
+            "Start_Prom": start.strftime("%d-%m-%Y"),
+            "End_Prom": end.strftime("%d-%m-%Y"),
+            "Actual_RAG": rng.choice(RAG),
+            "Sales_Value": round(rng.uniform(500, 10000), 2),
+            "ROI%": round(rng.uniform(0, 100), 2),
+            "Channel_Customer": rng.choice(CUSTOMERS),
+            "ProductDescription": rng.choice(PRODUCTS),
+            "Actual_Promo_Sales_Value_Uplift_%": round(rng.uniform(0, 50), 2),
+        })
+    return pd.DataFrame(records)
+
+
+def write_csv(path: str, rows: int = 2000, seed: int = 7) -> str:
+    generate(rows, seed).to_csv(path, index=False)
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write the synthetic benchmark dataset")
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    print(f"Wrote {write_csv(args.path, args.rows, args.seed)}")
@@ -0,0 +1,158 @@
+"""
+SQLite-backed LangGraph checkpointer for agent runs
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Optional, Sequence
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    from langgraph.checkpoint.sqlite import SqliteSaver
+except ImportError:  # langgraph-checkpoint-sqlite is optional; runs are then checkpointed in memory
+    SqliteSaver = None
+
+
+if SqliteSaver is not None:
+
+    class ThreadedSqliteSaver(SqliteSaver):
+        """SqliteSaver usable from both invoke() and astream().
+
+        SqliteSaver only implements the sync interface; the async one runs
+        it in a worker thread. Writes are small and local, and the saver
+        serializes access to its connection with a lock.
+        """
+
+        async def aget_tuple(self, config):
+            return await asyncio.to_thread(self.get_tuple, config)
+
+        async def alist(self, config, *, filter=None, before=None, limit=None) -> AsyncIterator[Any]:
+            items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+            for item in items:
+                yield item
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+        async def aput_writes(self, config, writes: Sequence, task_id: str, task_path: str = ""):
+            await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+        async def adelete_thread(self, thread_id: str):
+            await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def create_checkpointer(path: Optional[str] = None):
+    """Checkpointer for the agent graph: SQLite at Config.AGENT_CHECKPOINT_PATH, or in-memory as a fallback"""
+    path = path or Config.AGENT_CHECKPOINT_PATH
+    if SqliteSaver is None:
+        from langgraph.checkpoint.memory import InMemorySaver
+
+        logger.warning(
+            "langgraph-checkpoint-sqlite not installed; agent checkpoints are kept in memory only. "
+            "Install with: pip install langgraph-checkpoint-sqlite"
+        )
+        return InMemorySaver()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    saver = ThreadedSqliteSaver(conn)
+    saver.setup()
+    logger.info(f"Agent checkpoints stored in {path}")
+    return saver
+
+
+class CheckpointThreads:
+    """Owner and age of every checkpointed run, for resume checks and expiry.
+
+    Completed runs are released right away; failed and interrupted runs
+    stay resumable by the caller that started them until they expire
+    after Config.AGENT_CHECKPOINT_TTL_SECONDS. With the SQLite
+    checkpointer the registry is a table in the same file, so ownership
+    survives restarts and the sweep also drops checkpoints of threads that
+    were never registered.
+    """
+
+    def __init__(self, checkpointer, ttl: Optional[float] = None):
+        self.checkpointer = checkpointer
+        self.ttl = ttl or Config.AGENT_CHECKPOINT_TTL_SECONDS
+        self._sqlite = isinstance(getattr(checkpointer, "conn", None), sqlite3.Connection)
+        self._threads = {}  # thread_id -> (owner, updated_at), when checkpoints live in memory
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        if self._sqlite:
+            with checkpointer.cursor() as cur:
+                cur.execute(
+                    "CREATE TABLE IF NOT EXISTS agent_threads "
+                    "(thread_id TEXT PRIMARY KEY, owner TEXT NOT NULL, updated_at REAL NOT NULL)"
+                )
+        self.sweep()
+
+    def claim(self, thread_id: str, owner: Optional[str]):
+        """Register a new run, or refresh a resumed one, for its owner"""
+        now = time.time()
+        if self._sqlite:
+            with self.checkpointer.cursor() as cur:
+                cur.execute(
+                    "INSERT OR REPLACE INTO agent_threads VALUES (?, ?, ?)", (thread_id, owner or "", now)
+                )
+        else:
+            with self._lock:
+                self._threads[thread_id] = (owner or "", now)
+        if now - self._last_sweep > Config.AGENT_CHECKPOINT_SWEEP_INTERVAL:
+            self.sweep()
+
+    def owns(self, thread_id: str, owner: Optional[str]) -> bool:
+        """Whether owner started the run and it has not expired"""
+        if self._sqlite:
+            with self.checkpointer.cursor(transaction=False) as cur:
+                row = cur.execute(
+                    "SELECT owner, updated_at FROM agent_threads WHERE thread_id = ?", (thread_id,)
+                ).fetchone()
+        else:
+            with self._lock:
+                row = self._threads.get(thread_id)
+        return row is not None and row[0] == (owner or "") and row[1] >= time.time() - self.ttl
+
+    def release(self, thread_id: str, keep_checkpoints: bool = False):
+        """Forget a finished run; its checkpoints are kept only when asked to, until they expire"""
+        if keep_checkpoints:
+            return
+        self.checkpointer.delete_thread(thread_id)
+        if self._sqlite:
+            with self.checkpointer.cursor() as cur:
+                cur.execute("DELETE FROM agent_threads WHERE thread_id = ?", (thread_id,))
+        else:
+            with self._lock:
+                self._threads.pop(thread_id, None)
+
+    def sweep(self) -> int:
+        """Delete checkpoints of expired and unregistered runs; returns the number of runs expired"""
+        self._last_sweep = time.time()
+        cutoff = self._last_sweep - self.ttl
+        try:
+            if self._sqlite:
+                with self.checkpointer.cursor() as cur:
+                    expired = cur.execute("DELETE FROM agent_threads WHERE updated_at < ?", (cutoff,)).rowcount
+                    for table in ("checkpoints", "writes"):
+                        cur.execute(f"DELETE FROM {table} WHERE thread_id NOT IN (SELECT thread_id FROM agent_threads)")
+            else:
+                with self._lock:
+                    stale = [t for t, (_, updated_at) in self._threads.items() if updated_at < cutoff]
+                    for thread_id in stale:
+                        del self._threads[thread_id]
+                for thread_id in stale:
+                    self.checkpointer.delete_thread(thread_id)
+                expired = len(stale)
+        except Exception as e:
+            logger.warning(f"Could not expire agent checkpoints: {e}")
+            return 0
+        if expired:
+            logger.info(f"[CHECKPOINT] Expired {expired} unfinished runs")
+        return expired
@@ -0,0 +1,224 @@
+"""
+Per-column statistics computed at ingestion for prompts and literal validation of generated SQL
+"""
+import difflib
+import json
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import duckdb
+import pandas as pd
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_CONSTANT_TYPES = {"TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "FLOAT", "DOUBLE", "DECIMAL"}
+NUMERIC_COLUMN_PREFIXES = ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT",
+                           "UINTEGER", "UBIGINT", "FLOAT", "DOUBLE", "DECIMAL", "REAL")
+
+
+@dataclass
+class ColumnStats:
+    name: str
+    column_type: str
+    min: Optional[str]
+    max: Optional[str]
+    approx_distinct: int
+    null_fraction: float
+    top_values: List[str] = field(default_factory=list)
+    complete: bool = False  # top_values holds every distinct value
+
+    @property
+    def is_numeric(self) -> bool:
+        return self.column_type.upper().startswith(NUMERIC_COLUMN_PREFIXES)
+
+
+class ColumnStatsCatalog:
+    """SUMMARIZE-style statistics per column, computed for each loaded dataset version.
+
+    Low-cardinality text columns also store their full value list, which is
+    used to correct misspelled or mis-cased literals in generated SQL before
+    it runs, instead of discovering them through an empty result.
+    """
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection, dataset_version: str, config: Config = Config):
+        self.conn = conn
+        self.dataset_version = dataset_version
+        self.config = config
+        self.stats: Dict[str, ColumnStats] = {}
+
+    def build(self):
+        """Compute stats for the current dataset version"""
+        self._compute()
+        logger.info(f"Column stats ready for {len(self.stats)} columns (dataset version {self.dataset_version})")
+
+    def _compute(self):
+        summary = self.conn.execute(f"SUMMARIZE {self.config.TABLE_NAME}").fetchdf()
+        self.stats = {}
+        for record in summary.to_dict("records"):
+            name = record["column_name"]
+            null_pct = record.get("null_percentage")
+            stats = ColumnStats(
+                name=name,
+                column_type=str(record["column_type"]),
+                min=None if pd.isna(record["min"]) else str(record["min"]),
+                max=None if pd.isna(record["max"]) else str(record["max"]),
+                approx_distinct=int(record["approx_unique"] or 0),
+                null_fraction=0.0 if pd.isna(null_pct) else round(float(null_pct) / 100, 4),
+            )
+            if not stats.is_numeric and stats.approx_distinct <= self.config.STATS_CATEGORICAL_MAX_DISTINCT * 2:
+                rows = self.conn.execute(f"""
+                    SELECT CAST("{name}" AS VARCHAR) AS value
+                    FROM {self.config.TABLE_NAME}
+                    WHERE "{name}" IS NOT NULL
+                    GROUP BY 1
+                    ORDER BY COUNT(*) DESC, value
+                    LIMIT {self.config.STATS_CATEGORICAL_MAX_DISTINCT + 1}
+                """).fetchall()
+                values = [row[0] for row in rows]
+                stats.complete = len(values) <= self.config.STATS_CATEGORICAL_MAX_DISTINCT
+                stats.top_values = values[:self.config.STATS_CATEGORICAL_MAX_DISTINCT]
+            self.stats[name] = stats
+
+    def categorical_values(self) -> List[str]:
+        """Every value of the fully enumerated text columns, e.g. regions, customers and categories"""
+        return [v for s in self.stats.values() if s.complete and not s.is_numeric for v in s.top_values]
+
+    def annotate(self, name: str, include_values: bool = True) -> str:
+        """Short stats note for one column, e.g. 'range 2.48..9995.94, 3% null'"""
+        stats = self.stats.get(name)
+        if stats is None:
+            return ""
+        parts = []
+        if stats.is_numeric or not stats.top_values:
+            if stats.min is not None:
+                parts.append(f"range {stats.min}..{stats.max}")
+            parts.append(f"~{stats.approx_distinct} distinct")
+        elif include_values:
+            shown = stats.top_values[:self.config.STATS_TOP_K]
+            more = "" if stats.complete and len(shown) == len(stats.top_values) else ", ..."
+            parts.append("values " + ", ".join(f"'{v}'" for v in shown) + more)
+        if stats.null_fraction:
+            parts.append(f"{stats.null_fraction:.0%} null")
+        return ", ".join(parts)
+
+    def _table_names(self, node, names: set):
+        """Names and aliases the promotions table is referenced by"""
+        if isinstance(node, dict):
+            table = node.get("table_name", "") if node.get("type") == "BASE_TABLE" else ""
+            if table.lower() == self.config.TABLE_NAME.lower():
+                names.update({table.lower(), (node.get("alias") or table).lower()})
+            for value in node.values():
+                self._table_names(value, names)
+        elif isinstance(node, list):
+            for value in node:
+                self._table_names(value, names)
+
+    def _lookup(self, column_names: List[str], table_names: set) -> Optional[ColumnStats]:
+        """Stats for an unqualified column, or one qualified by the promotions table or its alias"""
+        if not column_names or (len(column_names) > 1 and column_names[-2].lower() not in table_names):
+            return None
+        name = column_names[-1].lower()
+        for stats in self.stats.values():
+            if stats.name.lower() == name:
+                return stats
+        return None
+
+    def _closest(self, stats: ColumnStats, value: str) -> Optional[str]:
+        by_lower = {v.lower(): v for v in stats.top_values}
+        if value.lower() in by_lower:
+            return by_lower[value.lower()]
+        matches = difflib.get_close_matches(value.lower(), list(by_lower), n=1, cutoff=self.config.LITERAL_MATCH_CUTOFF)
+        return by_lower[matches[0]] if matches else None
+
+    def _comparisons(self, node, found: list):
+        """Collect (column_ref, constant) pairs from =, <>, IN and NOT IN predicates"""
+        if isinstance(node, dict):
+            kind = node.get("type")
+            if kind in ("COMPARE_EQUAL", "COMPARE_NOTEQUAL") and "left" in node:
+                left, right = node["left"], node["right"]
+                if left.get("class") == "CONSTANT":
+                    left, right = right, left
+                if left.get("class") == "COLUMN_REF" and right.get("class") == "CONSTANT":
+                    found.append((left, right))
+            elif kind in ("COMPARE_IN", "COMPARE_NOT_IN"):
+                children = node.get("children", [])
+                if children and children[0].get("class") == "COLUMN_REF":
+                    found.extend((children[0], c) for c in children[1:] if c.get("class") == "CONSTANT")
+            for value in node.values():
+                self._comparisons(value, found)
+        elif isinstance(node, list):
+            for value in node:
+                self._comparisons(value, found)
+
+    @staticmethod
+    def _quoted_span(sql: str, start: int) -> Optional[int]:
+        """End offset of the single-quoted literal starting at start, or None"""
+        if start is None or start >= len(sql) or sql[start] != "'":
+            return None
+        i = start + 1
+        while i < len(sql):
+            if sql[i] == "'":
+                if i + 1 < len(sql) and sql[i + 1] == "'":
+                    i += 2
+                    continue
+                return i + 1
+            i += 1
+        return None
+
+    def fix_literals(self, sql: str) -> Tuple[str, List[str]]:
+        """Correct string literals that do not occur in their column; return (sql, notes)"""
+        if not self.stats:
+            return sql, []
+        try:
+            raw = self.conn.cursor().execute("SELECT json_serialize_sql(?)", [sql]).fetchone()[0]
+        except duckdb.Error:
+            return sql, []
+        parsed = json.loads(raw)
+        if parsed.get("error"):
+            return sql, []
+
+        found: list = []
+        self._comparisons(parsed.get("statements", []), found)
+        table_names: set = set()
+        self._table_names(parsed.get("statements", []), table_names)
+        encoded = sql.encode("utf-8")
+        replacements = []
+        notes = []
+        for column_ref, constant in found:
+            stats = self._lookup(column_ref.get("column_names", []), table_names)
+            value = constant.get("value", {})
+            if stats is None or value.get("is_null"):
+                continue
+            literal = value.get("value")
+            type_id = (value.get("type") or {}).get("id")
+
+            if type_id in NUMERIC_CONSTANT_TYPES and stats.is_numeric and stats.min is not None:
+                try:
+                    outside = not float(stats.min) <= float(literal) <= float(stats.max)
+                except (TypeError, ValueError):
+                    outside = False
+                if outside:
+                    notes.append(f"{stats.name} = {literal} is outside the data range {stats.min}..{stats.max}.")
+                continue
+
+            if type_id != "VARCHAR" or not stats.complete or literal in stats.top_values:
+                continue
+            closest = self._closest(stats, literal)
+            # DuckDB reports byte offsets into the UTF-8 query
+            start = constant.get("query_location")
+            if start is not None:
+                start = len(encoded[:start].decode("utf-8", errors="ignore"))
+            end = self._quoted_span(sql, start)
+            if closest is not None and end is not None:
+                replacements.append((start, end, closest))
+                notes.append(f"Corrected {stats.name} value '{literal}' to '{closest}'.")
+            else:
+                shown = ", ".join(f"'{v}'" for v in stats.top_values[:self.config.STATS_TOP_K])
+                notes.append(f"'{literal}' does not occur in {stats.name} (values include {shown}).")
+
+        for start, end, closest in sorted(replacements, reverse=True):
+            sql = sql[:start] + "'" + closest.replace("'", "''") + "'" + sql[end:]
+        if replacements:
+            logger.info(f"[COLUMN STATS] Fixed {len(replacements)} literal(s): {sql}")
+        return sql, notes
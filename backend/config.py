@@ -2,7 +2,7 @@
 Configuration file for the FMCG Promotion Analysis Agent
 """
 import os
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 
 
@@ -25,6 +25,7 @@ class Config:
     
     # OpenAI API Configuration
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
+    OPENAI_BASE_URL: Optional[str] = os.getenv("OPENAI_BASE_URL") or None  # OpenAI-compatible endpoint (None = api.openai.com)
 
     # Azure Storage Configuration
     AZURE_STORAGE_ACCOUNT_NAME: str = os.getenv("AZURE_STORAGE_ACCOUNT_NAME", "")
@@ -36,6 +37,27 @@ class Config:
     LLM_MODEL: str = os.getenv("LLM_MODEL", "gpt-4o-mini")
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-large")
     LLM_TEMPERATURE: float = 0.0  # Deterministic for analytical queries
+
+    # Model Routing Configuration (per role; empty falls back to LLM_MODEL / OPENAI_BASE_URL / OPENAI_API_KEY)
+    LLM_ROLE_MODELS: Dict[str, str] = {
+        "planner": os.getenv("PLANNER_LLM_MODEL", ""),  # ReAct tool selection and final answer
+        "sql": os.getenv("SQL_LLM_MODEL", ""),  # SQL generation and repair
+        "interpreter": os.getenv("INTERPRETER_LLM_MODEL", ""),  # Semantic search and ML result analysis
+        "extractor": os.getenv("EXTRACTOR_LLM_MODEL", ""),  # What-if scenario parameter extraction
+    }
+    LLM_ROLE_BASE_URLS: Dict[str, str] = {
+        "planner": os.getenv("PLANNER_LLM_BASE_URL", ""),
+        "sql": os.getenv("SQL_LLM_BASE_URL", ""),
+        "interpreter": os.getenv("INTERPRETER_LLM_BASE_URL", ""),
+        "extractor": os.getenv("EXTRACTOR_LLM_BASE_URL", ""),
+    }
+    LLM_ROLE_API_KEYS: Dict[str, str] = {
+        "planner": os.getenv("PLANNER_LLM_API_KEY", ""),
+        "sql": os.getenv("SQL_LLM_API_KEY", ""),
+        "interpreter": os.getenv("INTERPRETER_LLM_API_KEY", ""),
+        "extractor": os.getenv("EXTRACTOR_LLM_API_KEY", ""),
+    }
+    LLM_ROLE_LATENCY_WINDOW: int = 1000  # Recent calls kept per role for latency percentiles
     
     # Vector Store Configuration
     VECTOR_STORE_TYPE: str = "faiss"  # Options: faiss, chroma
@@ -49,21 +71,140 @@ class Config:
     # Date Columns for Quarter Calculation
     DATE_COLUMNS: List[str] = ["Start_Prom", "End_Prom", "Start_Seas", "End_Seas"]
     WEEK_COLUMN: str = "Week"
-    
+    DATE_FORMAT: str = "%d-%m-%Y"
+
+    # Timeline Interval Index Configuration
+    INTERVAL_TABLE_NAME: str = "promotion_intervals"
+    INTERVAL_START_COLUMN: str = "Start_Prom"
+    INTERVAL_END_COLUMN: str = "End_Prom"
+    TIMELINE_ATTRIBUTE_COLUMNS: List[str] = ["PromoID", "Region", "Promotion_Status", "Promo_Year", "Actual_RAG"]
+    TIMELINE_MAX_BARS: int = 500  # Bars returned per timeline request by default
+    TIMELINE_LIMIT_MAX: int = 5000  # Largest limit a timeline request may ask for
+
+    # Facet Catalog Configuration
+    FACET_COLUMNS: List[str] = [
+        "Region", "Country", "Category", "Macro_Category", "Brand", "Channel_Customer",
+        "ProductDescription", "Promo_Year", "Half_Year", "Quarter", "Promotion_Status", "Actual_RAG",
+    ]
+    FACET_CACHE_SIZE: int = 256  # Filtered facet selections kept in memory
+    FACET_PROMPT_MAX_VALUES: int = 25  # Only list values of low-cardinality columns in prompts
+
+    # Column Statistics Configuration
+    STATS_TOP_K: int = 10  # Values listed per column in prompts
+    STATS_CATEGORICAL_MAX_DISTINCT: int = 100  # Text columns with at most this many values get literal validation
+    LITERAL_MATCH_CUTOFF: float = 0.75  # difflib similarity needed to auto-correct a literal
+
+    # SQL Template Fast Path Configuration
+    SQL_TEMPLATES_ENABLED: bool = True
+    TEMPLATE_ID_COLUMNS: List[str] = ["PromoID", "Region", "Promo_Year"]  # First identifies a promotion; the rest are listed in top-N results
+    TEMPLATE_COLUMN_SYNONYMS: Dict[str, str] = {
+        "rag": "Actual_RAG",
+        "rag status": "Actual_RAG",
+        "status": "Promotion_Status",
+        "promotion status": "Promotion_Status",
+        "roi": "ROI_PromoID",
+        "sales": "Sales_Value",
+        "uplift": "Actual_Promo_Sales_Value_Uplift_%",
+        "customer": "Channel_Customer",
+        "channel": "Channel_Customer",
+        "product": "ProductDescription",
+        "year": "Promo_Year",
+    }
+
+    # Schema Retriever Configuration
+    SCHEMA_RETRIEVER_ENABLED: bool = True
+    SCHEMA_TOP_K: int = 12  # Columns injected per question (plus always-included and matched columns)
+    SCHEMA_SAMPLE_VALUES: int = 5  # Sample values indexed per column
+    SCHEMA_ALWAYS_INCLUDE: List[str] = ["PromoID", "Promo_Year", "Region"]
+    COLUMN_DESCRIPTIONS: Dict[str, str] = {
+        "PromoID": "Promotion identifier; several rows (weeks/products) can share one PromoID",
+        "Promo_Year": "Year of the promotion",
+        "Start_Prom": "Promotion start date (text, DD-MM-YYYY)",
+        "End_Prom": "Promotion end date (text, DD-MM-YYYY)",
+        "Start_Seas": "Season start date (text, DD-MM-YYYY)",
+        "End_Seas": "Season end date (text, DD-MM-YYYY)",
+        "Week": "Promotion week (text date, DD-MM-YYYY)",
+        "Quarter": "Derived from Week: Q1=weeks 1-13, Q2=14-26, Q3=27-39, Q4=40-52",
+        "Promotion_Status": "Lifecycle status of the promotion",
+        "Actual_RAG": "Actual performance RAG status (Red/Amber/Green)",
+        "Region": "Sales region",
+        "Country": "Country code",
+    }
+
     # Embedding Configuration
     # Leave empty to embed all columns, or specify columns to embed
     COLUMNS_TO_EMBED: Optional[List[str]] = None  # None = embed all columns
     EMBEDDING_CHUNK_SIZE: int = 100  # Number of documents to embed per API call (to stay under 300k token limit)
     
+    # SQL Generation Cache Configuration
+    SQL_CACHE_ENABLED: bool = True
+    SQL_CACHE_SIMILARITY_THRESHOLD: float = 0.95  # Cosine similarity needed to reuse cached SQL
+    SQL_CACHE_MAX_ENTRIES: int = 1000
+
+    # Final Answer Cache Configuration
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.97  # Stricter than SQL: the answer is returned verbatim
+    ANSWER_CACHE_MAX_ENTRIES: int = 500
+
+    # SQL Result Cache Configuration
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # 256 MB of Arrow tables
+    RESULT_CACHE_MAX_ENTRY_FRACTION: float = 0.25  # Skip caching any single result larger than this share
+
+    # SQL Guard Configuration
+    SQL_GUARD_ENABLED: bool = True
+    SQL_GUARD_MAX_ESTIMATED_ROWS: int = 5_000_000  # Reject plans with any operator estimated above this
+    SQL_GUARD_MAX_RESULT_ROWS: int = 1000  # Inject LIMIT when an unbounded query would return more
+    SQL_GUARD_BLOCKED_FUNCTIONS: List[str] = [
+        "read_csv", "read_csv_auto", "read_parquet", "parquet_scan", "read_json", "read_json_auto",
+        "read_json_objects", "read_ndjson", "read_text", "read_blob", "glob", "sniff_csv",
+        "query", "query_table", "getenv", "duckdb_secrets", "duckdb_settings",
+    ]
+
+    # SQL Execution Limits
+    SQL_QUERY_TIMEOUT: float = 30.0  # seconds before a running query is interrupted
+    SQL_MEMORY_LIMIT: str = os.getenv("SQL_MEMORY_LIMIT", "2GB")  # DuckDB memory_limit (database-wide)
+    SQL_TEMP_DIRECTORY: str = "./duckdb_tmp"  # Spill location so large operators degrade instead of failing
+    SQL_DISABLE_EXTERNAL_ACCESS: bool = True  # No file, URL or extension access from queries once the data is loaded
+
+    # SQL Result Formatting
+    SQL_RESULT_TOKEN_BUDGET: int = 1500  # Max tokens of SQL results passed back to the agent
+    RESULT_SUMMARY_TOP_N: int = 20  # Rows shown when a result is summarized
+    RESULT_FULL_MAX_ROWS: int = 200  # Larger results are always summarized
+    RESULT_STORE_MAX_BYTES: int = 128 * 1024 * 1024  # Full results kept for retrieval by result_id
+
     # SQL Retry Configuration
-    SQL_MAX_RETRIES: int = 5
+    SQL_MAX_RETRIES: int = 5  # Transient errors only (I/O, locks, memory pressure)
     SQL_RETRY_DELAY: float = 1.0  # seconds
+    SQL_MAX_REPAIR_ATTEMPTS: int = 2  # LLM regenerations after a deterministic SQL error
     
     # ML Configuration
     ML_TRAINING_TIMEOUT: int = 900  # 15 minutes max
     ML_CACHE_ENABLED: bool = True
     AUTO_ML_LIBRARY: str = "flaml"  # Options: flaml, autosklearn
     
+    # Batch Mode Configuration
+    BATCH_CONCURRENCY: int = 4  # Questions processed in parallel by --batch
+    BATCH_RATE_LIMIT: float = 2.0  # Questions started per second (0 = unlimited)
+    BATCH_OUTPUT_FILE: str = "batch_results.jsonl"
+
+    # Tracing Configuration
+    TRACE_MAX_STORED: int = 200  # Recent request traces kept for /admin/traces
+    TRACE_EXPORT_FILE: Optional[str] = os.getenv("TRACE_EXPORT_FILE") or None  # Append finished traces as JSON lines
+
+    # Usage Accounting Configuration
+    USAGE_TRACKING_ENABLED: bool = True
+    USAGE_DB_PATH: str = os.getenv("USAGE_DB_PATH", "./usage.duckdb")  # Per-request token/cost/latency rows
+    # USD per 1M tokens as (input, cached input, output); model names match by longest prefix
+    MODEL_PRICING: Dict[str, Tuple[float, float, float]] = {
+        "gpt-4o-mini": (0.15, 0.075, 0.60),
+        "gpt-4o": (2.50, 1.25, 10.00),
+        "gpt-4.1-nano": (0.10, 0.025, 0.40),
+        "gpt-4.1-mini": (0.40, 0.10, 1.60),
+        "gpt-4.1": (2.00, 0.50, 8.00),
+        "o4-mini": (1.10, 0.275, 4.40),
+    }
+
     # Logging Configuration
     LOG_QUERIES: bool = True
     LOG_RESULTS: bool = True
@@ -74,6 +215,27 @@ class Config:
     AGENT_TYPE: str = "react"  # ReAct agent
     MAX_ITERATIONS: int = 10
     AGENT_VERBOSE: bool = True
+    AGENT_PARALLEL_TOOL_CALLS: bool = True  # Let the planner request several tools in one step
+    AGENT_MAX_PARALLEL_TOOLS: int = 4  # Tool calls of one step run concurrently, up to this many threads
+    AGENT_COALESCE_REQUESTS: bool = True  # Concurrent identical questions (same dataset) share one agent run
+    TOOL_EXECUTOR_WORKERS: int = int(os.getenv("TOOL_EXECUTOR_WORKERS", "8"))  # DuckDB/FAISS/pandas threads for async tools
+    QUERY_EXECUTOR_WORKERS: int = int(os.getenv("QUERY_EXECUTOR_WORKERS", "16"))  # Threads running synchronous /query requests
+
+    # Session Configuration
+    SESSIONS_ENABLED: bool = True
+    SESSION_TTL_SECONDS: int = 1800  # Idle sessions and their result views are closed after this
+    SESSION_MAX_SESSIONS: int = 200
+    SESSION_MAX_VIEWS: int = 20  # Tool results kept as result_<n> views per session (oldest dropped)
+    SESSION_MAX_TURNS: int = 50
+    SESSION_HISTORY_TOKEN_BUDGET: int = 1500  # Earlier turns sent with a follow-up question
+    SESSION_COMPACT_ANSWER_CHARS: int = 300  # Answer prefix kept for turns that no longer fit verbatim
+
+    # Agent Checkpoint Configuration
+    AGENT_CHECKPOINTS_ENABLED: bool = True
+    AGENT_CHECKPOINT_PATH: str = "./agent_checkpoints.sqlite"
+    AGENT_CHECKPOINT_KEEP_COMPLETED: bool = False  # Completed runs are deleted once their answer is read
+    AGENT_CHECKPOINT_TTL_SECONDS: int = 3600  # Failed or interrupted runs stay resumable this long
+    AGENT_CHECKPOINT_SWEEP_INTERVAL: int = 300  # Seconds between expiry sweeps of the checkpoint store
     
     @classmethod
     def validate(cls):
@@ -87,6 +249,15 @@ class Config:
             
         return True
     
+    @classmethod
+    def llm_settings(cls, role: str) -> Dict[str, Optional[str]]:
+        """Model, base URL and API key for an LLM role, falling back to the global settings"""
+        return {
+            "model": cls.LLM_ROLE_MODELS.get(role) or cls.LLM_MODEL,
+            "base_url": cls.LLM_ROLE_BASE_URLS.get(role) or cls.OPENAI_BASE_URL,
+            "api_key": cls.LLM_ROLE_API_KEYS.get(role) or cls.OPENAI_API_KEY,
+        }
+
     @classmethod
     def get_system_prompt(cls) -> str:
         """Returns the system prompt with schema information"""
@@ -9,6 +9,7 @@ from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 from config import Config
+from utils import compute_dataset_version, timed_stage
 import logging
 from openai import OpenAI
 import httpx
@@ -26,7 +27,12 @@ class DataLoader:
         self.config = config
         self.conn = None
         self.df = None
-        
+        self.timeline = None
+        self.facets = None
+        self.column_stats = None
+        self.schema_retriever = None
+        self.dataset_version = None
+
         # Standard OpenAI client
         from utils import get_httpx_client
         http_client = get_httpx_client()
@@ -35,7 +41,11 @@ class DataLoader:
         self.embeddings = OpenAIEmbeddings(
             model=config.EMBEDDING_MODEL,
             openai_api_key=config.OPENAI_API_KEY,
+            openai_api_base=config.OPENAI_BASE_URL,
+            # Compatible endpoints take raw text, not tiktoken ids
+            check_embedding_ctx_length=config.OPENAI_BASE_URL is None,
             http_client=http_client,
+            http_async_client=get_httpx_client(async_mode=True),
             chunk_size=config.EMBEDDING_CHUNK_SIZE,
             max_retries=3
         )
@@ -45,6 +55,7 @@ class DataLoader:
         """Load CSV file into pandas DataFrame"""
         logger.info(f"Loading CSV from {self.csv_path}...")
         self.df = pd.read_csv(self.csv_path)
+        self.dataset_version = compute_dataset_version(self.csv_path)
         logger.info(f"Loaded {len(self.df)} rows and {len(self.df.columns)} columns")
         logger.info(f"Columns: {list(self.df.columns)}")
         return self.df
@@ -90,7 +101,31 @@ class DataLoader:
             f"SELECT COUNT(*) FROM {self.config.TABLE_NAME}"
         ).fetchone()[0]
         logger.info(f"DuckDB table '{self.config.TABLE_NAME}' created with {row_count} rows")
-        
+
+        # Build sorted interval index for timeline/overlap queries
+        from timeline import TimelineIndex
+        self.timeline = TimelineIndex(self.conn, self.config)
+        self.timeline.build()
+
+        # Precompute facet value counts for filter dropdowns and prompts
+        from facets import FacetCatalog
+        self.facets = FacetCatalog(self.conn, self.dataset_version, self.config)
+        self.facets.build()
+
+        # Column statistics for prompts and literal validation of generated SQL
+        from column_stats import ColumnStatsCatalog
+        self.column_stats = ColumnStatsCatalog(self.conn, self.dataset_version, self.config)
+        self.column_stats.build()
+
+        # Index columns so prompts only carry the ones relevant to each question
+        if self.config.SCHEMA_RETRIEVER_ENABLED:
+            from schema_retriever import SchemaRetriever
+            self.schema_retriever = SchemaRetriever(
+                self.conn, self.embeddings, self.facets, self.timeline, self.config,
+                column_stats=self.column_stats,
+            )
+            self.schema_retriever.build()
+
         return self.conn
     
     def get_schema_description(self) -> str:
@@ -103,8 +138,19 @@ class DataLoader:
         
         schema_desc = f"Table: {self.config.TABLE_NAME}\nColumns:\n"
         for col_name, col_type in schema_info:
-            schema_desc += f"  - {col_name} ({col_type})\n"
-        
+            schema_desc += f"  - {col_name} ({col_type})"
+            if self.column_stats:
+                in_facets = bool(self.facets) and col_name in self.facets.columns
+                note = self.column_stats.annotate(col_name, include_values=not in_facets)
+                if note:
+                    schema_desc += f" [{note}]"
+            schema_desc += "\n"
+
+        if self.facets:
+            schema_desc += self.facets.describe()
+        if self.timeline:
+            schema_desc += self.timeline.describe()
+
         return schema_desc
     
     def _prepare_text_for_embedding(self, row: pd.Series, columns: Optional[List[str]] = None) -> str:
@@ -181,7 +227,10 @@ class DataLoader:
         self.embeddings = OpenAIEmbeddings(
             model=Config.EMBEDDING_MODEL,
             openai_api_key=Config.OPENAI_API_KEY,
+            openai_api_base=Config.OPENAI_BASE_URL,
+            check_embedding_ctx_length=Config.OPENAI_BASE_URL is None,
             http_client=http_client,
+            http_async_client=get_httpx_client(async_mode=True),
             chunk_size=self.config.EMBEDDING_CHUNK_SIZE,
             max_retries=3
         )
@@ -214,7 +263,8 @@ class DataLoader:
         
         # Initialize vectorstore with first batch
         first_batch = documents[:batch_size]
-        self.vectorstore = FAISS.from_documents(first_batch, self.embeddings)
+        with timed_stage("embedding_batch", documents=len(first_batch)):
+            self.vectorstore = FAISS.from_documents(first_batch, self.embeddings)
         logger.info(f"Processed batch 1/{total_batches} ({len(first_batch)} documents)")
         
         # Add remaining batches incrementally
@@ -224,7 +274,8 @@ class DataLoader:
             batch = documents[start_idx:end_idx]
             
             # Create temporary vectorstore for this batch
-            batch_vectorstore = FAISS.from_documents(batch, self.embeddings)
+            with timed_stage("embedding_batch", documents=len(batch)):
+                batch_vectorstore = FAISS.from_documents(batch, self.embeddings)
             
             # Merge with main vectorstore
             self.vectorstore.merge_from(batch_vectorstore)
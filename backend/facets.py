@@ -0,0 +1,122 @@
+"""
+Precomputed facet catalog (distinct values with counts) for categorical columns
+"""
+import threading
+import duckdb
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from config import Config
+from utils import dataframe_to_records
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FacetCatalog:
+    """Distinct values and counts per categorical column, computed once per dataset version.
+
+    The unfiltered catalog is built at ingestion. Filtered facets are computed
+    disjunctively (each facet ignores its own selection, so a dropdown keeps
+    showing its alternatives) and memoized per (dataset_version, selection).
+    """
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection, dataset_version: str, config: Config = Config):
+        self.conn = conn
+        self.dataset_version = dataset_version
+        self.config = config
+        self.columns: List[str] = []
+        self.facets: Dict[str, List[Dict]] = {}
+        self._filtered_cache: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build(self):
+        """Compute facet counts for every configured categorical column"""
+        existing = {
+            row[0] for row in self.conn.execute(f"""
+                SELECT column_name
+                FROM information_schema.columns
+                WHERE table_name = '{self.config.TABLE_NAME}'
+            """).fetchall()
+        }
+        self.columns = [c for c in self.config.FACET_COLUMNS if c in existing]
+        self.facets = self._compute({})
+        with self._lock:
+            self._filtered_cache.clear()
+        logger.info(
+            f"Facet catalog built for {len(self.columns)} columns "
+            f"(dataset version {self.dataset_version})"
+        )
+
+    def _compute(self, selection: Dict[str, List]) -> Dict[str, List[Dict]]:
+        """Run one UNION ALL query producing value counts for every facet"""
+        if not self.columns:
+            return {}
+
+        parts = []
+        params: list = []
+        for col in self.columns:
+            clauses = []
+            for key, values in selection.items():
+                if key == col:
+                    continue
+                placeholders = ", ".join("?" for _ in values)
+                clauses.append(f'CAST("{key}" AS VARCHAR) IN ({placeholders})')
+                params.extend(str(v) for v in values)
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+            parts.append(f"""
+                SELECT '{col}' AS facet, CAST("{col}" AS VARCHAR) AS value, COUNT(*) AS count
+                FROM {self.config.TABLE_NAME}
+                {where}
+                GROUP BY 2
+                HAVING value IS NOT NULL
+            """)
+
+        df = self.conn.cursor().execute(
+            " UNION ALL ".join(parts) + " ORDER BY facet, count DESC, value",
+            params,
+        ).fetchdf()
+
+        facets: Dict[str, List[Dict]] = {col: [] for col in self.columns}
+        for record in dataframe_to_records(df):
+            facets[record["facet"]].append({"value": record["value"], "count": record["count"]})
+        return facets
+
+    def get(self, selection: Optional[Dict[str, List]] = None) -> Dict:
+        """Return facets, narrowed by the current selection if one is given"""
+        selection = {
+            key: sorted(str(v) for v in values)
+            for key, values in (selection or {}).items()
+            if key in self.columns and values
+        }
+        if not selection:
+            return {"dataset_version": self.dataset_version, "facets": self.facets}
+
+        cache_key = (self.dataset_version, tuple(sorted((k, tuple(v)) for k, v in selection.items())))
+        with self._lock:
+            facets = self._filtered_cache.get(cache_key)
+            if facets is not None:
+                self._filtered_cache.move_to_end(cache_key)
+        if facets is None:
+            facets = self._compute(selection)
+            with self._lock:
+                self._filtered_cache[cache_key] = facets
+                if len(self._filtered_cache) > self.config.FACET_CACHE_SIZE:
+                    self._filtered_cache.popitem(last=False)
+
+        return {"dataset_version": self.dataset_version, "facets": facets}
+
+    def describe(self, max_values: Optional[int] = None, columns: Optional[List[str]] = None) -> str:
+        """Known literal values for low-cardinality columns, for SQL prompts"""
+        if max_values is None:
+            max_values = self.config.FACET_PROMPT_MAX_VALUES
+        lines = []
+        for col in self.columns:
+            if columns is not None and col not in columns:
+                continue
+            values = self.facets.get(col, [])
+            if not values or len(values) > max_values:
+                continue
+            lines.append(f"  - {col}: " + ", ".join(f"'{v['value']}'" for v in values))
+        if not lines:
+            return ""
+        return "\nKnown values (exact spelling):\n" + "\n".join(lines) + "\n"
@@ -3,6 +3,10 @@ Main entry point for the FMCG Promotion Analysis Agent
 """
 import sys
 import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 from typing import Optional
 from config import Config
 from data_loader import DataLoader
@@ -10,6 +14,9 @@ from tools.sql_tool import SQLTool
 from tools.rag_tool import RAGTool
 from tools.ml_tool import MLTool
 from agent import PromotionAnalysisAgent
+from query_cache import AnswerCache, SemanticSQLCache
+from sessions import Session, SessionStore
+from utils import RateLimiter, latency_summary
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -19,16 +26,29 @@ logger = logging.getLogger(__name__)
 class PromotionAnalysisSystem:
     """Main system orchestrator"""
     
-    def __init__(self, csv_path: str, force_rebuild: bool = False):
+    def __init__(
+        self,
+        csv_path: str,
+        force_rebuild: bool = False,
+        sql_cache: Optional[SemanticSQLCache] = None,
+        answer_cache: Optional[AnswerCache] = None,
+    ):
         self.csv_path = csv_path
         self.force_rebuild = force_rebuild
+        # Generated SQL stays valid across data re-syncs until the schema changes
+        self.sql_cache = sql_cache
+        # Final answers are kept across rebuilds only while the dataset content is unchanged
+        self.answer_cache = answer_cache
         
         # Components
         self.loader = None
         self.conn = None
         self.vectorstore = None
         self.df = None
+        self.timeline = None
+        self.facets = None
         self.agent = None
+        self.sessions = None
         
         # Validate configuration
         Config.validate()
@@ -45,6 +65,8 @@ class PromotionAnalysisSystem:
         self.conn, self.vectorstore, self.df = self.loader.initialize(
             force_rebuild=self.force_rebuild
         )
+        self.timeline = self.loader.timeline
+        self.facets = self.loader.facets
         print("✅ Data loaded successfully!\n")
         
         # Step 2: Get schema
@@ -55,7 +77,18 @@ class PromotionAnalysisSystem:
         # Step 3: Create tools
         print("🔧 Step 3/4: Setting up tools...")
         
-        sql_tool = SQLTool(self.conn, schema_description)
+        if self.sql_cache is None:
+            self.sql_cache = SemanticSQLCache(self.loader.embeddings)
+        if self.loader.column_stats:
+            self.sql_cache.set_vocabulary(self.loader.column_stats.categorical_values())
+        sql_tool = SQLTool(
+            self.conn,
+            schema_description,
+            sql_cache=self.sql_cache,
+            dataset_version=self.loader.dataset_version,
+            schema_retriever=self.loader.schema_retriever,
+            column_stats=self.loader.column_stats,
+        )
         rag_tool = RAGTool(self.vectorstore)
         ml_tool = MLTool(self.df)
         
@@ -69,19 +102,31 @@ class PromotionAnalysisSystem:
         
         # Step 4: Create agent
         print("🤖 Step 4/4: Initializing ReAct Agent...")
-        self.agent = PromotionAnalysisAgent(tools, schema_description)
+        if self.answer_cache is None:
+            self.answer_cache = AnswerCache(self.loader.embeddings)
+        if self.loader.column_stats:
+            self.answer_cache.set_vocabulary(self.loader.column_stats.categorical_values())
+        self.agent = PromotionAnalysisAgent(
+            tools,
+            schema_description,
+            schema_retriever=self.loader.schema_retriever,
+            dataset_version=self.loader.dataset_version,
+            answer_cache=self.answer_cache,
+        )
+        if Config.SESSIONS_ENABLED:
+            self.sessions = SessionStore(self.conn)
         print("✅ Agent ready!\n")
         
         print("="*80)
         print("✨ SYSTEM INITIALIZATION COMPLETE")
         print("="*80 + "\n")
     
-    def query(self, question: str) -> dict:
-        """Execute a query"""
+    def query(self, question: str, session: Optional[Session] = None) -> dict:
+        """Execute a query, as the next turn of session when given"""
         if not self.agent:
             raise RuntimeError("System not initialized. Call initialize() first.")
         
-        return self.agent.query(question)
+        return self.agent.query(question, session=session)
     
     def interactive_mode(self):
         """Run in interactive mode"""
@@ -91,6 +136,9 @@ class PromotionAnalysisSystem:
         print("Enter your questions about the promotion data.")
         print("Type 'exit' or 'quit' to stop.\n")
         
+        # One conversation: follow-up questions can refer to earlier answers and results
+        session = self.sessions.create() if self.sessions is not None else None
+        
         while True:
             try:
                 question = input("\n🔍 Your question: ").strip()
@@ -103,7 +151,7 @@ class PromotionAnalysisSystem:
                     continue
                 
                 # Execute query
-                result = self.query(question)
+                result = self.query(question, session=session)
                 
                 # Show tool usage
                 tool_usage = self.agent.get_tool_usage_summary(result)
@@ -119,23 +167,96 @@ class PromotionAnalysisSystem:
                 logger.error(f"Error: {str(e)}")
                 print(f"\n❌ Error: {str(e)}\n")
     
-    def batch_queries(self, queries: list):
-        """Execute multiple queries in batch"""
+    def batch_queries(
+        self,
+        queries: list,
+        output_path: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        rate_limit: Optional[float] = None,
+    ):
+        """Execute multiple queries concurrently, appending each result to a JSONL file.
+
+        Queries already answered successfully in output_path are skipped, so
+        an interrupted batch resumes where it stopped.
+        """
+        output_path = output_path or Config.BATCH_OUTPUT_FILE
+        concurrency = max(1, concurrency or Config.BATCH_CONCURRENCY)
+        limiter = RateLimiter(Config.BATCH_RATE_LIMIT if rate_limit is None else rate_limit)
+
+        # Resume: (index, query) pairs that already have a successful answer
+        done = {}
+        if os.path.exists(output_path):
+            with open(output_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # partial line from a crash
+                    if record.get("status") == "ok":
+                        done[(record.get("index"), record.get("query"))] = record
+        pending = [(i, q) for i, q in enumerate(queries) if (i, q) not in done]
+
         print("\n" + "="*80)
         print("📦 BATCH MODE")
-        print(f"Processing {len(queries)} queries...")
+        print(f"Processing {len(pending)} queries ({len(queries) - len(pending)} already done) "
+              f"with concurrency {concurrency}...")
         print("="*80 + "\n")
-        
-        results = []
-        for i, query in enumerate(queries, 1):
-            print(f"\n[Query {i}/{len(queries)}]")
-            result = self.query(query)
-            results.append({
-                'query': query,
-                'result': result
-            })
-        
-        return results
+
+        latencies = []
+        failures = 0
+
+        def run_one(index: int, query: str) -> dict:
+            limiter.acquire()
+            started = time.perf_counter()
+            try:
+                output = self.query(query)["output"]
+                # agent.query reports failures as text instead of raising
+                status = "error" if output.startswith("Error: Agent execution error") else "ok"
+                error = output if status == "error" else None
+            except Exception as e:
+                output, status, error = None, "error", str(e)
+            return {
+                "index": index,
+                "query": query,
+                "status": status,
+                "answer": output,
+                "error": error,
+                "latency_s": round(time.perf_counter() - started, 3),
+                "finished_at": datetime.now().isoformat(),
+            }
+
+        batch_started = time.perf_counter()
+        with open(output_path, "a", encoding="utf-8") as out, \
+                ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(run_one, i, q) for i, q in pending]
+            for completed, future in enumerate(as_completed(futures), 1):
+                record = future.result()
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                latencies.append(record["latency_s"])
+                if record["status"] != "ok":
+                    failures += 1
+                done[(record["index"], record["query"])] = record
+                print(f"[Batch {completed}/{len(pending)}] {record['status']} in {record['latency_s']:.2f}s: "
+                      f"{record['query'][:80]}")
+
+        elapsed = time.perf_counter() - batch_started
+        stats = latency_summary(latencies)
+        print("\n" + "="*80)
+        print("📊 BATCH STATISTICS")
+        print(f"Completed: {len(latencies) - failures}, failed: {failures}, "
+              f"skipped (already done): {len(queries) - len(pending)}")
+        if latencies:
+            print(f"Wall time: {elapsed:.1f}s, throughput: {len(latencies) / elapsed * 60:.1f} queries/min")
+            print(f"Latency (s): p50={stats['p50']} p90={stats['p90']} p99={stats['p99']} "
+                  f"max={stats['max']} mean={stats['mean']}")
+        print(f"Results: {output_path}")
+        print("="*80 + "\n")
+
+        return [
+            {'query': q, 'result': {"output": done[(i, q)]["answer"] or done[(i, q)]["error"]}}
+            for i, q in enumerate(queries) if (i, q) in done
+        ]
 
 
 def main():
@@ -160,6 +281,24 @@ def main():
         type=str,
         help="Path to file containing queries (one per line)"
     )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=Config.BATCH_OUTPUT_FILE,
+        help="JSONL file for batch results; completed queries in it are skipped on restart"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=Config.BATCH_CONCURRENCY,
+        help="Number of batch queries processed in parallel"
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=Config.BATCH_RATE_LIMIT,
+        help="Maximum batch queries started per second (0 = unlimited)"
+    )
     
     args = parser.parse_args()
     
@@ -200,17 +339,12 @@ def main():
         with open(args.batch, 'r') as f:
             queries = [line.strip() for line in f if line.strip()]
         
-        results = system.batch_queries(queries)
-        
-        # Save results
-        output_file = "batch_results.txt"
-        with open(output_file, 'w') as f:
-            for item in results:
-                f.write(f"Query: {item['query']}\n")
-                f.write(f"Answer: {item['result']['output']}\n")
-                f.write("-" * 80 + "\n\n")
-        
-        print(f"\n✅ Results saved to {output_file}")
+        system.batch_queries(
+            queries,
+            output_path=args.output,
+            concurrency=args.concurrency,
+            rate_limit=args.rate_limit,
+        )
     
     else:
         # Interactive mode
@@ -0,0 +1,547 @@
+"""
+Caches that let repeated questions skip work in the SQL pipeline and the agent
+"""
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional, Tuple
+import numpy as np
+from config import Config
+from metrics import record_cache_lookup
+from utils import timed_stage
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace"""
+    text = re.sub(r"[^\w%.\s-]", " ", question.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def compile_vocabulary(values: Iterable[str]) -> Optional[re.Pattern]:
+    """One pattern matching any known categorical value as a whole word, longest first"""
+    words = sorted({v.strip().lower() for v in values if v and v.strip()}, key=len, reverse=True)
+    if not words:
+        return None
+    return re.compile(r"(?<!\w)(?:" + "|".join(re.escape(w) for w in words) + r")(?!\w)")
+
+
+def question_literals(question: str, vocabulary: Optional[re.Pattern] = None) -> frozenset:
+    """Numbers, quoted values and known categorical values that must match exactly for a cached SQL to be reusable.
+
+    "top 10 customers in 2024" and "top 5 customers in 2025" embed almost
+    identically, but their SQL differs only in these literals; so do
+    "uplift in SEA" and "uplift in Europe" once regions are in the vocabulary.
+    """
+    text = question.lower()
+    numbers = re.findall(r"\d+(?:\.\d+)?", text)
+    quoted = re.findall(r"[\"']([^\"']+)[\"']", text)
+    quarters = re.findall(r"\bq[1-4]\b", text)
+    known = vocabulary.findall(text) if vocabulary is not None else []
+    return frozenset(numbers + quoted + quarters + known)
+
+
+def schema_fingerprint(conn, table_name: str = None) -> str:
+    """Hash of the column names and types of the promotions table"""
+    table_name = table_name or Config.TABLE_NAME
+    rows = conn.cursor().execute(f"""
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_name = '{table_name}'
+        ORDER BY ordinal_position
+    """).fetchall()
+    return hashlib.sha1(repr(rows).encode()).hexdigest()[:16]
+
+
+@dataclass
+class _SQLCacheEntry:
+    question: str
+    literals: frozenset
+    embedding: np.ndarray
+    sql: str
+    schema_fingerprint: str
+    hits: int = field(default=0)
+
+
+class SemanticSQLCache:
+    """Maps (question embedding, schema fingerprint) to previously generated SQL.
+
+    Lookup first tries the normalized question text, then cosine similarity
+    over stored embeddings. A match is only reused when its literals agree
+    with the new question and its schema fingerprint is still current.
+    """
+
+    def __init__(self, embeddings, threshold: float = None, max_entries: int = None):
+        self.embeddings = embeddings
+        self.threshold = threshold if threshold is not None else Config.SQL_CACHE_SIMILARITY_THRESHOLD
+        self.max_entries = max_entries or Config.SQL_CACHE_MAX_ENTRIES
+        self._vocabulary: Optional[re.Pattern] = None
+        self._entries: "OrderedDict[str, _SQLCacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set_vocabulary(self, values: Iterable[str]):
+        """Known categorical values (regions, customers, ...) that must also agree between questions"""
+        vocabulary = compile_vocabulary(values)
+        with self._lock:
+            self._vocabulary = vocabulary
+            for entry in self._entries.values():
+                entry.literals = question_literals(entry.question, vocabulary)
+
+    def _embed(self, question: str) -> np.ndarray:
+        with timed_stage("embedding"):
+            vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def _aembed(self, question: str) -> np.ndarray:
+        with timed_stage("embedding"):
+            vector = np.asarray(await self.embeddings.aembed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def invalidate(self, fingerprint: str):
+        """Drop entries generated against a different schema"""
+        with self._lock:
+            stale = [k for k, e in self._entries.items() if e.schema_fingerprint != fingerprint]
+            for key in stale:
+                del self._entries[key]
+        if stale:
+            logger.info(f"[SQL CACHE] Invalidated {len(stale)} entries after schema change")
+
+    def _exact_hit(self, question: str, fingerprint: str) -> Optional[_SQLCacheEntry]:
+        key = normalize_question(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.schema_fingerprint == fingerprint:
+                entry.hits += 1
+                self._entries.move_to_end(key)
+                logger.info("[SQL CACHE] Exact hit")
+                return entry
+        return None
+
+    def _similar_hit(self, question: str, fingerprint: str, embedding: np.ndarray) -> Optional[str]:
+        with self._lock:
+            literals = question_literals(question, self._vocabulary)
+            candidates: List[Tuple[str, _SQLCacheEntry]] = [
+                (k, e) for k, e in self._entries.items()
+                if e.schema_fingerprint == fingerprint and e.literals == literals
+            ]
+            if not candidates:
+                return None
+            matrix = np.stack([e.embedding for _, e in candidates])
+            scores = matrix @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            best_key, entry = candidates[best]
+            entry.hits += 1
+            self._entries.move_to_end(best_key)
+            logger.info(f"[SQL CACHE] Semantic hit (similarity {scores[best]:.3f}) for: {entry.question}")
+            return entry.sql
+
+    def lookup(self, question: str, fingerprint: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """Return (cached_sql, question_embedding); cached_sql is None on a miss"""
+        entry = self._exact_hit(question, fingerprint)
+        if entry is not None:
+            record_cache_lookup("sql", True)
+            return entry.sql, entry.embedding
+        try:
+            embedding = self._embed(question)
+        except Exception as e:
+            logger.warning(f"[SQL CACHE] Embedding failed, skipping cache: {e}")
+            record_cache_lookup("sql", False)
+            return None, None
+        sql = self._similar_hit(question, fingerprint, embedding)
+        record_cache_lookup("sql", sql is not None)
+        return sql, embedding
+
+    async def alookup(self, question: str, fingerprint: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """lookup() with the question embedded over the async client"""
+        entry = self._exact_hit(question, fingerprint)
+        if entry is not None:
+            record_cache_lookup("sql", True)
+            return entry.sql, entry.embedding
+        try:
+            embedding = await self._aembed(question)
+        except Exception as e:
+            logger.warning(f"[SQL CACHE] Embedding failed, skipping cache: {e}")
+            record_cache_lookup("sql", False)
+            return None, None
+        sql = self._similar_hit(question, fingerprint, embedding)
+        record_cache_lookup("sql", sql is not None)
+        return sql, embedding
+
+    def store(self, question: str, sql: str, fingerprint: str, embedding: Optional[np.ndarray] = None):
+        """Remember SQL that executed successfully for this question"""
+        if embedding is None:
+            try:
+                embedding = self._embed(question)
+            except Exception as e:
+                logger.warning(f"[SQL CACHE] Embedding failed, not caching: {e}")
+                return
+        key = normalize_question(question)
+        with self._lock:
+            self._entries[key] = _SQLCacheEntry(
+                question=question,
+                literals=question_literals(question, self._vocabulary),
+                embedding=embedding,
+                sql=sql,
+                schema_fingerprint=fingerprint,
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def evict(self, sql: str):
+        """Remove any entry holding this SQL (e.g. after it failed to execute)"""
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e.sql == sql]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries)}
+
+
+@dataclass
+class _AnswerCacheEntry:
+    question: str
+    literals: frozenset
+    embedding: Optional[np.ndarray]
+    answer: str
+    dataset_version: Optional[str]
+    hits: int = field(default=0)
+
+
+class AnswerCache:
+    """Maps (question, dataset version) to the agent's final answer.
+
+    Same matching as SemanticSQLCache: the normalized question first, then
+    cosine similarity over stored embeddings, with literals required to
+    agree. Entries belong to the dataset version they were answered
+    against and are dropped once a different version is loaded.
+    """
+
+    def __init__(self, embeddings=None, threshold: float = None, max_entries: int = None):
+        self.embeddings = embeddings
+        self.threshold = threshold if threshold is not None else Config.ANSWER_CACHE_SIMILARITY_THRESHOLD
+        self.max_entries = max_entries or Config.ANSWER_CACHE_MAX_ENTRIES
+        self.hits = 0
+        self.misses = 0
+        self._vocabulary: Optional[re.Pattern] = None
+        self._entries: "OrderedDict[str, _AnswerCacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set_vocabulary(self, values: Iterable[str]):
+        """Known categorical values (regions, customers, ...) that must also agree before an answer is replayed"""
+        vocabulary = compile_vocabulary(values)
+        with self._lock:
+            self._vocabulary = vocabulary
+            for entry in self._entries.values():
+                entry.literals = question_literals(entry.question, vocabulary)
+
+    @staticmethod
+    def _normalized(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def invalidate(self, dataset_version: Optional[str]):
+        """Drop answers computed against any other dataset version"""
+        with self._lock:
+            stale = [k for k, e in self._entries.items() if e.dataset_version != dataset_version]
+            for key in stale:
+                del self._entries[key]
+        if stale:
+            logger.info(f"[ANSWER CACHE] Invalidated {len(stale)} entries after data re-sync")
+
+    def _match(self, question: str, dataset_version: Optional[str], embedding: Optional[np.ndarray]) -> Optional[str]:
+        key = normalize_question(question)
+        with self._lock:
+            literals = question_literals(question, self._vocabulary)
+            entry = self._entries.get(key)
+            best_key, score = (key, 1.0) if entry and entry.dataset_version == dataset_version else (None, 0.0)
+            if best_key is None and embedding is not None:
+                candidates = [
+                    (k, e) for k, e in self._entries.items()
+                    if e.dataset_version == dataset_version and e.literals == literals and e.embedding is not None
+                ]
+                if candidates:
+                    scores = np.stack([e.embedding for _, e in candidates]) @ embedding
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.threshold:
+                        best_key, entry, score = candidates[best][0], candidates[best][1], float(scores[best])
+            if best_key is None:
+                self.misses += 1
+                record_cache_lookup("answer", False)
+                return None
+            entry.hits += 1
+            self.hits += 1
+            record_cache_lookup("answer", True)
+            self._entries.move_to_end(best_key)
+        logger.info(f"[ANSWER CACHE] Hit (similarity {score:.3f}) for: {entry.question}")
+        return entry.answer
+
+    def _needs_embedding(self, question: str, dataset_version: Optional[str]) -> bool:
+        with self._lock:
+            entry = self._entries.get(normalize_question(question))
+            return not (entry and entry.dataset_version == dataset_version)
+
+    def _embed(self, question: str) -> Optional[np.ndarray]:
+        with timed_stage("embedding"):
+            return self._normalized(self.embeddings.embed_query(question))
+
+    async def _aembed(self, question: str) -> Optional[np.ndarray]:
+        with timed_stage("embedding"):
+            return self._normalized(await self.embeddings.aembed_query(question))
+
+    def lookup(self, question: str, dataset_version: Optional[str],
+               embed: Optional[Callable] = None) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """Return (cached_answer, question_embedding).
+
+        The question is only embedded when it has no exact match, with
+        ``embed`` (returning a unit vector) if given, else the cache's own
+        embeddings.
+        """
+        embedding = None
+        if self._needs_embedding(question, dataset_version):
+            try:
+                embedding = (embed or self._embed)(question)
+            except Exception as e:
+                logger.warning(f"[ANSWER CACHE] Embedding failed, exact matches only: {e}")
+        return self._match(question, dataset_version, embedding), embedding
+
+    async def alookup(self, question: str, dataset_version: Optional[str],
+                      aembed: Optional[Callable] = None) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """lookup() with the question embedded by an awaitable"""
+        embedding = None
+        if self._needs_embedding(question, dataset_version):
+            try:
+                embedding = await (aembed or self._aembed)(question)
+            except Exception as e:
+                logger.warning(f"[ANSWER CACHE] Embedding failed, exact matches only: {e}")
+        return self._match(question, dataset_version, embedding), embedding
+
+    def store(self, question: str, answer: str, dataset_version: Optional[str],
+              embedding: Optional[np.ndarray] = None):
+        """Remember a final answer; entries without an embedding only match exactly"""
+        key = normalize_question(question)
+        with self._lock:
+            self._entries[key] = _AnswerCacheEntry(
+                question=question,
+                literals=question_literals(question, self._vocabulary),
+                embedding=embedding,
+                answer=answer,
+                dataset_version=dataset_version,
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def _strip_locations(node):
+    """Remove parser positions so formatting differences disappear"""
+    if isinstance(node, dict):
+        return {k: _strip_locations(v) for k, v in node.items() if k != "query_location"}
+    if isinstance(node, list):
+        return [_strip_locations(v) for v in node]
+    return node
+
+
+_VOLATILE_FUNCTIONS = frozenset({
+    "now", "today", "current_date", "current_time", "current_timestamp", "localtime", "localtimestamp",
+    "get_current_time", "get_current_timestamp", "transaction_timestamp",
+    "random", "setseed", "uuid", "gen_random_uuid", "nextval", "currval",
+})
+
+
+def _is_volatile(node) -> bool:
+    """True if the statement's result can change between runs over the same data"""
+    if isinstance(node, dict):
+        if node.get("class") == "FUNCTION" and node.get("function_name", "").lower() in _VOLATILE_FUNCTIONS:
+            return True
+        # current_date and friends parse as bare column references
+        names = node.get("column_names", []) if node.get("class") == "COLUMN_REF" else []
+        if len(names) == 1 and names[0].lower() in _VOLATILE_FUNCTIONS:
+            return True
+        if node.get("sample"):
+            return True
+        return any(_is_volatile(value) for value in node.values())
+    if isinstance(node, list):
+        return any(_is_volatile(value) for value in node)
+    return False
+
+
+def _column_refs(node, refs: set):
+    """Collect lowercased single- and multi-part column reference names"""
+    if isinstance(node, dict):
+        if node.get("class") == "COLUMN_REF":
+            refs.update(name.lower() for name in node.get("column_names", []))
+        for value in node.values():
+            _column_refs(value, refs)
+    elif isinstance(node, list):
+        for value in node:
+            _column_refs(value, refs)
+
+
+def _canonicalize(node, table_aliases: dict, single_table: bool):
+    """Sort commutative AND/OR children and replace table aliases with canonical names"""
+    if isinstance(node, list):
+        return [_canonicalize(v, table_aliases, single_table) for v in node]
+    if not isinstance(node, dict):
+        return node
+
+    node = {k: _canonicalize(v, table_aliases, single_table) for k, v in node.items()}
+    if node.get("type") == "BASE_TABLE":
+        node["alias"] = "" if single_table else table_aliases[(node.get("alias") or node["table_name"]).lower()]
+    if node.get("class") == "COLUMN_REF":
+        names = node.get("column_names", [])
+        if len(names) > 1 and names[0].lower() in table_aliases:
+            # With a single table reference the qualifier is redundant
+            node["column_names"] = names[1:] if single_table else [table_aliases[names[0].lower()]] + names[1:]
+    if node.get("type") in ("CONJUNCTION_AND", "CONJUNCTION_OR"):
+        node["children"] = sorted(node["children"], key=lambda c: json.dumps(c, sort_keys=True))
+    return node
+
+
+def _collect_table_refs(node, refs: list):
+    """(table name, alias) of every table reference, in the order they appear"""
+    if isinstance(node, dict):
+        if node.get("type") == "BASE_TABLE":
+            refs.append((node["table_name"], node.get("alias") or ""))
+        for value in node.values():
+            _collect_table_refs(value, refs)
+    elif isinstance(node, list):
+        for value in node:
+            _collect_table_refs(value, refs)
+
+
+def _table_aliases(refs: list) -> dict:
+    """Map each alias (or unaliased table name) to a name derived from its position.
+
+    Self-joins reference one table several times, so aliases are kept
+    apart by position rather than collapsed to the table name; renaming
+    aliases consistently still yields the same key.
+    """
+    aliases: dict = {}
+    for table, alias in refs:
+        key = (alias or table).lower()
+        if key not in aliases:
+            aliases[key] = f"{table}#{len(aliases) + 1}"
+    return aliases
+
+
+def canonicalize_sql(conn, sql: str) -> Optional[str]:
+    """Canonical JSON form of a SELECT statement's parsed AST, or None if not cacheable.
+
+    Uses DuckDB's own parser (json_serialize_sql), so whitespace, keyword
+    case, table aliases and AND/OR predicate order do not change the result.
+    Output column aliases are dropped when nothing else references them,
+    since they only affect column names, which are restored on a cache hit.
+    Statements using time, random or sequence functions, or sampling, are
+    never cacheable.
+    """
+    with conn.cursor() as cursor:
+        raw = cursor.execute("SELECT json_serialize_sql(?)", [sql]).fetchone()[0]
+    parsed = json.loads(raw)
+    if parsed.get("error") or len(parsed.get("statements", [])) != 1:
+        return None
+    if _is_volatile(parsed["statements"][0]):
+        return None
+
+    statement = _strip_locations(parsed["statements"][0])
+    top = statement.get("node", {})
+    if top.get("type") == "SELECT_NODE":
+        others = {k: v for k, v in top.items() if k != "select_list"}
+        referenced: set = set()
+        _column_refs(others, referenced)
+        for expr in top.get("select_list", []):
+            if expr.get("alias", "").lower() not in referenced:
+                expr["alias"] = ""
+
+    refs: list = []
+    _collect_table_refs(statement, refs)
+    return json.dumps(_canonicalize(statement, _table_aliases(refs), len(refs) == 1), sort_keys=True)
+
+
+@dataclass
+class _ResultCacheEntry:
+    table: object  # pyarrow.Table
+    nbytes: int
+    sql: str
+
+
+class ResultCache:
+    """LRU of Arrow query results, bounded by total bytes.
+
+    Keys are the canonical SQL plus the dataset version, so results can
+    never outlive the data they were computed from.
+    """
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = max_bytes or Config.RESULT_CACHE_MAX_BYTES
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, _ResultCacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(canonical_sql: str, dataset_version: str) -> str:
+        return hashlib.sha1(f"{dataset_version}\n{canonical_sql}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[_ResultCacheEntry]:
+        """Return the cached entry (Arrow table plus original SQL) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                record_cache_lookup("result", False)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            record_cache_lookup("result", True)
+            return entry
+
+    def set(self, key: str, table, sql: str):
+        """Store an Arrow table, evicting least recently used entries over budget"""
+        nbytes = table.nbytes
+        if nbytes > self.max_bytes * Config.RESULT_CACHE_MAX_ENTRY_FRACTION:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key).nbytes
+            self._entries[key] = _ResultCacheEntry(table=table, nbytes=nbytes, sql=sql)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.total_bytes, "hits": self.hits, "misses": self.misses}
+
+
+# Global result cache instance
+result_cache = ResultCache()
+
+# Full results of summarized SQL outputs, retrievable by result_id
+result_store = ResultCache(max_bytes=Config.RESULT_STORE_MAX_BYTES)
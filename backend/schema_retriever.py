@@ -0,0 +1,274 @@
+"""
+Relevance-pruned schema descriptions for SQL generation and agent prompts
+"""
+import re
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+import duckdb
+import numpy as np
+from config import Config
+from utils import timed_stage
+import logging
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_TYPE_PREFIXES = ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT",
+                         "UINTEGER", "UBIGINT", "FLOAT", "DOUBLE", "DECIMAL", "REAL")
+
+
+@dataclass
+class _SchemaDoc:
+    name: str
+    text: str
+    column_type: str = ""
+    description: str = ""
+    samples: List[str] = field(default_factory=list)
+    match_values: List[str] = field(default_factory=list)
+    is_hint: bool = False
+    triggers: List[str] = field(default_factory=list)  # hints: columns that pull this hint in
+    keywords: List[str] = field(default_factory=list)  # hints: question words that pull this hint in
+    requires: List[str] = field(default_factory=list)  # hints: columns the hint refers to
+
+
+def _name_tokens(name: str) -> List[str]:
+    return [t for t in re.split(r"[^a-z0-9]+", name.lower()) if len(t) >= 3]
+
+
+def _question_words(question: str) -> set:
+    words = set(re.findall(r"[a-z0-9]+", question.lower()))
+    return words | {w[:-1] for w in words if w.endswith("s") and len(w) > 3}
+
+
+class SchemaRetriever:
+    """Index of column names, types, descriptions and sample values, queried per question.
+
+    Built once per dataset. For each question it selects the always-included
+    columns, columns whose name or known values appear in the question, and
+    the top-k columns by embedding similarity, plus any join/derived-column
+    hints those columns pull in. Without embeddings it falls back to the
+    lexical matches alone.
+    """
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection, embeddings=None, facets=None, timeline=None,
+                 config: Config = Config, column_stats=None):
+        self.conn = conn
+        self.embeddings = embeddings
+        self.facets = facets
+        self.column_stats = column_stats
+        self.timeline = timeline
+        self.config = config
+        self.columns: List[_SchemaDoc] = []
+        self.hints: List[_SchemaDoc] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._common_tokens: set = set()
+        self._question_embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sample_values(self, name: str) -> List[str]:
+        rows = self.conn.cursor().execute(f"""
+            SELECT DISTINCT CAST("{name}" AS VARCHAR)
+            FROM {self.config.TABLE_NAME}
+            WHERE "{name}" IS NOT NULL
+            LIMIT {self.config.SCHEMA_SAMPLE_VALUES}
+        """).fetchall()
+        return [row[0] for row in rows]
+
+    def build(self):
+        """Index every column of the promotions table and the derived-table hints"""
+        schema = self.conn.execute(f"""
+            SELECT column_name, data_type
+            FROM information_schema.columns
+            WHERE table_name = '{self.config.TABLE_NAME}'
+            ORDER BY ordinal_position
+        """).fetchall()
+
+        facet_values = self.facets.facets if self.facets else {}
+        self.columns = []
+        for name, column_type in schema:
+            description = self.config.COLUMN_DESCRIPTIONS.get(name, "")
+            match_values: List[str] = []
+            stats = self.column_stats.stats.get(name) if self.column_stats else None
+            if name in facet_values:
+                match_values = [v["value"] for v in facet_values[name]]
+                samples = match_values[:self.config.SCHEMA_SAMPLE_VALUES]
+            elif stats is not None and stats.top_values:
+                match_values = stats.top_values if stats.complete else []
+                samples = stats.top_values[:self.config.SCHEMA_SAMPLE_VALUES]
+            elif column_type.upper().startswith(NUMERIC_TYPE_PREFIXES):
+                samples = []
+            else:
+                samples = self._sample_values(name)
+            text = f"{name.replace('_', ' ')} ({column_type})"
+            if description:
+                text += f": {description}"
+            if samples:
+                text += ". Example values: " + ", ".join(samples)
+            self.columns.append(_SchemaDoc(
+                name=name, text=text, column_type=column_type, description=description,
+                samples=samples, match_values=match_values,
+            ))
+
+        # Name tokens shared by many columns ("actual", "sales", "value") say nothing about relevance
+        token_counts = Counter(t for doc in self.columns for t in set(_name_tokens(doc.name)))
+        self._common_tokens = {t for t, n in token_counts.items() if n > max(3, len(self.columns) // 5)}
+
+        self.hints = []
+        names = {doc.name for doc in self.columns}
+        if "Quarter" in names and self.config.WEEK_COLUMN in names:
+            self.hints.append(_SchemaDoc(
+                name="quarter",
+                text="Quarter is derived from the Week column (Q1=weeks 1-13, Q2=14-26, Q3=27-39, Q4=40-52); "
+                     "filter or group by Quarter instead of computing it from Week.\n",
+                is_hint=True,
+                triggers=["Quarter", self.config.WEEK_COLUMN],
+                keywords=["quarter", "q1", "q2", "q3", "q4", "quarterly"],
+                requires=["Quarter"],
+            ))
+        if self.timeline:
+            timeline_desc = self.timeline.describe()
+            if timeline_desc:
+                self.hints.append(_SchemaDoc(
+                    name="timeline",
+                    text=timeline_desc.lstrip("\n") + (
+                        f"Join back to {self.config.TABLE_NAME} on PromoID for KPI columns.\n"
+                        if "PromoID" in self.timeline.attribute_columns else ""
+                    ),
+                    is_hint=True,
+                    triggers=[self.config.INTERVAL_START_COLUMN, self.config.INTERVAL_END_COLUMN],
+                    keywords=["active", "running", "overlap", "overlapping", "during", "between",
+                              "timeline", "concurrent", "live", "ongoing"],
+                ))
+
+        self._matrix = None
+        if self.embeddings is not None:
+            try:
+                vectors = self.embeddings.embed_documents([doc.text for doc in self.columns + self.hints])
+                matrix = np.asarray(vectors, dtype=np.float32)
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                self._matrix = matrix / np.where(norms == 0, 1, norms)
+            except Exception as e:
+                logger.warning(f"[SCHEMA] Embedding schema index failed, using lexical matching only: {e}")
+        logger.info(f"Schema index built for {len(self.columns)} columns and {len(self.hints)} hints")
+
+    def _memoized_embedding(self, question: str) -> Optional[np.ndarray]:
+        with self._lock:
+            if question in self._question_embeddings:
+                self._question_embeddings.move_to_end(question)
+                return self._question_embeddings[question]
+        return None
+
+    def embed_question(self, question: str) -> Optional[np.ndarray]:
+        """Embed a question, memoized so the agent, its answer cache and the SQL tool share one call"""
+        if self._matrix is None:
+            return None
+        memoized = self._memoized_embedding(question)
+        if memoized is not None:
+            return memoized
+        try:
+            with timed_stage("embedding"):
+                vector = self.embeddings.embed_query(question)
+        except Exception as e:
+            logger.warning(f"[SCHEMA] Question embedding failed, using lexical matching only: {e}")
+            return None
+        return self._memoize_embedding(question, vector)
+
+    async def aembed_question(self, question: str) -> Optional[np.ndarray]:
+        """embed_question over the async client; None when the index has no embeddings"""
+        if self._matrix is None:
+            return None
+        memoized = self._memoized_embedding(question)
+        if memoized is not None:
+            return memoized
+        try:
+            with timed_stage("embedding"):
+                vector = await self.embeddings.aembed_query(question)
+        except Exception as e:
+            logger.warning(f"[SCHEMA] Question embedding failed, using lexical matching only: {e}")
+            return None
+        return self._memoize_embedding(question, vector)
+
+    def _memoize_embedding(self, question: str, vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        vector = vector / norm if norm else vector
+        with self._lock:
+            self._question_embeddings[question] = vector
+            while len(self._question_embeddings) > 256:
+                self._question_embeddings.popitem(last=False)
+        return vector
+
+    def _lexical_matches(self, question: str) -> List[str]:
+        """Columns whose name tokens or known values appear in the question"""
+        words = _question_words(question)
+        text = f" {re.sub(r'[^a-z0-9%]+', ' ', question.lower())} "
+        matched = []
+        for doc in self.columns:
+            tokens = [t for t in _name_tokens(doc.name) if t not in self._common_tokens]
+            if f" {doc.name.lower().replace('_', ' ')} " in text or any(t in words for t in tokens):
+                matched.append(doc.name)
+                continue
+            for value in doc.match_values:
+                value_text = re.sub(r"[^a-z0-9%]+", " ", str(value).lower()).strip()
+                if len(value_text) >= 2 and f" {value_text} " in text:
+                    matched.append(doc.name)
+                    break
+        return matched
+
+    def select(self, question: str, embedding: Optional[np.ndarray] = None) -> Tuple[List[_SchemaDoc], List[_SchemaDoc]]:
+        """Return (relevant columns in table order, relevant hints)"""
+        names = {doc.name for doc in self.columns}
+        selected = [c for c in self.config.SCHEMA_ALWAYS_INCLUDE if c in names]
+        selected += [c for c in self._lexical_matches(question) if c not in selected]
+
+        words = _question_words(question)
+        hint_names = {h.name for h in self.hints if words & set(h.keywords)}
+
+        if self._matrix is not None:
+            if embedding is None:
+                embedding = self.embed_question(question)
+            if embedding is not None and embedding.shape[0] == self._matrix.shape[1]:
+                docs = self.columns + self.hints
+                added = 0
+                for index in np.argsort(-(self._matrix @ embedding)):
+                    if added >= self.config.SCHEMA_TOP_K:
+                        break
+                    doc = docs[int(index)]
+                    if doc.is_hint:
+                        hint_names.add(doc.name)
+                    elif doc.name not in selected:
+                        selected.append(doc.name)
+                    added += 1
+
+        selected_set = set(selected)
+        hint_names.update(h.name for h in self.hints if selected_set & set(h.triggers))
+        hints = [h for h in self.hints if h.name in hint_names]
+        for hint in hints:
+            selected_set.update(c for c in hint.requires if c in names)
+        columns = [doc for doc in self.columns if doc.name in selected_set]
+        return columns, hints
+
+    def describe(self, question: str, embedding: Optional[np.ndarray] = None) -> str:
+        """Schema description limited to the columns relevant to the question"""
+        columns, hints = self.select(question, embedding)
+        desc = (
+            f"Table: {self.config.TABLE_NAME} "
+            f"({len(columns)} of {len(self.columns)} columns shown, selected for this question)\nColumns:\n"
+        )
+        for doc in columns:
+            desc += f"  - {doc.name} ({doc.column_type})"
+            if doc.description:
+                desc += f": {doc.description}"
+            if self.column_stats:
+                in_facets = bool(self.facets) and doc.name in self.facets.columns
+                note = self.column_stats.annotate(doc.name, include_values=not in_facets)
+                if note:
+                    desc += f" [{note}]"
+            desc += "\n"
+
+        if self.facets:
+            desc += self.facets.describe(columns=[doc.name for doc in columns])
+        for hint in hints:
+            desc += "\n" + hint.text
+        return desc
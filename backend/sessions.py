@@ -0,0 +1,270 @@
+"""
+Multi-turn sessions: conversation history and tool results kept as DuckDB temp views
+"""
+import contextvars
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import List, Optional
+import duckdb
+import pandas as pd
+from config import Config
+from utils import count_tokens
+import logging
+
+logger = logging.getLogger(__name__)
+
+_current_session: contextvars.ContextVar = contextvars.ContextVar("session", default=None)
+
+VIEW_PREFIX = "result_"
+
+
+def _unique_names(names: List[str]) -> List[str]:
+    """Suffix repeated column names (id, id_1, ...); a view cannot be scanned with duplicates"""
+    seen = {name.lower() for name in names}
+    counts: dict = {}
+    unique = []
+    for name in names:
+        key = name.lower()
+        if key in counts:
+            suffix = counts[key]
+            while f"{key}_{suffix}" in seen:
+                suffix += 1
+            counts[key] = suffix + 1
+            name = f"{name}_{suffix}"
+            seen.add(name.lower())
+        else:
+            counts[key] = 1
+        unique.append(name)
+    return unique
+
+
+@dataclass
+class SessionResult:
+    """A tool's result set, queryable under its view name in the session's connection"""
+    name: str
+    tool: str
+    question: str
+    table: object  # pyarrow.Table
+    sql: Optional[str] = None
+
+    def describe(self) -> str:
+        columns = ", ".join(f"{n} {t}" for n, t in zip(self.table.column_names, self.table.schema.types))
+        return f"- {self.name} ({self.table.num_rows} rows, from {self.tool}: \"{self.question}\"): {columns}"
+
+
+@dataclass
+class _Turn:
+    question: str
+    answer: str
+    tokens: int = 0
+    compact: str = ""
+    compact_tokens: int = 0
+
+
+class Session:
+    """State of one conversation: its turns and a DuckDB connection holding its result views.
+
+    The connection is a cursor of the main database, so it sees the
+    promotions tables, while views registered on it are private to the
+    session. DuckDB connections are not safe for concurrent use, so every
+    statement on it runs under the session lock; turns and view metadata
+    have a lock of their own so reading them never waits for a query.
+    """
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection, session_id: Optional[str] = None):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.conn = conn.cursor()
+        self.lock = threading.RLock()
+        self._state_lock = threading.Lock()
+        self.results: "OrderedDict[str, SessionResult]" = OrderedDict()
+        self.turns: List[_Turn] = []
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self._next_view = 1
+
+    def has_context(self) -> bool:
+        """Whether a question may depend on earlier turns, so per-question caches do not apply"""
+        with self._state_lock:
+            return bool(self.turns or self.results)
+
+    def register(self, table, tool: str, question: str, sql: Optional[str] = None) -> SessionResult:
+        """Expose an Arrow result as the next result_<n> view, dropping the oldest beyond the limit"""
+        names = _unique_names(table.column_names)
+        if names != table.column_names:
+            table = table.rename_columns(names)
+        with self.lock:
+            with self._state_lock:
+                name = f"{VIEW_PREFIX}{self._next_view}"
+                self._next_view += 1
+            self.conn.register(name, table)
+            with self._state_lock:
+                result = self.results[name] = SessionResult(name, tool, " ".join(question.split()), table, sql)
+                dropped = []
+                while len(self.results) > Config.SESSION_MAX_VIEWS:
+                    dropped.append(self.results.popitem(last=False)[0])
+            for old_name in dropped:
+                self.conn.unregister(old_name)
+        logger.info(f"[SESSION] {self.session_id} registered {name} ({table.num_rows} rows from {tool})")
+        return result
+
+    def referenced(self, text: str) -> List[str]:
+        """Names of this session's views mentioned in a SQL query or question"""
+        with self._state_lock:
+            names = set(self.results)
+        return [name for name in re.findall(rf"\b{VIEW_PREFIX}\d+\b", text) if name in names]
+
+    def frame(self, name: str) -> pd.DataFrame:
+        with self._state_lock:
+            table = self.results[name].table
+        return table.to_pandas()
+
+    def describe_views(self) -> str:
+        with self._state_lock:
+            return "\n".join(result.describe() for result in self.results.values())
+
+    def add_turn(self, question: str, answer: str):
+        answer = answer or ""
+        limit = Config.SESSION_COMPACT_ANSWER_CHARS
+        compact_answer = answer if len(answer) <= limit else answer[:limit].rsplit(" ", 1)[0] + " ..."
+        compact = f"User: {question}\nAssistant (abridged): {compact_answer}"
+        full = f"User: {question}\nAssistant: {answer}"
+        turn = _Turn(question, answer, count_tokens(full), compact, count_tokens(compact))
+        with self._state_lock:
+            self.turns.append(turn)
+            del self.turns[:-Config.SESSION_MAX_TURNS]
+
+    def history(self, token_budget: Optional[int] = None) -> str:
+        """Earlier turns compacted to a token budget.
+
+        The newest turns are kept verbatim; once those no longer fit, older
+        turns shrink to their question and the start of their answer, and
+        the oldest are dropped entirely.
+        """
+        budget = Config.SESSION_HISTORY_TOKEN_BUDGET if token_budget is None else token_budget
+        with self._state_lock:
+            turns = list(self.turns)
+        kept, used, verbatim = [], 0, True
+        for turn in reversed(turns):
+            if verbatim and used + turn.tokens <= budget:
+                kept.append(f"User: {turn.question}\nAssistant: {turn.answer}")
+                used += turn.tokens
+                continue
+            verbatim = False
+            if used + turn.compact_tokens > budget:
+                break
+            kept.append(turn.compact)
+            used += turn.compact_tokens
+        omitted = len(turns) - len(kept)
+        lines = [f"({omitted} earlier turns omitted)"] if omitted else []
+        return "\n\n".join(lines + list(reversed(kept)))
+
+    def to_dict(self) -> dict:
+        with self._state_lock:
+            return {
+                "session_id": self.session_id,
+                "created_at": self.created_at,
+                "last_used": self.last_used,
+                "turns": [{"question": t.question, "answer": t.answer} for t in self.turns],
+                "views": [
+                    {"name": r.name, "tool": r.tool, "question": r.question, "rows": r.table.num_rows,
+                     "columns": r.table.column_names, "sql": r.sql}
+                    for r in self.results.values()
+                ],
+            }
+
+    def close(self):
+        with self.lock:
+            with self._state_lock:
+                self.results.clear()
+            try:
+                self.conn.close()
+            except Exception as e:
+                logger.warning(f"Could not close connection of session {self.session_id}: {e}")
+
+
+class SessionStore:
+    """Live sessions of one database connection, expired after Config.SESSION_TTL_SECONDS idle"""
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection, ttl: Optional[float] = None, max_sessions: Optional[int] = None):
+        self.conn = conn
+        self.ttl = ttl or Config.SESSION_TTL_SECONDS
+        self.max_sessions = max_sessions or Config.SESSION_MAX_SESSIONS
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self) -> List[Session]:
+        """Remove idle sessions, and the least recently used ones beyond the limit"""
+        cutoff = time.time() - self.ttl
+        expired = [s for s in self._sessions.values() if s.last_used < cutoff]
+        live = [s for s in self._sessions.values() if s.last_used >= cutoff]
+        expired += live[:max(0, len(live) - self.max_sessions + 1)]
+        for session in expired:
+            del self._sessions[session.session_id]
+        return expired
+
+    def create(self) -> Session:
+        with self._lock:
+            expired = self._expire()
+            session = Session(self.conn)
+            self._sessions[session.session_id] = session
+        # Closing waits for a query still running on the session, so it happens outside the store lock
+        for old in expired:
+            old.close()
+        if expired:
+            logger.info(f"[SESSION] Closed {len(expired)} idle sessions")
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """The live session, or None when unknown or expired"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.last_used < time.time() - self.ttl:
+                return None
+            session.last_used = time.time()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        session.close()
+        return True
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), OrderedDict()
+        for session in sessions:
+            session.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "views": sum(len(s.results) for s in self._sessions.values()),
+            }
+
+
+def get_session() -> Optional[Session]:
+    """Session of the current request, if it belongs to one"""
+    return _current_session.get()
+
+
+@contextmanager
+def session_scope(session: Optional[Session]):
+    """Make a session current for tools called within, including threads and tasks they spawn"""
+    token = _current_session.set(session)
+    try:
+        yield session
+    finally:
+        # Async generators may be resumed from another context; the value then simply goes out of scope
+        try:
+            _current_session.reset(token)
+        except ValueError:
+            pass
@@ -0,0 +1,214 @@
+"""
+Single-flight coalescing: concurrent identical requests share one execution
+"""
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional, Tuple
+from utils import cancellation_scope, get_cancellation
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """One shared blocking execution and the callers waiting on it"""
+
+    def __init__(self):
+        self.finished = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.callers = 0
+        self.scope = None
+        self._lock = threading.Lock()
+
+    def join(self):
+        with self._lock:
+            self.callers += 1
+
+    def leave(self) -> bool:
+        """A caller's request was cancelled; returns True when no caller is left"""
+        with self._lock:
+            self.callers -= 1
+            return self.callers == 0
+
+    def cancel(self):
+        if self.scope is not None and not self.finished.is_set():
+            logger.info("[SINGLE FLIGHT] All callers cancelled, cancelling shared execution")
+            self.scope.cancel()
+
+
+class _CallerHandle:
+    """Registered in a caller's cancellation scope, which calls interrupt() when that request is cancelled"""
+
+    def __init__(self, flight: "SingleFlight", key: Hashable, call: _Call):
+        self.flight = flight
+        self.key = key
+        self.call = call
+        self._left = False
+
+    def interrupt(self):
+        if not self._left:
+            self._left = True
+            self.flight._leave(self.key, self.call)
+
+
+class SingleFlight:
+    """Coalesces concurrent blocking calls with the same key into one execution.
+
+    The first caller runs the function in its own cancellation scope;
+    callers arriving before it finishes wait for and share its result.
+    Cancelling one caller's request only detaches that caller.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return (result, shared); shared is True when another caller's execution was joined"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+            call.join()
+
+        caller_scope = get_cancellation()
+        handle = _CallerHandle(self, key, call)
+        if caller_scope is not None:
+            caller_scope.register(handle)
+        try:
+            if leader:
+                self._execute(key, call, func)
+            else:
+                logger.info(f"[SINGLE FLIGHT] Joined in-flight execution for {key!r}")
+                call.finished.wait()
+        finally:
+            if caller_scope is not None:
+                caller_scope.unregister(handle)
+        if call.error is not None:
+            raise call.error
+        return call.result, not leader
+
+    def _leave(self, key: Hashable, call: _Call):
+        with self._lock:
+            abandoned = call.leave()
+            # New requests start a fresh execution instead of joining the one being cancelled
+            if abandoned and self._calls.get(key) is call:
+                del self._calls[key]
+        if abandoned:
+            call.cancel()
+
+    def _execute(self, key: Hashable, call: _Call, func: Callable[[], Any]):
+        try:
+            with cancellation_scope() as scope:
+                call.scope = scope
+                call.result = func()
+        except BaseException as e:
+            call.error = e
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.finished.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"in_flight": len(self._calls), "executions": self.executions, "coalesced": self.coalesced}
+
+
+class _Stream:
+    """One shared streaming run: its events so far and the subscribers reading them"""
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self.done = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.scope = None
+        self._changed = asyncio.Event()
+
+    def publish(self, event: Dict[str, Any]):
+        self.events.append(event)
+        self._notify()
+
+    def finish(self):
+        self.done = True
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait(self):
+        await self._changed.wait()
+
+
+class StreamSingleFlight:
+    """Coalesces concurrent streaming runs with the same key into one run whose events fan out.
+
+    The run executes as its own task, so it is not tied to the client
+    that started it. Subscribers that attach late first receive the
+    events published so far. When every subscriber has gone, the run and
+    its queries are cancelled. Must be used from a single event loop.
+    """
+
+    def __init__(self):
+        self._streams: Dict[Hashable, _Stream] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def subscribe(self, key: Hashable, start: Callable[[], AsyncIterator[Dict[str, Any]]]) -> AsyncIterator[Dict[str, Any]]:
+        stream = self._streams.get(key)
+        if stream is None:
+            stream = self._streams[key] = _Stream()
+            stream.task = asyncio.get_running_loop().create_task(self._run(key, stream, start))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"[SINGLE FLIGHT] Subscribed to in-flight stream for {key!r}")
+        stream.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(stream.events):
+                    yield stream.events[index]
+                    index += 1
+                if stream.done:
+                    return
+                await stream.wait()
+        finally:
+            stream.subscribers -= 1
+            if stream.subscribers == 0 and not stream.done:
+                logger.info(f"[SINGLE FLIGHT] All subscribers left, cancelling stream for {key!r}")
+                # New requests start a fresh run instead of joining the one being cancelled
+                if self._streams.get(key) is stream:
+                    del self._streams[key]
+                if stream.scope is not None:
+                    stream.scope.cancel()
+                stream.task.cancel()
+
+    async def _run(self, key: Hashable, stream: _Stream, start: Callable[[], AsyncIterator[Dict[str, Any]]]):
+        try:
+            # A scope of its own: one subscriber disconnecting must not cancel the others' queries
+            with cancellation_scope() as scope:
+                stream.scope = scope
+                async for event in start():
+                    stream.publish(event)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"[SINGLE FLIGHT] Shared stream failed: {e}")
+            stream.publish({"type": "error", "message": f"Agent execution error: {e}"})
+        finally:
+            if self._streams.get(key) is stream:
+                del self._streams[key]
+            stream.finish()
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._streams), "executions": self.executions, "coalesced": self.coalesced}
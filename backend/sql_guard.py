@@ -0,0 +1,204 @@
+"""
+Pre-execution validation for generated SQL: read-only check, plan cost estimate, result limits
+"""
+import json
+from dataclasses import dataclass, field
+from typing import List, Optional
+import duckdb
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SQLGuardError(Exception):
+    """Generated SQL was rejected before execution (deterministic; the SQL must change)"""
+
+
+@dataclass
+class GuardedSQL:
+    sql: str
+    estimated_rows: Optional[int] = None
+    notes: List[str] = field(default_factory=list)
+
+
+class SQLGuard:
+    """Static analysis and EXPLAIN-based cost checks run before DuckDB executes a query.
+
+    1. Parse with DuckDB's own parser: exactly one SELECT statement, no
+       file/extension table functions, and only tables and views of the
+       catalog (no replacement scans of file paths or URLs).
+    2. EXPLAIN the plan and reject any operator whose estimated
+       cardinality exceeds the configured ceiling; cross products and
+       nested loop joins carry no estimate, so they are sized as the
+       product of their inputs.
+    3. Append a LIMIT when the query is unbounded and would return more rows
+       than the LLM can use.
+    """
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection, config: Config = Config):
+        self.conn = conn
+        self.config = config
+        self.explain_supported = self._supports_json_explain()
+
+    def _supports_json_explain(self) -> bool:
+        """EXPLAIN (FORMAT JSON) needs DuckDB >= 1.1; older versions skip cost checks"""
+        try:
+            self.conn.cursor().execute("EXPLAIN (FORMAT JSON) SELECT 1").fetchall()
+            return True
+        except Exception:
+            logger.warning("[SQL GUARD] EXPLAIN (FORMAT JSON) unsupported; plan cost checks disabled")
+            return False
+
+    def _cursor(self, conn=None):
+        # A session connection is used as is: its result views are invisible to new cursors
+        return conn if conn is not None else self.conn.cursor()
+
+    def _parse(self, sql: str, conn=None) -> dict:
+        raw = self._cursor(conn).execute("SELECT json_serialize_sql(?)", [sql]).fetchone()[0]
+        parsed = json.loads(raw)
+        if parsed.get("error"):
+            message = parsed.get("error_message", "could not parse statement")
+            if parsed.get("error_type") == "not implemented":
+                raise SQLGuardError("Only read-only SELECT queries are allowed (no INSERT, UPDATE, DELETE, DDL or PRAGMA)")
+            raise SQLGuardError(f"Could not parse SQL: {message}")
+        statements = parsed.get("statements", [])
+        if len(statements) != 1:
+            raise SQLGuardError(f"Expected exactly one SELECT statement, got {len(statements)}")
+        return statements[0]
+
+    def _check_functions(self, node):
+        """Reject table functions and scalar functions that reach outside the database"""
+        if isinstance(node, dict):
+            name = node.get("function_name")
+            if name and name.lower() in self.config.SQL_GUARD_BLOCKED_FUNCTIONS:
+                raise SQLGuardError(f"Function '{name}' is not allowed; query the {self.config.TABLE_NAME} table instead")
+            for value in node.values():
+                self._check_functions(value)
+        elif isinstance(node, list):
+            for value in node:
+                self._check_functions(value)
+
+    @staticmethod
+    def _collect_tables(node, tables: list, ctes: set):
+        if isinstance(node, dict):
+            if node.get("type") == "BASE_TABLE":
+                tables.append(node)
+            for entry in (node.get("cte_map") or {}).get("map", []):
+                ctes.add(entry["key"].lower())
+            for value in node.values():
+                SQLGuard._collect_tables(value, tables, ctes)
+        elif isinstance(node, list):
+            for value in node:
+                SQLGuard._collect_tables(value, tables, ctes)
+
+    def _check_tables(self, statement: dict, conn=None):
+        """Reject table references that are not catalog tables, views (incl. session views) or CTEs.
+
+        DuckDB resolves unknown names through replacement scans, so
+        FROM '/path/file.csv' or FROM 'https://...' would read files or
+        the network without calling any of the blocked functions.
+        """
+        tables: list = []
+        ctes: set = set()
+        self._collect_tables(statement, tables, ctes)
+        if not tables:
+            return
+        catalog = self._cursor(conn).execute("""
+            SELECT database_name, schema_name, table_name FROM duckdb_tables()
+            UNION ALL
+            SELECT database_name, schema_name, view_name FROM duckdb_views() WHERE NOT internal
+        """).fetchall()
+        for table in tables:
+            name = table["table_name"]
+            schema, database = table.get("schema_name", ""), table.get("catalog_name", "")
+            if not schema and not database and name.lower() in ctes:
+                continue
+            known = any(
+                name.lower() == t.lower()
+                and (not schema or schema.lower() == s.lower())
+                and (not database or database.lower() == d.lower())
+                for d, s, t in catalog
+            )
+            if not known:
+                raise SQLGuardError(f"Unknown table '{name}'; query the {self.config.TABLE_NAME} table instead")
+
+    @staticmethod
+    def _has_top_level_limit(statement: dict) -> bool:
+        modifiers = statement.get("node", {}).get("modifiers", [])
+        return any(m.get("type") in ("LIMIT_MODIFIER", "LIMIT_PERCENT_MODIFIER") for m in modifiers)
+
+    @staticmethod
+    def _cardinality(op: dict, estimates: list, cross_products: list) -> Optional[int]:
+        """Estimated output rows of a plan operator, collecting every operator's estimate on the way"""
+        children = [SQLGuard._cardinality(child, estimates, cross_products) for child in op.get("children", [])]
+        name = op.get("name", "")
+        estimate = op.get("extra_info", {}).get("Estimated Cardinality")
+        if estimate is not None:
+            estimate = int(str(estimate).replace(",", ""))
+        elif "CROSS_PRODUCT" in name or "NL_JOIN" in name or "NESTED_LOOP" in name:
+            # Unestimated joins: assume every pair of input rows survives
+            cross_products.append(name)
+            estimate = 1
+            for child in children:
+                estimate *= child if child is not None else 1
+        elif name == "UNGROUPED_AGGREGATE":
+            estimate = 1
+        else:
+            known = [child for child in children if child is not None]
+            estimate = max(known) if known else None
+        if estimate is not None:
+            estimates.append(estimate)
+        return estimate
+
+    def _estimate(self, sql: str, conn=None) -> tuple:
+        """Return (root_estimate, max_estimate, has_cross_product) from the physical plan"""
+        rows = self._cursor(conn).execute(f"EXPLAIN (FORMAT JSON) {sql}").fetchall()
+        plan = json.loads(rows[0][1])
+
+        estimates: list = []
+        cross_products: list = []
+        roots = [self._cardinality(op, estimates, cross_products) for op in plan]
+        root_estimate = next((r for r in roots if r is not None), None)
+        return root_estimate, max(estimates, default=0), bool(cross_products)
+
+    def check(self, sql: str, conn=None) -> GuardedSQL:
+        """Validate SQL and return the (possibly rewritten) query to execute.
+
+        conn is the connection the query will run on when it is not the
+        main one, e.g. a session connection holding its result views.
+        """
+        statement = self._parse(sql, conn)
+        self._check_functions(statement)
+        self._check_tables(statement, conn)
+        guarded = GuardedSQL(sql=sql)
+        if not self.explain_supported:
+            return guarded
+
+        try:
+            root_estimate, max_estimate, has_cross_product = self._estimate(sql, conn)
+        except duckdb.Error:
+            # Binder/catalog errors: let the caller repair the SQL from DuckDB's message
+            raise
+        except Exception as e:
+            logger.warning(f"[SQL GUARD] Could not estimate plan cost, skipping: {e}")
+            return guarded
+
+        guarded.estimated_rows = root_estimate
+        if max_estimate > self.config.SQL_GUARD_MAX_ESTIMATED_ROWS:
+            reason = "a cross join" if has_cross_product else "an intermediate result"
+            raise SQLGuardError(
+                f"Query plan produces {reason} of ~{max_estimate:,} rows "
+                f"(limit {self.config.SQL_GUARD_MAX_ESTIMATED_ROWS:,}). Add join conditions or filters, or aggregate first."
+            )
+
+        max_rows = self.config.SQL_GUARD_MAX_RESULT_ROWS
+        if root_estimate is not None and root_estimate > max_rows and not self._has_top_level_limit(statement):
+            guarded.sql = f"{sql.rstrip().rstrip(';').rstrip()}\nLIMIT {max_rows}"
+            guarded.notes.append(
+                f"Result limited to the first {max_rows} of ~{root_estimate:,} estimated rows; "
+                f"aggregate or filter for a complete answer."
+            )
+            logger.info(f"[SQL GUARD] Injected LIMIT {max_rows} (estimated {root_estimate} rows)")
+
+        return guarded
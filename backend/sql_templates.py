@@ -0,0 +1,355 @@
+"""
+Parameterized SQL templates for common question shapes, matched without an LLM call
+"""
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+AGGREGATES = {
+    "average": "AVG", "avg": "AVG", "mean": "AVG",
+    "total": "SUM", "sum": "SUM", "sum of": "SUM",
+    "maximum": "MAX", "max": "MAX", "highest": "MAX",
+    "minimum": "MIN", "min": "MIN", "lowest": "MIN",
+    "median": "MEDIAN",
+}
+_AGG_PATTERN = "|".join(sorted((re.escape(k) for k in AGGREGATES), key=len, reverse=True))
+_FILTER_TAIL = r"(?:\s+(?:in|for|during|where)\s+(?P<filters>.+))?"
+_LEADING_FILLER = re.compile(
+    r"^(?:please\s+)?(?:what\s+(?:is|are|was|were)\s+(?:the\s+)?|show\s+(?:me\s+)?(?:the\s+)?|list\s+(?:the\s+)?|"
+    r"give\s+me\s+(?:the\s+)?|get\s+(?:the\s+)?|find\s+(?:the\s+)?|which\s+are\s+(?:the\s+)?)"
+)
+
+
+def _quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value) -> str:
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def normalize_template_question(question: str) -> str:
+    text = re.sub(r"\s+", " ", question.strip().lower()).rstrip("?.! ")
+    return _LEADING_FILLER.sub("", text).strip()
+
+
+@dataclass
+class TemplateMatch:
+    template: str
+    sql: str
+    params: List = field(default_factory=list)
+
+    def render(self) -> str:
+        """Inline the parameters so the SQL can go through the guard and caches like generated SQL"""
+        parts = self.sql.split("?")
+        rendered = parts[0]
+        for value, part in zip(self.params, parts[1:]):
+            rendered += _literal(value) + part
+        return rendered
+
+
+@dataclass
+class _Template:
+    name: str
+    pattern: re.Pattern
+    build: Callable[[re.Match], Optional[TemplateMatch]]
+
+
+class SQLTemplateLibrary:
+    """Matches question shapes such as "top 10 promotions by X", "average X by Y in Q2" or
+    "RAG status distribution" and fills the template from schema and column statistics.
+
+    Column phrases resolve through configured synonyms, exact names, then
+    unambiguous token overlap; filters resolve to quarters, years or known
+    categorical values. Anything that does not resolve cleanly is left to
+    the LLM, so a miss costs only a few regex evaluations.
+    """
+
+    def __init__(self, column_stats, config: Config = Config):
+        self.column_stats = column_stats
+        self.config = config
+        self.table = config.TABLE_NAME
+        self.hits: Counter = Counter()
+        self.misses = 0
+        self.templates = [
+            _Template("top_n", re.compile(
+                r"^(?P<dir>top|bottom|highest|lowest)\s+(?P<n>\d+)\s+(?P<entity>.+?)\s+by\s+"
+                rf"(?:(?P<agg>{_AGG_PATTERN})\s+(?:of\s+)?)?(?P<metric>.+?){_FILTER_TAIL}$"
+            ), self._build_top_n),
+            _Template("aggregate_by", re.compile(
+                rf"^(?P<agg>{_AGG_PATTERN})\s+(?:of\s+)?(?P<metric>.+?)\s+(?:by|per|for each|across)\s+"
+                rf"(?P<group>.+?){_FILTER_TAIL}$"
+            ), self._build_aggregate_by),
+            _Template("distribution", re.compile(
+                rf"^(?:(?:distribution|breakdown)\s+of\s+(?P<col_a>.+?)|(?P<col_b>.+?)\s+(?:distribution|breakdown|split))"
+                rf"{_FILTER_TAIL}$"
+            ), self._build_distribution),
+            _Template("count", re.compile(
+                rf"^how many\s+(?:promotions?|promos?)(?:\s+(?:are|were)\s+there)?(?:\s+(?:are|were))?{_FILTER_TAIL}$"
+            ), self._build_count),
+        ]
+
+    # --- Resolution -----------------------------------------------------------
+    @property
+    def _stats(self) -> Dict:
+        return self.column_stats.stats if self.column_stats else {}
+
+    def resolve_column(self, phrase: str, numeric: Optional[bool] = None) -> Optional[str]:
+        """Map a phrase like "sales value" or "rag status" to a column name, or None if ambiguous"""
+        phrase = re.sub(r"\b(?:the|of|a|an)\b", " ", phrase.lower())
+        phrase = re.sub(r"\s+", " ", phrase).strip()
+        if not phrase:
+            return None
+
+        def allowed(name: str) -> bool:
+            stats = self._stats.get(name)
+            return stats is not None and (numeric is None or stats.is_numeric == numeric)
+
+        synonym = self.config.TEMPLATE_COLUMN_SYNONYMS.get(phrase)
+        if synonym and allowed(synonym):
+            return synonym
+        for name in self._stats:
+            if phrase in (name.lower(), name.lower().replace("_", " ")) and allowed(name):
+                return name
+
+        tokens = [t for t in re.split(r"[^a-z0-9%]+", phrase) if t]
+        candidates = []
+        for name in self._stats:
+            if not allowed(name):
+                continue
+            name_tokens = [t for t in re.split(r"[^a-z0-9%]+", name.lower()) if t]
+            if all(any(nt == t or nt == t.rstrip("s") or (len(t) >= 4 and nt.startswith(t)) for nt in name_tokens)
+                   for t in tokens):
+                candidates.append((len(name_tokens), name))
+        candidates.sort()
+        if not candidates or (len(candidates) > 1 and candidates[0][0] == candidates[1][0]):
+            return None
+        return candidates[0][1]
+
+    def _resolve_value(self, text: str) -> Optional[Tuple[str, str]]:
+        """(column, exact value) for a literal known in exactly one categorical column"""
+        owners = []
+        for name, stats in self._stats.items():
+            if not stats.complete:
+                continue
+            for value in stats.top_values:
+                if value.lower() == text:
+                    owners.append((name, value))
+                    break
+        return owners[0] if len(owners) == 1 else None
+
+    def _resolve_filter(self, part: str) -> Optional[Tuple[str, object]]:
+        """(column, value) for one filter phrase: a quarter, a year or a known categorical value"""
+        quarter = re.fullmatch(r"q([1-4])", part)
+        if quarter and "Quarter" in self._stats:
+            return "Quarter", f"Q{quarter.group(1)}"
+        if re.fullmatch(r"(?:19|20)\d\d", part) and "Promo_Year" in self._stats:
+            return "Promo_Year", int(part)
+        resolved = self._resolve_value(part)
+        if resolved is None and " " in part:
+            # "europe region" / "region europe": value plus the column it belongs to
+            for value_text, column_text in (part.rsplit(" ", 1), part.split(" ", 1)[::-1]):
+                column = self.resolve_column(column_text, numeric=False)
+                stats = self._stats.get(column) if column else None
+                if stats is not None and stats.complete:
+                    value = next((v for v in stats.top_values if v.lower() == value_text), None)
+                    if value is not None:
+                        return column, value
+        return resolved
+
+    def _parse_filters(self, text: Optional[str]) -> Optional[Tuple[List[str], List]]:
+        """WHERE clauses and params for "Q2 2024", "Europe and 2025", ...; None if any part is unknown"""
+        clauses: List[str] = []
+        params: List = []
+        if not text:
+            return clauses, params
+        parts = [p.strip() for p in re.split(r"\s*(?:,|\band\b|\bin\b|\bfor\b|\bduring\b)\s*", text) if p.strip()]
+        for part in parts:
+            part = re.sub(r"^the\s+", "", part)
+            resolved = self._resolve_filter(part)
+            if resolved is not None:
+                filters = [resolved]
+            else:
+                # "q2 2024", "europe 2025": every word must resolve on its own
+                filters = [self._resolve_filter(word) for word in part.split()]
+                if len(filters) < 2 or any(f is None for f in filters):
+                    return None
+            for column, value in filters:
+                clauses.append(f"{_quote_ident(column)} = ?")
+                params.append(value)
+        return clauses, params
+
+    @staticmethod
+    def _where(clauses: List[str]) -> str:
+        return f"\nWHERE {' AND '.join(clauses)}" if clauses else ""
+
+    # --- Templates ------------------------------------------------------------
+    def _build_top_n(self, m: re.Match) -> Optional[TemplateMatch]:
+        metric = self.resolve_column(m.group("metric"), numeric=True)
+        filters = self._parse_filters(m.group("filters"))
+        if metric is None or filters is None:
+            return None
+        clauses, params = filters
+        direction = "ASC" if m.group("dir") in ("bottom", "lowest") else "DESC"
+        n = min(int(m.group("n")), self.config.SQL_GUARD_MAX_RESULT_ROWS)
+        entity = m.group("entity").strip()
+
+        if re.fullmatch(r"(?:promotions?|promos?)", entity):
+            # A promotion spans many rows, so ranking needs an explicit roll-up per promotion
+            key, *others = self.config.TEMPLATE_ID_COLUMNS
+            if not m.group("agg") or key not in self._stats or metric == key:
+                return None
+            agg = AGGREGATES[m.group("agg")]
+            alias = f"{agg.lower()}_{metric}"
+            listed = "".join(
+                f", STRING_AGG(DISTINCT CAST({_quote_ident(c)} AS VARCHAR), ', ') AS {_quote_ident(c)}"
+                for c in others if c in self._stats and c != metric
+            )
+            sql = (
+                f"SELECT {_quote_ident(key)}{listed}, ROUND({agg}({_quote_ident(metric)}), 2) AS {_quote_ident(alias)}\n"
+                f"FROM {self.table}{self._where(clauses + [f'{_quote_ident(metric)} IS NOT NULL'])}\n"
+                f"GROUP BY {_quote_ident(key)}\nORDER BY {_quote_ident(alias)} {direction}\nLIMIT {n}"
+            )
+            return TemplateMatch("top_n", sql, params)
+
+        group = self.resolve_column(re.sub(r"(?<=[a-z])s$", "", entity), numeric=False)
+        if group is None or not m.group("agg"):
+            return None
+        agg = AGGREGATES[m.group("agg")]
+        alias = f"{agg.lower()}_{metric}"
+        sql = (
+            f"SELECT {_quote_ident(group)}, ROUND({agg}({_quote_ident(metric)}), 2) AS {_quote_ident(alias)}\n"
+            f"FROM {self.table}{self._where(clauses)}\nGROUP BY {_quote_ident(group)}\n"
+            f"ORDER BY 2 {direction} NULLS LAST\nLIMIT {n}"
+        )
+        return TemplateMatch("top_n", sql, params)
+
+    def _build_aggregate_by(self, m: re.Match) -> Optional[TemplateMatch]:
+        metric = self.resolve_column(m.group("metric"), numeric=True)
+        group = self.resolve_column(m.group("group"), numeric=False)
+        filters = self._parse_filters(m.group("filters"))
+        if metric is None or group is None or filters is None:
+            return None
+        clauses, params = filters
+        agg = AGGREGATES[m.group("agg")]
+        alias = f"{agg.lower()}_{metric}"
+        sql = (
+            f"SELECT {_quote_ident(group)}, ROUND({agg}({_quote_ident(metric)}), 2) AS {_quote_ident(alias)}\n"
+            f"FROM {self.table}{self._where(clauses)}\nGROUP BY {_quote_ident(group)}\nORDER BY 2 DESC NULLS LAST"
+        )
+        return TemplateMatch("aggregate_by", sql, params)
+
+    def _build_distribution(self, m: re.Match) -> Optional[TemplateMatch]:
+        column = self.resolve_column(m.group("col_a") or m.group("col_b"), numeric=False)
+        filters = self._parse_filters(m.group("filters"))
+        if column is None or filters is None:
+            return None
+        clauses, params = filters
+        sql = (
+            f"SELECT {_quote_ident(column)}, COUNT(*) AS count,\n"
+            f"       ROUND(100.0 * COUNT(*) / SUM(COUNT(*)) OVER (), 2) AS percentage\n"
+            f"FROM {self.table}{self._where(clauses)}\nGROUP BY {_quote_ident(column)}\nORDER BY count DESC"
+        )
+        return TemplateMatch("distribution", sql, params)
+
+    def _build_count(self, m: re.Match) -> Optional[TemplateMatch]:
+        filters = self._parse_filters(m.group("filters"))
+        if filters is None:
+            return None
+        clauses, params = filters
+        select = "COUNT(*) AS row_count"
+        if "PromoID" in self._stats:
+            select = f"COUNT(DISTINCT {_quote_ident('PromoID')}) AS promotion_count, " + select
+        sql = f"SELECT {select}\nFROM {self.table}{self._where(clauses)}"
+        return TemplateMatch("count", sql, params)
+
+    # --- Matching -------------------------------------------------------------
+    def match(self, question: str, record: bool = True) -> Optional[TemplateMatch]:
+        """Return the first template that fully resolves for the question, or None"""
+        text = normalize_template_question(question)
+        for template in self.templates:
+            m = template.pattern.match(text)
+            if not m:
+                continue
+            try:
+                result = template.build(m)
+            except Exception as e:
+                logger.warning(f"[SQL TEMPLATE] {template.name} failed to build: {e}")
+                result = None
+            if result is not None:
+                if record:
+                    self.hits[template.name] += 1
+                    logger.info(f"[SQL TEMPLATE] {template.name} matched")
+                return result
+        if record:
+            self.misses += 1
+        return None
+
+    def hit_rate(self) -> dict:
+        total = sum(self.hits.values()) + self.misses
+        return {
+            "questions": total,
+            "hits": dict(self.hits),
+            "hit_rate": round(sum(self.hits.values()) / total, 4) if total else 0.0,
+        }
+
+
+def questions_from_log(log_file: str) -> List[str]:
+    """SQL tool questions recorded in the agent log"""
+    questions = []
+    pattern = re.compile(r"\[SQL QUESTION\] (.+)$")
+    with open(log_file, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            m = pattern.search(line.rstrip("\n"))
+            if m:
+                questions.append(m.group(1).strip())
+    return questions
+
+
+def hit_rate_report(library: SQLTemplateLibrary, questions: List[str], show_misses: int = 20) -> str:
+    """Text report of how many logged questions a template would have answered"""
+    hits: Counter = Counter()
+    misses: Counter = Counter()
+    for question in questions:
+        result = library.match(question, record=False)
+        if result is None:
+            misses[normalize_template_question(question)] += 1
+        else:
+            hits[result.template] += 1
+
+    total = len(questions)
+    matched = sum(hits.values())
+    lines = [
+        f"Questions in log: {total}",
+        f"Template hits:    {matched} ({matched / total:.1%})" if total else "Template hits:    0",
+    ]
+    for name, count in hits.most_common():
+        lines.append(f"  - {name}: {count}")
+    if misses:
+        lines.append(f"Most frequent unmatched questions (top {show_misses}):")
+        for question, count in misses.most_common(show_misses):
+            lines.append(f"  {count:>4}  {question}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    import duckdb
+    from column_stats import ColumnStatsCatalog
+
+    parser = argparse.ArgumentParser(description="Template hit-rate report over the agent query log")
+    parser.add_argument("--log", default=Config.LOG_FILE, help="Agent log file to scan")
+    parser.add_argument("--db", default=Config.DUCKDB_PATH, help="DuckDB database with the promotions table")
+    args = parser.parse_args()
+
+    conn = duckdb.connect(args.db, read_only=True)
+    stats = ColumnStatsCatalog(conn, None)
+    stats.build()
+    print(hit_rate_report(SQLTemplateLibrary(stats), questions_from_log(args.log)))
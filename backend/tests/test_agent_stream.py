@@ -0,0 +1,52 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from agent import PromotionAnalysisAgent
+
+_PLANNER = {"langgraph_node": "agent"}
+
+
+class _ScriptedGraph:
+    """Planner thinks aloud, calls a tool, then answers"""
+
+    async def astream(self, graph_input, config, stream_mode):
+        yield "messages", (AIMessageChunk(content="Let me check."), _PLANNER)
+        yield "messages", (AIMessageChunk(content="", tool_call_chunks=[
+            {"name": "SQL_Query", "args": "{}", "id": "1", "index": 0}]), _PLANNER)
+        yield "updates", {"agent": {"messages": [
+            AIMessage(content="Let me check.", tool_calls=[{"name": "SQL_Query", "args": {}, "id": "1"}])]}}
+        yield "updates", {"tools": {"messages": []}}
+        yield "messages", (AIMessageChunk(content="Answer "), _PLANNER)
+        yield "messages", (AIMessageChunk(content="42"), _PLANNER)
+        yield "updates", {"agent": {"messages": [AIMessage(content="Answer 42")]}}
+
+
+def _agent(remembered: list) -> PromotionAnalysisAgent:
+    agent = object.__new__(PromotionAnalysisAgent)
+    agent.agent = _ScriptedGraph()
+    agent.checkpointer = None
+    agent._run_config = lambda thread_id: {}
+    agent._answer_cache_applies = lambda: False
+    agent._start_thread = agent._finish_thread = lambda *args: None
+    agent._remember_answer = lambda question, text, embedding, tool_messages: remembered.append(text)
+
+    async def compose(question):
+        return question
+    agent._acompose_input = compose
+    return agent
+
+
+async def _collect(agent):
+    return [event async for event in agent._query_stream("What is the answer?")]
+
+
+def test_planner_text_before_a_tool_call_is_retracted():
+    remembered = []
+    events = asyncio.run(_collect(_agent(remembered)))
+    kinds = [event["type"] for event in events]
+    assert kinds.index("reset") < kinds.index("status")
+    after_reset = [e["content"] for e in events[kinds.index("reset"):] if e["type"] == "content"]
+    assert after_reset == ["Answer ", "42"]
+    assert events[-1]["content"] == "Answer 42"
+    assert remembered == ["Answer 42"]
@@ -0,0 +1,61 @@
+import time
+
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import InMemorySaver
+
+from checkpoints import CheckpointThreads, create_checkpointer
+
+
+def _checkpoint(saver, thread_id):
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    saver.put(config, empty_checkpoint(), {}, {})
+
+
+def _has_checkpoint(saver, thread_id):
+    return saver.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}) is not None
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def saver(request, tmp_path):
+    if request.param == "memory":
+        return InMemorySaver()
+    return create_checkpointer(str(tmp_path / "checkpoints.sqlite"))
+
+
+def test_only_the_owner_can_resume(saver):
+    threads = CheckpointThreads(saver, ttl=60)
+    threads.claim("t1", "user:a@example.com")
+    assert threads.owns("t1", "user:a@example.com")
+    assert not threads.owns("t1", "user:b@example.com")
+    assert not threads.owns("t1", None)
+    assert not threads.owns("unknown", "user:a@example.com")
+
+
+def test_release_deletes_checkpoints(saver):
+    threads = CheckpointThreads(saver, ttl=60)
+    threads.claim("t1", "owner")
+    _checkpoint(saver, "t1")
+    threads.release("t1")
+    assert not _has_checkpoint(saver, "t1")
+    assert not threads.owns("t1", "owner")
+
+
+def test_sweep_expires_unfinished_runs(saver):
+    threads = CheckpointThreads(saver, ttl=0.05)
+    threads.claim("failed", "owner")
+    _checkpoint(saver, "failed")
+    time.sleep(0.1)
+    threads.claim("running", "owner")
+    _checkpoint(saver, "running")
+    assert threads.sweep() == 1
+    assert not _has_checkpoint(saver, "failed")
+    assert not threads.owns("failed", "owner")
+    assert _has_checkpoint(saver, "running")
+
+
+def test_sweep_drops_unregistered_sqlite_checkpoints(tmp_path):
+    saver = create_checkpointer(str(tmp_path / "checkpoints.sqlite"))
+    _checkpoint(saver, "orphan")
+    CheckpointThreads(saver, ttl=60)
+    assert not _has_checkpoint(saver, "orphan")
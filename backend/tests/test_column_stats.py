@@ -0,0 +1,73 @@
+import duckdb
+import pytest
+
+from column_stats import ColumnStatsCatalog
+
+
+@pytest.fixture
+def catalog():
+    conn = duckdb.connect()
+    conn.execute("""
+        CREATE TABLE promotions AS SELECT * FROM (VALUES
+            ('SEA', 'Nestlé', 1.0),
+            ('Europe', 'Unilever', 2.0),
+            ('LATAM', 'Nestlé', 3.0)
+        ) t(Region, Brand, Sales)
+    """)
+    catalog = ColumnStatsCatalog(conn, "v1")
+    catalog.build()
+    yield catalog
+    conn.close()
+
+
+def test_corrects_mis_cased_literal(catalog):
+    sql, notes = catalog.fix_literals("SELECT * FROM promotions WHERE Region = 'sea'")
+    assert sql == "SELECT * FROM promotions WHERE Region = 'SEA'"
+    assert notes == ["Corrected Region value 'sea' to 'SEA'."]
+
+
+def test_corrects_in_list_literals(catalog):
+    sql, _ = catalog.fix_literals("SELECT * FROM promotions WHERE Region IN ('europe', 'Latam')")
+    assert sql == "SELECT * FROM promotions WHERE Region IN ('Europe', 'LATAM')"
+
+
+def test_corrects_literals_after_non_ascii_text(catalog):
+    sql, _ = catalog.fix_literals("SELECT 'ééé' AS x, * FROM promotions WHERE Brand = 'Nestlé' AND Region = 'sea'")
+    assert sql == "SELECT 'ééé' AS x, * FROM promotions WHERE Brand = 'Nestlé' AND Region = 'SEA'"
+
+
+def test_corrects_misspelling_to_accented_value(catalog):
+    sql, _ = catalog.fix_literals("SELECT * FROM promotions WHERE Brand = 'nestle'")
+    assert sql == "SELECT * FROM promotions WHERE Brand = 'Nestlé'"
+
+
+def test_leaves_known_values_alone(catalog):
+    sql = "SELECT * FROM promotions WHERE Region = 'SEA' AND Brand <> 'Unilever'"
+    assert catalog.fix_literals(sql) == (sql, [])
+
+
+def test_reports_unmatched_literal(catalog):
+    sql = "SELECT * FROM promotions WHERE Region = 'Antarctica'"
+    fixed, notes = catalog.fix_literals(sql)
+    assert fixed == sql
+    assert notes and "does not occur in Region" in notes[0]
+
+
+def test_notes_numeric_literal_outside_range(catalog):
+    sql = "SELECT * FROM promotions WHERE Sales = 99"
+    assert catalog.fix_literals(sql) == (sql, ["Sales = 99 is outside the data range 1.0..3.0."])
+
+
+def test_categorical_values_cover_enumerated_text_columns(catalog):
+    assert sorted(catalog.categorical_values()) == ["Europe", "LATAM", "Nestlé", "SEA", "Unilever"]
+
+
+def test_corrects_literals_qualified_by_table_alias(catalog):
+    sql, _ = catalog.fix_literals("SELECT * FROM promotions p WHERE p.Region = 'sea'")
+    assert sql == "SELECT * FROM promotions p WHERE p.Region = 'SEA'"
+
+
+def test_ignores_same_named_columns_of_other_tables(catalog):
+    catalog.conn.execute("CREATE TABLE targets AS SELECT 'APAC' AS Region")
+    sql = "SELECT * FROM promotions p JOIN targets t ON true WHERE t.Region = 'APAC'"
+    assert catalog.fix_literals(sql) == (sql, [])
@@ -0,0 +1,106 @@
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from query_cache import AnswerCache, ResultCache, SemanticSQLCache, canonicalize_sql, compile_vocabulary, question_literals
+from utils import fetch_arrow
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect()
+    conn.execute("CREATE TABLE sales (region VARCHAR, year INTEGER, id INTEGER, amount DOUBLE)")
+    yield conn
+    conn.close()
+
+
+def test_equivalent_queries_share_a_key(conn):
+    assert canonicalize_sql(conn, "select p.id from sales p where p.region='SEA' and p.year=2024") == \
+        canonicalize_sql(conn, "SELECT id FROM sales WHERE year = 2024 AND region = 'SEA'")
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM sales WHERE year = year(current_date)",
+    "SELECT id, now() AS at FROM sales",
+    "SELECT * FROM sales WHERE year = year(today())",
+    "SELECT * FROM sales ORDER BY random() LIMIT 5",
+    "SELECT gen_random_uuid(), id FROM sales",
+    "SELECT * FROM sales USING SAMPLE 10%",
+])
+def test_volatile_queries_are_not_cacheable(conn, sql):
+    assert canonicalize_sql(conn, sql) is None
+
+
+def test_consistent_alias_renaming_shares_a_key(conn):
+    assert canonicalize_sql(conn, "SELECT a.id FROM sales a JOIN sales b ON a.region = b.region") == \
+        canonicalize_sql(conn, "SELECT x.id FROM sales x JOIN sales z ON x.region = z.region")
+
+
+def test_self_join_direction_changes_the_key(conn):
+    forward = "SELECT cur.region FROM sales cur JOIN sales prev ON cur.region = prev.region AND cur.year = prev.year + 1"
+    backward = "SELECT cur.region FROM sales cur JOIN sales prev ON prev.region = cur.region AND prev.year = cur.year + 1"
+    assert canonicalize_sql(conn, forward) != canonicalize_sql(conn, backward)
+
+
+def test_self_join_select_order_changes_the_key(conn):
+    assert canonicalize_sql(conn, "SELECT a.id, b.id FROM sales a JOIN sales b ON a.region = b.region") != \
+        canonicalize_sql(conn, "SELECT b.id, a.id FROM sales a JOIN sales b ON a.region = b.region")
+
+
+def test_self_join_results_are_not_shared(conn):
+    conn.execute("INSERT INTO sales VALUES ('SEA', 2023, 1, 10), ('SEA', 2024, 2, 20)")
+    forward = "SELECT cur.id FROM sales cur JOIN sales prev ON cur.region = prev.region AND cur.year = prev.year + 1"
+    backward = "SELECT cur.id FROM sales cur JOIN sales prev ON prev.region = cur.region AND prev.year = cur.year + 1"
+    cache = ResultCache(max_bytes=1 << 20)
+    cache.set(ResultCache.make_key(canonicalize_sql(conn, forward), "v1"), fetch_arrow(conn.execute(forward)), forward)
+    assert cache.get(ResultCache.make_key(canonicalize_sql(conn, backward), "v1")) is None
+    assert conn.execute(forward).fetchall() != conn.execute(backward).fetchall()
+
+
+def test_dataset_version_is_part_of_the_key(conn):
+    canonical = canonicalize_sql(conn, "SELECT id FROM sales")
+    cache = ResultCache(max_bytes=1 << 20)
+    cache.set(ResultCache.make_key(canonical, "v1"), pa.table({"id": [1]}), "SELECT id FROM sales")
+    assert cache.get(ResultCache.make_key(canonical, "v2")) is None
+    assert cache.get(ResultCache.make_key(canonical, "v1")) is not None
+
+
+def test_non_select_is_not_cacheable(conn):
+    assert canonicalize_sql(conn, "SELECT 1; SELECT 2") is None
+
+
+class _KeywordEmbeddings:
+    """Embeds every question about uplift to the same vector"""
+
+    def embed_query(self, text):
+        return [1.0, 0.0] if "uplift" in text.lower() else [0.0, 1.0]
+
+
+def test_question_literals_include_known_categorical_values():
+    vocabulary = compile_vocabulary(["SEA", "Europe", "Modern Trade"])
+    assert question_literals("Uplift in SEA for modern trade", vocabulary) == {"sea", "modern trade"}
+    assert question_literals("Uplift in seasonal lines", vocabulary) == frozenset()
+
+
+def test_sql_cache_does_not_reuse_sql_across_categorical_values():
+    cache = SemanticSQLCache(_KeywordEmbeddings(), threshold=0.9)
+    cache.set_vocabulary(["SEA", "Europe"])
+    cache.store("What was the uplift in SEA?", "SELECT 1", "fp")
+    assert cache.lookup("Show the uplift in Europe", "fp")[0] is None
+    assert cache.lookup("Show the uplift in SEA", "fp")[0] == "SELECT 1"
+
+
+def test_sql_cache_relabels_entries_when_vocabulary_arrives():
+    cache = SemanticSQLCache(_KeywordEmbeddings(), threshold=0.9)
+    cache.store("What was the uplift in SEA?", "SELECT 1", "fp")
+    cache.set_vocabulary(["SEA", "Europe"])
+    assert cache.lookup("Show the uplift in Europe", "fp")[0] is None
+
+
+def test_answer_cache_does_not_replay_answers_across_categorical_values():
+    cache = AnswerCache(_KeywordEmbeddings(), threshold=0.9)
+    cache.set_vocabulary(["SEA", "Europe"])
+    cache.store("What was the uplift in SEA?", "SEA answer", "v1", embedding=np.array([1.0, 0.0]))
+    assert cache.lookup("Show the uplift in Europe", "v1")[0] is None
+    assert cache.lookup("Show the uplift in SEA", "v1")[0] == "SEA answer"
@@ -0,0 +1,93 @@
+import time
+
+import duckdb
+import pyarrow as pa
+import pytest
+
+from config import Config
+from sessions import Session, SessionStore, get_session, session_scope
+from utils import fetch_arrow
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect()
+    conn.execute("CREATE TABLE sales AS SELECT range AS id, range % 3 AS region, range * 10.0 AS amount FROM range(30)")
+    yield conn
+    conn.close()
+
+
+def test_results_are_views_private_to_the_session(conn):
+    session, other = Session(conn), Session(conn)
+    view = session.register(fetch_arrow(conn.execute("SELECT region, SUM(amount) AS total FROM sales GROUP BY region")),
+                            "SQL_Query", "sales by region")
+    assert view.name == "result_1"
+    # Follow-ups read the stored result and can still join the base table
+    assert session.conn.execute("SELECT COUNT(*) FROM result_1").fetchone()[0] == 3
+    assert session.conn.execute("SELECT COUNT(*) FROM result_1 JOIN sales USING (region)").fetchone()[0] == 30
+    for connection in (conn, other.conn):
+        with pytest.raises(duckdb.CatalogException):
+            connection.execute("SELECT * FROM result_1")
+
+
+def test_duplicate_column_names_stay_queryable(conn):
+    session = Session(conn)
+    table = fetch_arrow(conn.execute("SELECT a.id, b.id FROM sales a JOIN sales b ON a.id = b.id + 1"))
+    view = session.register(table, "SQL_Query", "pairs")
+    assert view.table.column_names == ["id", "id_1"]
+    assert session.conn.execute(f"SELECT COUNT(*) FROM {view.name} WHERE id = id_1 + 1").fetchone()[0] == 29
+
+
+def test_oldest_views_are_dropped(conn, monkeypatch):
+    monkeypatch.setattr(Config, "SESSION_MAX_VIEWS", 2)
+    session = Session(conn)
+    for i in range(3):
+        session.register(pa.table({"x": [i]}), "SQL_Query", f"q{i}")
+    assert list(session.results) == ["result_2", "result_3"]
+    with pytest.raises(duckdb.CatalogException):
+        session.conn.execute("SELECT * FROM result_1")
+    assert session.referenced("compare result_1, result_3 and result_30") == ["result_3"]
+
+
+def test_history_keeps_newest_turns_verbatim_and_compacts_older(monkeypatch):
+    monkeypatch.setattr(Config, "SESSION_COMPACT_ANSWER_CHARS", 40)
+    session = Session(duckdb.connect())
+    for i in range(5):
+        session.add_turn(f"question {i}", " ".join(f"answer{i}" for _ in range(60)))
+    full = session.history(token_budget=10_000)
+    assert full.count("Assistant:") == 5 and "omitted" not in full
+
+    compact = session.history(token_budget=session.turns[-1].tokens + 2 * session.turns[0].compact_tokens)
+    assert compact.startswith("(2 earlier turns omitted)")
+    assert compact.count("Assistant (abridged):") == 2
+    assert compact.endswith(session.turns[-1].answer)
+    assert "question 0" not in compact and "question 2" in compact
+
+
+def test_store_expires_idle_sessions(conn):
+    store = SessionStore(conn, ttl=0.05, max_sessions=10)
+    session = store.create()
+    assert store.get(session.session_id) is session
+    time.sleep(0.1)
+    assert store.get(session.session_id) is None
+    store.create()
+    assert store.stats()["sessions"] == 1
+
+
+def test_store_evicts_least_recently_used_beyond_limit(conn):
+    store = SessionStore(conn, ttl=60, max_sessions=2)
+    first, second = store.create(), store.create()
+    store.get(first.session_id)
+    store.create()
+    assert store.get(second.session_id) is None
+    assert store.get(first.session_id) is first
+    assert store.delete(first.session_id)
+    assert not store.delete(first.session_id)
+
+
+def test_session_scope():
+    session = Session(duckdb.connect())
+    assert get_session() is None
+    with session_scope(session):
+        assert get_session() is session
+    assert get_session() is None
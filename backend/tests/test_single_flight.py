@@ -0,0 +1,137 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from single_flight import SingleFlight, StreamSingleFlight
+from utils import cancellation_scope, get_cancellation
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(flight.do, "q", work) for _ in range(4)]
+        while flight.stats()["coalesced"] < 3:
+            threading.Event().wait(0.01)
+        release.set()
+        results = [f.result(5) for f in futures]
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert all(result == "answer" for result, _ in results)
+    assert flight.stats() == {"in_flight": 0, "executions": 1, "coalesced": 3}
+
+
+def test_errors_reach_every_caller_and_later_calls_run_again():
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do("q", lambda: (_ for _ in ()).throw(ValueError("boom")))
+    assert flight.do("q", lambda: 42) == (42, False)
+    assert flight.stats()["executions"] == 2
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == (1, False)
+    assert flight.do("b", lambda: 2) == (2, False)
+
+
+def test_cancelled_execution_is_not_joined_by_new_callers():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    scopes = []
+
+    def work():
+        started.set()
+        release.wait(5)
+        return "cancelled" if get_cancellation().cancelled else "stale"
+
+    def leader():
+        with cancellation_scope() as scope:
+            scopes.append(scope)
+            return flight.do("q", work)
+
+    with ThreadPoolExecutor(1) as pool:
+        abandoned = pool.submit(leader)
+        started.wait(5)
+        scopes[0].cancel()  # The only caller disconnects
+        assert flight.do("q", lambda: "fresh") == ("fresh", False)
+        release.set()
+        assert abandoned.result(5) == ("cancelled", False)
+
+
+def _stream(events, gate=None):
+    async def start():
+        for event in events:
+            if gate is not None:
+                await gate.wait()
+            yield event
+    return start
+
+
+def test_stream_subscribers_receive_every_event():
+    async def main():
+        flight = StreamSingleFlight()
+        gate = asyncio.Event()
+        events = [{"type": "content", "content": "a"}, {"type": "done", "content": "a"}]
+        start = _stream(events, gate)
+
+        async def collect():
+            return [e async for e in flight.subscribe("q", start)]
+
+        first = asyncio.create_task(collect())
+        await asyncio.sleep(0)
+        second = asyncio.create_task(collect())
+        await asyncio.sleep(0)
+        gate.set()
+        return await first, await second, flight.stats()
+
+    first, second, stats = asyncio.run(main())
+    assert first == second == [{"type": "content", "content": "a"}, {"type": "done", "content": "a"}]
+    assert stats == {"in_flight": 0, "executions": 1, "coalesced": 1}
+
+
+def test_stream_is_cancelled_when_every_subscriber_leaves():
+    async def main():
+        flight = StreamSingleFlight()
+        finished = []
+
+        async def start():
+            try:
+                yield {"type": "run"}
+                await asyncio.sleep(5)
+                yield {"type": "done"}
+            finally:
+                finished.append(True)
+
+        events = flight.subscribe("q", start)
+        assert (await events.__anext__())["type"] == "run"
+        await events.aclose()
+        await asyncio.sleep(0.01)
+        return finished, flight.stats()
+
+    finished, stats = asyncio.run(main())
+    assert finished == [True]
+    assert stats["in_flight"] == 0
+
+
+def test_stream_failure_becomes_an_error_event():
+    async def main():
+        async def start():
+            yield {"type": "run"}
+            raise RuntimeError("model down")
+
+        return [e async for e in StreamSingleFlight().subscribe("q", start)]
+
+    events = asyncio.run(main())
+    assert events[-1]["type"] == "error"
+    assert "model down" in events[-1]["message"]
@@ -0,0 +1,82 @@
+import duckdb
+import pyarrow as pa
+import pytest
+
+from config import Config
+from sql_guard import SQLGuard, SQLGuardError
+
+
+class GuardConfig(Config):
+    TABLE_NAME = "sales"
+    SQL_GUARD_MAX_ESTIMATED_ROWS = 1_000_000
+    SQL_GUARD_MAX_RESULT_ROWS = 100
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect()
+    conn.execute("CREATE TABLE sales AS SELECT range AS id, range % 7 AS region FROM range(20000)")
+    conn.execute("CREATE TABLE regions AS SELECT range AS region FROM range(7)")
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def guard(conn):
+    return SQLGuard(conn, GuardConfig)
+
+
+def test_accepts_catalog_tables_and_ctes(guard):
+    guard.check("WITH r AS (SELECT region FROM regions) SELECT COUNT(*) FROM main.sales JOIN r USING (region)")
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM '/etc/passwd'",
+    "SELECT * FROM '/tmp/secret.csv'",
+    "SELECT * FROM 'https://example.com/data.parquet'",
+    "SELECT * FROM sales JOIN 'other.parquet' USING (id)",
+    "SELECT * FROM other_schema.sales",
+])
+def test_rejects_replacement_scans_and_unknown_tables(guard, sql):
+    with pytest.raises(SQLGuardError, match="Unknown table"):
+        guard.check(sql)
+
+
+def test_rejects_blocked_functions(guard):
+    with pytest.raises(SQLGuardError, match="not allowed"):
+        guard.check("SELECT * FROM read_csv('/etc/passwd')")
+
+
+def test_rejects_writes(guard):
+    with pytest.raises(SQLGuardError):
+        guard.check("DELETE FROM sales")
+
+
+def test_session_views_are_visible_on_their_connection(conn, guard):
+    session_conn = conn.cursor()
+    session_conn.register("result_1", pa.table({"id": [1, 2]}))
+    guard.check("SELECT * FROM result_1", session_conn)
+    with pytest.raises(SQLGuardError, match="Unknown table"):
+        guard.check("SELECT * FROM result_1")
+
+
+def test_rejects_large_cross_product(guard):
+    with pytest.raises(SQLGuardError, match="cross join"):
+        guard.check("SELECT COUNT(*) FROM sales a, sales b")
+
+
+def test_rejects_large_unestimated_nested_loop_join(guard):
+    with pytest.raises(SQLGuardError, match="cross join"):
+        guard.check("SELECT COUNT(*) FROM sales a JOIN sales b ON a.id + b.id > 5 OR a.region = b.id")
+
+
+def test_allows_small_cross_product(guard):
+    guard.check("SELECT COUNT(*) FROM sales, regions")
+
+
+def test_injects_limit_for_large_results(guard):
+    guarded = guard.check("SELECT * FROM sales")
+    assert guarded.sql.endswith("LIMIT 100")
+    assert guarded.notes
+    assert guard.check("SELECT * FROM sales LIMIT 5").sql == "SELECT * FROM sales LIMIT 5"
+    assert guard.check("SELECT COUNT(*) FROM sales").sql == "SELECT COUNT(*) FROM sales"
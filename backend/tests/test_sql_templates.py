@@ -0,0 +1,41 @@
+import duckdb
+import pytest
+
+from column_stats import ColumnStatsCatalog
+from sql_templates import SQLTemplateLibrary
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect()
+    conn.execute("""
+        CREATE TABLE promotions AS SELECT * FROM (VALUES
+            ('P1', 'SEA', 2024, 100.0, 1.5),
+            ('P1', 'Europe', 2024, 100.0, 1.5),
+            ('P2', 'SEA', 2024, 150.0, 0.8),
+            ('P3', 'LATAM', 2025, 30.0, 2.0)
+        ) t(PromoID, Region, Promo_Year, Sales_Value, ROI_PromoID)
+    """)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def templates(conn):
+    catalog = ColumnStatsCatalog(conn, "v1")
+    catalog.build()
+    return SQLTemplateLibrary(catalog)
+
+
+def test_top_promotions_roll_up_each_promotion_once(conn, templates):
+    match = templates.match("top 2 promotions by total sales value in 2024")
+    rows = conn.execute(match.render()).fetchall()
+    assert [(row[0], row[-1]) for row in rows] == [("P1", 200.0), ("P2", 150.0)]
+
+
+def test_top_promotions_without_aggregate_go_to_the_llm(templates):
+    assert templates.match("top 10 promotions by sales value") is None
+
+
+def test_roi_resolves_to_promotion_roi(templates):
+    assert templates.resolve_column("roi", numeric=True) == "ROI_PromoID"
@@ -0,0 +1,53 @@
+from datetime import date
+
+import duckdb
+import pytest
+
+from config import Config
+from timeline import TimelineIndex
+
+
+class TimelineConfig(Config):
+    TABLE_NAME = "promotions"
+    INTERVAL_START_COLUMN = "Start"
+    INTERVAL_END_COLUMN = "End"
+    TIMELINE_ATTRIBUTE_COLUMNS = ["Region"]
+    DATE_FORMAT = "%Y-%m-%d"
+    TIMELINE_MAX_BARS = 2
+    TIMELINE_LIMIT_MAX = 10
+
+
+@pytest.fixture
+def timeline():
+    conn = duckdb.connect()
+    conn.execute("""
+        CREATE TABLE promotions AS SELECT * FROM (VALUES
+            ('SEA', '2024-01-01', '2024-01-31'),
+            ('SEA', '2024-02-10', '2024-03-10'),
+            ('EU',  '2024-03-01', '2024-03-05'),
+            ('EU',  '2024-06-01', '2024-06-30')
+        ) t(Region, "Start", "End")
+    """)
+    index = TimelineIndex(conn, TimelineConfig)
+    index.build()
+    yield index
+    conn.close()
+
+
+def test_overlap_and_filters(timeline):
+    result = timeline.query_active(date(2024, 3, 1), date(2024, 3, 31), limit=10)
+    assert result["total"] == 2
+    result = timeline.query_active(date(2024, 3, 1), date(2024, 3, 31), {"Region": "EU"}, limit=10)
+    assert result["total"] == 1
+
+
+def test_default_limit(timeline):
+    result = timeline.query_active(date(2024, 1, 1), date(2024, 12, 31))
+    assert result["total"] == 4
+    assert len(result["bars"]) == 2
+
+
+@pytest.mark.parametrize("limit", [0, -1, 11])
+def test_rejects_out_of_range_limit(timeline, limit):
+    with pytest.raises(ValueError, match="limit"):
+        timeline.query_active(date(2024, 1, 1), date(2024, 12, 31), limit=limit)
@@ -0,0 +1,72 @@
+import threading
+
+import duckdb
+import pytest
+
+from sql_guard import SQLGuardError
+from utils import InstrumentedExecutor, is_transient_error, retry_with_backoff
+
+
+@pytest.mark.parametrize("error", [
+    duckdb.OutOfMemoryException("could not allocate block"),
+    duckdb.BinderException("column not found"),
+    SQLGuardError("rejected"),
+])
+def test_deterministic_errors(error):
+    assert not is_transient_error(error)
+
+
+@pytest.mark.parametrize("error", [
+    duckdb.IOException("could not read"),
+    duckdb.TransactionException("conflict"),
+    TimeoutError(),
+])
+def test_transient_errors(error):
+    assert is_transient_error(error)
+
+
+def test_out_of_memory_is_not_retried():
+    calls = []
+
+    @retry_with_backoff(max_retries=5, delay=0)
+    def run():
+        calls.append(1)
+        raise duckdb.OutOfMemoryException("could not allocate block")
+
+    with pytest.raises(duckdb.OutOfMemoryException):
+        run()
+    assert len(calls) == 1
+
+
+def test_transient_errors_are_retried():
+    calls = []
+
+    @retry_with_backoff(max_retries=3, delay=0)
+    def run():
+        calls.append(1)
+        if len(calls) < 3:
+            raise duckdb.IOException("could not read")
+        return "ok"
+
+    assert run() == "ok"
+    assert len(calls) == 3
+
+
+def test_instrumented_executor_counts_queued_and_running_calls():
+    executor = InstrumentedExecutor(max_workers=1)
+    started, release = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    futures = [executor.submit(block), executor.submit(block), executor.submit(block)]
+    started.wait(5)
+    assert (executor.queued, executor.running) == (2, 1)
+    assert futures[2].cancel()
+    assert executor.queued == 1
+    release.set()
+    for future in futures[:2]:
+        future.result(5)
+    executor.shutdown()
+    assert (executor.queued, executor.running) == (0, 0)
@@ -0,0 +1,180 @@
+"""
+Sorted interval index over promotion date ranges for timeline and overlap queries
+"""
+import duckdb
+from datetime import date
+from typing import Dict, List, Optional
+from config import Config
+from utils import dataframe_to_records
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TimelineIndex:
+    """Interval table of promotion bars, sorted by start date at ingestion time.
+
+    DuckDB keeps min/max zone maps per row group, so physically ordering the
+    table by ``start_date`` turns ``start_date <= :end`` into a range scan. The
+    longest promotion duration is recorded at build time and used as a lower
+    bound on ``start_date``, which makes the whole overlap predicate prunable.
+    """
+
+    BUCKETS = {"day", "week", "month", "quarter", "year"}
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection, config: Config = Config):
+        self.conn = conn
+        self.config = config
+        self.table_name = config.INTERVAL_TABLE_NAME
+        self.attribute_columns: List[str] = []
+        self.max_duration_days = 0
+
+    def build(self):
+        """Create the interval table from the promotions table"""
+        logger.info(f"Building interval index '{self.table_name}'...")
+        existing = {
+            row[0] for row in self.conn.execute(f"""
+                SELECT column_name
+                FROM information_schema.columns
+                WHERE table_name = '{self.config.TABLE_NAME}'
+            """).fetchall()
+        }
+        start_col, end_col = self.config.INTERVAL_START_COLUMN, self.config.INTERVAL_END_COLUMN
+        if start_col not in existing or end_col not in existing:
+            logger.warning(f"Interval columns {start_col}/{end_col} missing, skipping interval index")
+            return
+
+        self.attribute_columns = [c for c in self.config.TIMELINE_ATTRIBUTE_COLUMNS if c in existing]
+        attrs = ", ".join(f'"{c}"' for c in self.attribute_columns)
+        attrs_select = f"{attrs}, " if attrs else ""
+
+        self.conn.execute(f"""
+            CREATE OR REPLACE TABLE {self.table_name} AS
+            WITH parsed AS (
+                SELECT
+                    {attrs_select}
+                    CAST(TRY_STRPTIME(CAST("{start_col}" AS VARCHAR), '{self.config.DATE_FORMAT}') AS DATE) AS start_date,
+                    CAST(TRY_STRPTIME(CAST("{end_col}" AS VARCHAR), '{self.config.DATE_FORMAT}') AS DATE) AS end_date
+                FROM {self.config.TABLE_NAME}
+            )
+            SELECT {attrs_select}start_date, end_date, COUNT(*) AS row_count
+            FROM parsed
+            WHERE start_date IS NOT NULL AND end_date IS NOT NULL AND end_date >= start_date
+            GROUP BY ALL
+            ORDER BY start_date, end_date
+        """)
+
+        count, max_duration = self.conn.execute(f"""
+            SELECT COUNT(*), COALESCE(MAX(end_date - start_date), 0)
+            FROM {self.table_name}
+        """).fetchone()
+        self.max_duration_days = int(max_duration)
+        logger.info(
+            f"Interval index '{self.table_name}' built with {count} bars "
+            f"(max duration {self.max_duration_days} days)"
+        )
+
+    def describe(self) -> str:
+        """Schema description of the interval table for SQL generation"""
+        if not self.attribute_columns and not self.max_duration_days:
+            return ""
+        desc = f"\nTable: {self.table_name} (one row per promotion bar, sorted by start_date)\nColumns:\n"
+        for col in self.attribute_columns:
+            desc += f"  - {col}\n"
+        desc += "  - start_date (DATE)\n  - end_date (DATE)\n  - row_count (BIGINT)\n"
+        desc += (
+            f"Use {self.table_name} for 'active/running between' questions: "
+            f"start_date <= <range_end> AND end_date >= <range_start> "
+            f"AND start_date >= <range_start> - INTERVAL {self.max_duration_days} DAY\n"
+        )
+        return desc
+
+    def _where(self, start: date, end: date, filters: Optional[Dict]) -> tuple:
+        """Overlap predicate plus equality filters on attribute columns"""
+        clauses = [
+            "start_date <= ?",
+            "end_date >= ?",
+            f"start_date >= CAST(? AS DATE) - INTERVAL {self.max_duration_days} DAY",
+        ]
+        params: list = [end, start, start]
+        for key, value in (filters or {}).items():
+            if key not in self.attribute_columns or value in (None, "", []):
+                continue
+            values = value if isinstance(value, (list, tuple)) else [value]
+            placeholders = ", ".join("?" for _ in values)
+            clauses.append(f'"{key}" IN ({placeholders})')
+            params.extend(values)
+        return " AND ".join(clauses), params
+
+    def query_active(
+        self,
+        start: date,
+        end: date,
+        filters: Optional[Dict] = None,
+        limit: Optional[int] = None,
+    ) -> Dict:
+        """Return promotion bars overlapping [start, end]"""
+        if limit is None:
+            limit = self.config.TIMELINE_MAX_BARS
+        if not 1 <= limit <= self.config.TIMELINE_LIMIT_MAX:
+            raise ValueError(f"limit must be between 1 and {self.config.TIMELINE_LIMIT_MAX}")
+        where, params = self._where(start, end, filters)
+        cursor = self.conn.cursor()
+        total = cursor.execute(
+            f"SELECT COUNT(*) FROM {self.table_name} WHERE {where}", params
+        ).fetchone()[0]
+        df = cursor.execute(
+            f"""
+            SELECT * FROM {self.table_name}
+            WHERE {where}
+            ORDER BY start_date, end_date
+            LIMIT {int(limit)}
+            """,
+            params,
+        ).fetchdf()
+        df["start_date"] = df["start_date"].astype(str)
+        df["end_date"] = df["end_date"].astype(str)
+        return {"total": int(total), "bars": dataframe_to_records(df)}
+
+    def query_buckets(
+        self,
+        start: date,
+        end: date,
+        bucket: str,
+        filters: Optional[Dict] = None,
+    ) -> Dict:
+        """Count active promotions per time bucket for zoomed-out views"""
+        if bucket not in self.BUCKETS:
+            raise ValueError(f"Unsupported bucket '{bucket}'. Use one of {sorted(self.BUCKETS)}")
+        where, params = self._where(start, end, filters)
+        status_col = "Promotion_Status" if "Promotion_Status" in self.attribute_columns else None
+        status_select = f'CAST(i."{status_col}" AS VARCHAR) AS status, ' if status_col else "NULL AS status, "
+        df = self.conn.cursor().execute(
+            f"""
+            WITH buckets AS (
+                SELECT b AS bucket_start, b + INTERVAL 1 {bucket} - INTERVAL 1 DAY AS bucket_end
+                FROM generate_series(
+                    date_trunc('{bucket}', CAST(? AS DATE)),
+                    CAST(? AS DATE),
+                    INTERVAL 1 {bucket}
+                ) AS t(b)
+            ),
+            visible AS (
+                SELECT * FROM {self.table_name} WHERE {where}
+            )
+            SELECT
+                CAST(b.bucket_start AS DATE) AS bucket_start,
+                CAST(b.bucket_end AS DATE) AS bucket_end,
+                {status_select}
+                COUNT(*) AS active_count
+            FROM buckets b
+            JOIN visible i
+              ON i.start_date <= b.bucket_end AND i.end_date >= b.bucket_start
+            GROUP BY ALL
+            ORDER BY bucket_start, status
+            """,
+            [start, end] + params,
+        ).fetchdf()
+        df["bucket_start"] = df["bucket_start"].astype(str)
+        df["bucket_end"] = df["bucket_end"].astype(str)
+        return {"bucket": bucket, "buckets": dataframe_to_records(df)}
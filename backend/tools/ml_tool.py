@@ -5,16 +5,21 @@ import pandas as pd
 import numpy as np
 from typing import Optional, Dict, Any
 from langchain_core.tools import Tool
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
 from config import Config
+from metrics import record_cache_lookup
+from sessions import get_session
+from tracing import traced
 from utils import (
     QueryLogger,
     cache,
     generate_cache_key,
     timed_execution,
-    get_httpx_client,
     record_tool_usage,
+    get_chat_model,
+    model_routing_telemetry,
+    run_blocking,
+    timed_stage,
 )
 import logging
 
@@ -26,14 +31,9 @@ class MLTool:
     
     def __init__(self, df: pd.DataFrame):
         self.df = df
-        # Create ChatOpenAI with standard OpenAI API
-        http_client = get_httpx_client()
-        self.llm = ChatOpenAI(
-            model=Config.LLM_MODEL,
-            temperature=Config.LLM_TEMPERATURE,
-            openai_api_key=Config.OPENAI_API_KEY,
-            http_client=http_client
-        )
+        self.llm = get_chat_model("interpreter", "ml_analysis")
+        # Scenario extraction is a short structured task; it can run on a smaller model
+        self.extractor_llm = get_chat_model("extractor", "scenario_extraction")
         
         self.analysis_prompt = PromptTemplate(
             input_variables=["query", "data_summary"],
@@ -63,9 +63,9 @@ QUESTION: {query}
 EXTRACTED PARAMETERS (comma-separated key=value pairs):"""
         )
     
-    def _get_statistical_summary(self, filters: Optional[Dict] = None) -> str:
-        """Get statistical summary of data"""
-        df_filtered = self.df.copy()
+    def _get_statistical_summary(self, filters: Optional[Dict] = None, df: Optional[pd.DataFrame] = None) -> str:
+        """Get statistical summary of data (all promotions unless a session result is given)"""
+        df_filtered = (self.df if df is None else df).copy()
         
         # Apply filters if provided
         if filters:
@@ -93,12 +93,12 @@ EXTRACTED PARAMETERS (comma-separated key=value pairs):"""
         
         return summary
     
-    def _statistical_prediction(self, query: str, scenario: Dict) -> str:
+    def _statistical_prediction(self, query: str, scenario: Dict, df: Optional[pd.DataFrame] = None) -> str:
         """Perform statistical prediction without ML training"""
         logger.info("Performing statistical analysis (no ML training required)")
         
         # Get data summary for similar promotions
-        data_summary = self._get_statistical_summary(scenario)
+        data_summary = self._get_statistical_summary(scenario, df)
         
         # Use LLM for interpretation
         prompt = self.analysis_prompt.format(
@@ -109,10 +109,21 @@ EXTRACTED PARAMETERS (comma-separated key=value pairs):"""
         analysis = self.llm.invoke(prompt).content
         
         return f"STATISTICAL ANALYSIS:\n{analysis}\n\nBASED ON:\n{data_summary}"
+
+    async def _astatistical_prediction(self, query: str, scenario: Dict, df: Optional[pd.DataFrame] = None) -> str:
+        """_statistical_prediction with pandas on the tool executor and the analysis awaited"""
+        logger.info("Performing statistical analysis (no ML training required)")
+        data_summary = await run_blocking(self._get_statistical_summary, scenario, df)
+        prompt = self.analysis_prompt.format(
+            query=query,
+            data_summary=data_summary
+        )
+        analysis = (await self.llm.ainvoke(prompt)).content
+        return f"STATISTICAL ANALYSIS:\n{analysis}\n\nBASED ON:\n{data_summary}"
     
     @timed_execution
-    def _ml_prediction(self, query: str, scenario: Dict, target_variable: str) -> str:
-        """Perform ML prediction with AutoML"""
+    def _ml_prediction(self, query: str, scenario: Dict, target_variable: str, df: Optional[pd.DataFrame] = None) -> str:
+        """Perform ML prediction with AutoML, trained on a session result when one is given"""
         logger.info(f"Starting ML model training for target: {target_variable}")
         print(f"\n{'='*80}")
         print(f"[ML TRAINING] Training AutoML model for prediction...")
@@ -124,7 +135,10 @@ EXTRACTED PARAMETERS (comma-separated key=value pairs):"""
             from flaml import AutoML
             
             # Prepare data
-            df_clean = self.df.copy()
+            if df is not None and target_variable not in df.columns:
+                logger.warning(f"Session result has no {target_variable} column, training on all promotions")
+                df = None
+            df_clean = (self.df if df is None else df).copy()
             
             # Select features and target
             # Exclude non-predictive columns
@@ -153,13 +167,14 @@ EXTRACTED PARAMETERS (comma-separated key=value pairs):"""
             
             print("[ML TRAINING] Fitting model... (this will take several minutes)")
             
-            automl.fit(
-                X, y,
-                task="regression",
-                time_budget=Config.ML_TRAINING_TIMEOUT,
-                metric="r2",
-                verbose=0
-            )
+            with timed_stage("ml_training", rows=len(X), features=len(feature_cols), target=target_variable):
+                automl.fit(
+                    X, y,
+                    task="regression",
+                    time_budget=Config.ML_TRAINING_TIMEOUT,
+                    metric="r2",
+                    verbose=0
+                )
             
             print(f"[ML TRAINING] Training complete!")
             print(f"Best model: {automl.best_estimator}")
@@ -216,9 +231,16 @@ This prediction is based on patterns learned from similar promotions in the data
     def _extract_scenario(self, query: str) -> Dict:
         """Extract scenario parameters from query"""
         prompt = self.scenario_extraction_prompt.format(query=query)
-        response = self.llm.invoke(prompt).content.strip()
-        
-        # Parse the response
+        return self._parse_scenario(self.extractor_llm.invoke(prompt).content)
+
+    async def _aextract_scenario(self, query: str) -> Dict:
+        prompt = self.scenario_extraction_prompt.format(query=query)
+        return self._parse_scenario((await self.extractor_llm.ainvoke(prompt)).content)
+
+    @staticmethod
+    def _parse_scenario(response: str) -> Dict:
+        """Parse "key=value, key=value" from the extractor's reply"""
+        response = response.strip()
         scenario = {}
         try:
             pairs = response.split(',')
@@ -324,59 +346,122 @@ This prediction is based on patterns learned from similar promotions in the data
         
         return any(keyword in query_lower for keyword in simple_keywords)
     
+    def _start(self, query: str) -> str:
+        """Announce the tool and return the result cache key"""
+        record_tool_usage("ML TOOL USED")
+        print("[TOOL] ML TOOL USED")
+        logger.info("[TOOL] ML_Prediction invoked")
+        logger.info(f"Processing ML/prediction query: {query}")
+        return generate_cache_key("ml_prediction", query)
+
+    @staticmethod
+    def _session_data(query: str) -> Optional[pd.DataFrame]:
+        """Rows of a session view named in the query, e.g. "forecast uplift for result_2" """
+        session = get_session()
+        names = session.referenced(query) if session is not None else []
+        if not names:
+            return None
+        logger.info(f"Using session view {names[0]} as the data")
+        return session.frame(names[0])
+
+    @staticmethod
+    def _cached_prediction(cache_key: str) -> Optional[str]:
+        if not Config.ML_CACHE_ENABLED:
+            return None
+        hit = cache.has(cache_key)
+        record_cache_lookup("ml", hit)
+        if not hit:
+            return None
+        logger.info("Returning cached prediction")
+        return cache.get(cache_key)
+
+    def _accept_scenario(self, raw_scenario: Dict) -> Dict:
+        scenario = self._normalize_scenario(raw_scenario)
+        # Every extracted key should name a real column
+        model_routing_telemetry.record_outcome("extractor", len(scenario) == len(raw_scenario))
+        logger.info(f"Extracted scenario: {scenario}")
+        return scenario
+
+    def _training_target(self, query: str) -> Optional[str]:
+        """Variable to train a model for, or None when statistical analysis is enough"""
+        # Determine if simple or complex query
+        if self._is_simple_query(query):
+            return None
+        target_var = self._detect_target_variable(query)
+        if not target_var:
+            logger.warning("Could not detect target variable, using statistical analysis")
+        return target_var
+
+    @staticmethod
+    def _error_output(error: Exception) -> str:
+        error_msg = f"Error during ML prediction: {str(error)}"
+        logger.error(error_msg)
+        print(f"\n[ERROR] {error_msg}\n")
+        return error_msg
+
+    @traced("ML_Prediction", kind="tool")
     def run(self, query: str) -> str:
         """Main execution method for the tool"""
         try:
-            record_tool_usage("ML TOOL USED")
-            print("[TOOL] ML TOOL USED")
-            logger.info("[TOOL] ML_Prediction invoked")
-            logger.info(f"Processing ML/prediction query: {query}")
+            cache_key = self._start(query)
+            data = self._session_data(query)
             
-            # Check cache first
-            cache_key = generate_cache_key("ml_prediction", query)
-            if Config.ML_CACHE_ENABLED and cache.has(cache_key):
-                logger.info("Returning cached prediction")
-                return cache.get(cache_key)
+            # Check cache first (predictions over session views are not shared)
+            cached = self._cached_prediction(cache_key) if data is None else None
+            if cached is not None:
+                return cached
             
             # Extract scenario parameters
-            raw_scenario = self._extract_scenario(query)
-            scenario = self._normalize_scenario(raw_scenario)
-            logger.info(f"Extracted scenario: {scenario}")
+            scenario = self._accept_scenario(self._extract_scenario(query))
             
-            # Determine if simple or complex query
-            is_simple = self._is_simple_query(query)
-            
-            if is_simple:
-                # Use statistical analysis
-                result = self._statistical_prediction(query, scenario)
+            target_var = self._training_target(query)
+            if target_var:
+                # Use ML prediction
+                result = self._ml_prediction(query, scenario, target_var, data)
             else:
-                # Detect target variable
-                target_var = self._detect_target_variable(query)
-                
-                if not target_var:
-                    logger.warning("Could not detect target variable, using statistical analysis")
-                    result = self._statistical_prediction(query, scenario)
-                else:
-                    # Use ML prediction
-                    result = self._ml_prediction(query, scenario, target_var)
+                # Use statistical analysis
+                result = self._statistical_prediction(query, scenario, data)
             
             # Cache result
-            if Config.ML_CACHE_ENABLED:
+            if Config.ML_CACHE_ENABLED and data is None:
                 cache.set(cache_key, result)
             
             return result
             
         except Exception as e:
-            error_msg = f"Error during ML prediction: {str(e)}"
-            logger.error(error_msg)
-            print(f"\n[ERROR] {error_msg}\n")
-            return error_msg
+            return self._error_output(e)
+
+    @traced("ML_Prediction", kind="tool")
+    async def arun(self, query: str) -> str:
+        """Coroutine version of run: LLM calls are awaited, pandas work and training run on the tool executor"""
+        try:
+            cache_key = self._start(query)
+            data = await run_blocking(self._session_data, query)
+            cached = self._cached_prediction(cache_key) if data is None else None
+            if cached is not None:
+                return cached
+            
+            scenario = self._accept_scenario(await self._aextract_scenario(query))
+            
+            target_var = self._training_target(query)
+            if target_var:
+                result = await run_blocking(self._ml_prediction, query, scenario, target_var, data)
+            else:
+                result = await self._astatistical_prediction(query, scenario, data)
+            
+            if Config.ML_CACHE_ENABLED and data is None:
+                cache.set(cache_key, result)
+            return result
+            
+        except Exception as e:
+            return self._error_output(e)
     
     def as_tool(self) -> Tool:
         """Convert to LangChain Tool"""
         return Tool(
             name="ML_Prediction",
             func=self.run,
+            coroutine=self.arun,
             description="""Use this tool for predictive analytics, forecasting, and what-if scenario analysis.
 
 Examples:
@@ -3,16 +3,19 @@ RAG Tool for semantic search and retrieval
 """
 from typing import Optional, Dict, List
 from langchain_core.tools import Tool
-from langchain_openai import ChatOpenAI
 from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import PromptTemplate
 from config import Config
+from sessions import get_session
+from tracing import traced
 from utils import (
     QueryLogger,
     parse_date_filter,
     timed_execution,
-    get_httpx_client,
     record_tool_usage,
+    get_chat_model,
+    timed_stage,
+    run_blocking,
 )
 import logging
 
@@ -24,14 +27,7 @@ class RAGTool:
     
     def __init__(self, vectorstore: FAISS):
         self.vectorstore = vectorstore
-        # Create ChatOpenAI with standard OpenAI API
-        http_client = get_httpx_client()
-        self.llm = ChatOpenAI(
-            model=Config.LLM_MODEL,
-            temperature=Config.LLM_TEMPERATURE,
-            openai_api_key=Config.OPENAI_API_KEY,
-            http_client=http_client
-        )
+        self.llm = get_chat_model("interpreter", "interpretation")
         
         self.interpretation_prompt = PromptTemplate(
             input_variables=["query", "results"],
@@ -54,6 +50,19 @@ ANALYSIS:"""
     @timed_execution
     def search_with_filters(self, query: str, filters: Optional[Dict] = None, k: int = None) -> List:
         """Perform semantic search with metadata filtering"""
+        # Embed once and search by vector so embedding and index lookup are timed separately
+        with timed_stage("embedding"):
+            query_vector = self.vectorstore.embeddings.embed_query(query)
+        return self._search_by_vector(query_vector, filters, k)
+
+    @timed_execution
+    async def asearch_with_filters(self, query: str, filters: Optional[Dict] = None, k: int = None) -> List:
+        """search_with_filters with the embedding awaited and the FAISS lookup on the tool executor"""
+        with timed_stage("embedding"):
+            query_vector = await self.vectorstore.embeddings.aembed_query(query)
+        return await run_blocking(self._search_by_vector, query_vector, filters, k)
+
+    def _search_by_vector(self, query_vector: List[float], filters: Optional[Dict] = None, k: int = None) -> List:
         if k is None:
             k = Config.TOP_K_RESULTS
         
@@ -62,7 +71,8 @@ ANALYSIS:"""
             logger.info(f"Searching with filters: {filters}")
             
             # Get all documents and filter manually (FAISS doesn't support complex filtering natively)
-            all_docs = self.vectorstore.similarity_search(query, k=k*3)  # Retrieve more to account for filtering
+            with timed_stage("faiss_search", k=k * 3, filters=filters):
+                all_docs = self.vectorstore.similarity_search_by_vector(query_vector, k=k*3)  # Retrieve more to account for filtering
             
             filtered_docs = []
             for doc in all_docs:
@@ -81,7 +91,8 @@ ANALYSIS:"""
             return filtered_docs
         else:
             # Standard similarity search
-            return self.vectorstore.similarity_search(query, k=k)
+            with timed_stage("faiss_search", k=k):
+                return self.vectorstore.similarity_search_by_vector(query_vector, k=k)
     
     def format_results(self, docs: List) -> str:
         """Format retrieved documents for LLM"""
@@ -100,68 +111,114 @@ ANALYSIS:"""
         
         return formatted
     
+    def _start(self, query: str) -> Optional[Dict]:
+        """Announce the tool and return the date/quarter filters parsed from the query"""
+        record_tool_usage("RAG TOOL USED")
+        print("[TOOL] RAG TOOL USED")
+        logger.info("[TOOL] Semantic_Search invoked")
+        logger.info(f"Performing semantic search for: {query}")
+        
+        # Parse date/quarter filters from query
+        filters = parse_date_filter(query)
+        
+        if filters:
+            logger.info(f"Applying filters: {filters}")
+            print(f"\n{'='*80}")
+            print(f"[RAG SEARCH] Applying filters: {filters}")
+            print(f"{'='*80}\n")
+        return filters
+
+    def _interpretation_prompt_for(self, query: str, filters: Optional[Dict], docs: List) -> Optional[str]:
+        """Log the search and build the interpretation prompt; None when nothing matched"""
+        QueryLogger.log_rag_search(query, docs, filters)
+        
+        if not docs:
+            return None
+        
+        # Format results
+        formatted_results = self.format_results(docs)
+        
+        print(f"\n{'='*80}")
+        print(f"[RAG RESULTS] Retrieved {len(docs)} relevant promotions")
+        print(f"{'='*80}\n")
+        
+        return self.interpretation_prompt.format(
+            query=query,
+            results=formatted_results
+        )
+
+    @staticmethod
+    def _register_result(query: str, docs: List) -> str:
+        """Keep the matched rows as a view of the current session; returns a note for the agent"""
+        session = get_session()
+        if session is None or not docs:
+            return ""
+        try:
+            import pyarrow as pa
+            table = pa.Table.from_pylist([doc.metadata for doc in docs])
+            view = session.register(table, "Semantic_Search", query)
+        except Exception as e:
+            logger.warning(f"Could not keep search results as a session view: {e}")
+            return ""
+        return f"\n\nMatching promotions saved as session view {view.name}; SQL_Query and ML_Prediction can use it by name."
+
+    @staticmethod
+    def _error_output(error: Exception) -> str:
+        import traceback
+        error_msg = f"Error during semantic search: {type(error).__name__}: {str(error)}"
+        logger.error(error_msg)
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        print(f"\n[ERROR] {error_msg}\n")
+        print(f"[TRACEBACK] {traceback.format_exc()}\n")
+        return error_msg
+
+    @traced("Semantic_Search", kind="tool")
     def run(self, query: str) -> str:
         """Main execution method for the tool"""
         try:
-            record_tool_usage("RAG TOOL USED")
-            print("[TOOL] RAG TOOL USED")
-            logger.info("[TOOL] Semantic_Search invoked")
-            logger.info(f"Performing semantic search for: {query}")
-            
-            # Parse date/quarter filters from query
-            filters = parse_date_filter(query)
-            
-            if filters:
-                logger.info(f"Applying filters: {filters}")
-                print(f"\n{'='*80}")
-                print(f"[RAG SEARCH] Applying filters: {filters}")
-                print(f"{'='*80}\n")
+            filters = self._start(query)
             
             # Perform search
             docs = self.search_with_filters(query, filters)
             
-            # Log search
-            QueryLogger.log_rag_search(query, docs, filters)
-            
-            if not docs:
+            prompt = self._interpretation_prompt_for(query, filters, docs)
+            if prompt is None:
                 return "No relevant results found for your query."
             
-            # Format results
-            formatted_results = self.format_results(docs)
+            # Get LLM interpretation
+            interpretation = self.llm.invoke(prompt).content
             
-            print(f"\n{'='*80}")
-            print(f"[RAG RESULTS] Retrieved {len(docs)} relevant promotions")
-            print(f"{'='*80}\n")
+            print(f"[ANALYSIS]\n{interpretation}\n")
             
-            # Get LLM interpretation
-            prompt = self.interpretation_prompt.format(
-                query=query,
-                results=formatted_results
-            )
+            return interpretation + self._register_result(query, docs)
             
-            interpretation = self.llm.invoke(prompt).content
+        except Exception as e:
+            return self._error_output(e)
+
+    @traced("Semantic_Search", kind="tool")
+    async def arun(self, query: str) -> str:
+        """Coroutine version of run: embedding and interpretation are awaited, FAISS runs on the tool executor"""
+        try:
+            filters = self._start(query)
+            docs = await self.asearch_with_filters(query, filters)
             
-            # Combine results with interpretation
-            output = interpretation
+            prompt = self._interpretation_prompt_for(query, filters, docs)
+            if prompt is None:
+                return "No relevant results found for your query."
             
+            interpretation = (await self.llm.ainvoke(prompt)).content
             print(f"[ANALYSIS]\n{interpretation}\n")
-            
-            return output
+            return interpretation + await run_blocking(self._register_result, query, docs)
             
         except Exception as e:
-            import traceback
-            error_msg = f"Error during semantic search: {type(e).__name__}: {str(e)}"
-            logger.error(error_msg)
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            print(f"\n[ERROR] {error_msg}\n")
-            print(f"[TRACEBACK] {traceback.format_exc()}\n")
-            return error_msg
+            return self._error_output(e)
     
     def as_tool(self) -> Tool:
         """Convert to LangChain Tool"""
         return Tool(
             name="Semantic_Search",
             func=self.run,
+            coroutine=self.arun,
             description="""Use this tool for semantic search and finding similar promotions based on descriptions, patterns, or fuzzy matching.
 
 Examples:
@@ -1,18 +1,42 @@
 """
 Text-to-SQL Tool for DuckDB query execution
 """
+import contextlib
 import duckdb
+import json
+import os
+import threading
+import uuid
 from typing import Optional
 from langchain_core.tools import Tool
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
 from config import Config
+from sessions import Session, get_session
+from tracing import traced
+from sql_guard import SQLGuard
+from sql_templates import SQLTemplateLibrary
+from query_cache import (
+    ResultCache,
+    SemanticSQLCache,
+    canonicalize_sql,
+    result_cache,
+    result_store,
+    schema_fingerprint,
+)
 from utils import (
     QueryLogger,
     retry_with_backoff,
     timed_execution,
-    get_httpx_client,
     record_tool_usage,
+    get_chat_model,
+    model_routing_telemetry,
+    timed_stage,
+    fetch_arrow,
+    is_transient_error,
+    get_cancellation,
+    QueryCancelledError,
+    format_result_for_llm,
+    run_blocking,
 )
 import pandas as pd
 import logging
@@ -20,20 +44,37 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+class SQLTimeoutError(Exception):
+    """A query exceeded Config.SQL_QUERY_TIMEOUT and was interrupted"""
+
+
 class SQLTool:
     """Tool for converting natural language to SQL and executing queries"""
     
-    def __init__(self, conn: duckdb.DuckDBPyConnection, schema_description: str):
+    def __init__(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        schema_description: str,
+        sql_cache: Optional[SemanticSQLCache] = None,
+        dataset_version: Optional[str] = None,
+        schema_retriever=None,
+        column_stats=None,
+    ):
         self.conn = conn
         self.schema_description = schema_description
-        # Create ChatOpenAI with standard OpenAI API
-        http_client = get_httpx_client()
-        self.llm = ChatOpenAI(
-            model=Config.LLM_MODEL,
-            temperature=Config.LLM_TEMPERATURE,
-            openai_api_key=Config.OPENAI_API_KEY,
-            http_client=http_client
+        self.schema_retriever = schema_retriever
+        self.column_stats = column_stats
+        self.templates = (
+            SQLTemplateLibrary(column_stats) if column_stats and Config.SQL_TEMPLATES_ENABLED else None
         )
+        self.dataset_version = dataset_version
+        self.sql_cache = sql_cache if Config.SQL_CACHE_ENABLED else None
+        self.schema_fingerprint = schema_fingerprint(conn)
+        self.guard = SQLGuard(conn) if Config.SQL_GUARD_ENABLED else None
+        self._apply_resource_limits()
+        if self.sql_cache:
+            self.sql_cache.invalidate(self.schema_fingerprint)
+        self.llm = get_chat_model("sql", "sql_generation")
         
         self.sql_prompt = PromptTemplate(
             input_variables=["schema", "question"],
@@ -51,92 +92,484 @@ IMPORTANT RULES:
 6. Return SELECT queries only (no INSERT, UPDATE, DELETE)
 7. For comparisons, use proper WHERE clauses
 8. Format numbers properly in output
+9. For "active/running during" date-range questions, query the interval table described in the schema with the overlap predicate it documents instead of parsing Start_Prom/End_Prom text
 
 QUESTION: {question}
 
 SQL QUERY:"""
         )
+
+        self.repair_prompt = PromptTemplate(
+            input_variables=["schema", "question", "sql", "error"],
+            template="""You are a SQL expert. The DuckDB SQL query below failed. Fix it so it answers the question.
+
+DATABASE SCHEMA:
+{schema}
+
+QUESTION: {question}
+
+FAILED SQL:
+{sql}
+
+DUCKDB ERROR:
+{error}
+
+Return ONLY the corrected SQL query, no explanations. Return SELECT queries only.
+
+CORRECTED SQL QUERY:"""
+        )
     
+    def _apply_resource_limits(self):
+        """Cap DuckDB memory, allow spilling to disk and cut off external access.
+
+        DuckDB's memory_limit is a database-wide setting, so this bounds all
+        concurrent queries together rather than each query individually.
+        """
+        try:
+            self.conn.execute(f"SET memory_limit = '{Config.SQL_MEMORY_LIMIT}'")
+            # A rebuild reuses the database instance, whose temp_directory is then locked
+            if self.conn.execute("SELECT current_setting('enable_external_access')").fetchone()[0]:
+                os.makedirs(Config.SQL_TEMP_DIRECTORY, exist_ok=True)
+                self.conn.execute(f"SET temp_directory = '{Config.SQL_TEMP_DIRECTORY}'")
+        except Exception as e:
+            logger.warning(f"Could not apply DuckDB resource limits: {e}")
+        if Config.SQL_DISABLE_EXTERNAL_ACCESS:
+            # Generated SQL must not reach local files, URLs or download extensions. Both
+            # settings are database-wide and cannot be turned back on for this instance.
+            try:
+                self.conn.execute("SET autoinstall_known_extensions = false")
+                self.conn.execute("SET enable_external_access = false")
+            except Exception as e:
+                logger.warning(f"Could not disable DuckDB external access: {e}")
+
+    def _result_cache_key(self, sql_query: str) -> Optional[str]:
+        """Cache key from the canonical AST and dataset version, or None if uncacheable"""
+        if not Config.RESULT_CACHE_ENABLED or not self.dataset_version:
+            return None
+        if self._session_for(sql_query) is not None:
+            # Session views differ between sessions and turns
+            return None
+        try:
+            canonical = canonicalize_sql(self.conn, sql_query)
+        except Exception as e:
+            logger.warning(f"Could not canonicalize SQL for result cache: {e}")
+            return None
+        if canonical is None:
+            return None
+        return ResultCache.make_key(canonical, self.dataset_version)
+
+    @staticmethod
+    def _session_for(text: str) -> Optional[Session]:
+        """The current session when a query (or question) reads its result views, which only its connection can see"""
+        session = get_session()
+        if session is not None and session.referenced(text):
+            return session
+        return None
+
+    def _fetch_with_deadline(self, sql_query: str):
+        """Run a query on its own cursor, interrupting it on timeout or request cancellation"""
+        scope = get_cancellation()
+        if scope and scope.cancelled:
+            raise QueryCancelledError("Request was cancelled before the query started")
+
+        # Queries over session views run on the session's connection, one at a time
+        session = self._session_for(sql_query)
+        cursor = session.conn if session is not None else self.conn.cursor()
+        timed_out = threading.Event()
+
+        def on_timeout():
+            timed_out.set()
+            cursor.interrupt()
+
+        timer = threading.Timer(Config.SQL_QUERY_TIMEOUT, on_timeout)
+        timer.daemon = True
+        with session.lock if session is not None else contextlib.nullcontext():
+            if scope:
+                scope.register(cursor)
+            timer.start()
+            try:
+                with timed_stage("duckdb_execution", sql=sql_query[:2000]) as span:
+                    table = fetch_arrow(cursor.execute(sql_query))
+                    if span is not None:
+                        span.attributes["rows"] = table.num_rows
+                    return table
+            except duckdb.InterruptException as e:
+                if timed_out.is_set():
+                    raise SQLTimeoutError(
+                        f"Query exceeded the {Config.SQL_QUERY_TIMEOUT:g}s time limit and was cancelled"
+                    ) from e
+                raise QueryCancelledError("Query cancelled because the request was cancelled") from e
+            finally:
+                timer.cancel()
+                if scope:
+                    scope.unregister(cursor)
+                if session is None:
+                    cursor.close()
+
     @retry_with_backoff()
     @timed_execution
-    def execute_sql(self, sql_query: str) -> pd.DataFrame:
-        """Execute SQL query with retry logic"""
+    def execute_sql_arrow(self, sql_query: str):
+        """Execute SQL query with retry logic and return a pyarrow Table, serving repeated queries from the result cache"""
         try:
-            result = self.conn.execute(sql_query).fetchdf()
-            return result
+            cache_key = self._result_cache_key(sql_query)
+            if cache_key:
+                entry = result_cache.get(cache_key)
+                if entry is not None:
+                    logger.info("[RESULT CACHE] Hit")
+                    table = entry.table
+                    if entry.sql != sql_query:
+                        # Equivalent query with different output aliases: rebind names only
+                        with self.conn.cursor() as cursor:
+                            described = cursor.execute(f"DESCRIBE {sql_query}").fetchall()
+                        table = table.rename_columns([row[0] for row in described])
+                    return table
+
+            table = self._fetch_with_deadline(sql_query)
+            if cache_key:
+                result_cache.set(cache_key, table, sql_query)
+            return table
         except Exception as e:
             logger.error(f"SQL execution error: {str(e)}")
             raise
+
+    def execute_sql(self, sql_query: str) -> pd.DataFrame:
+        """Execute SQL query with retry logic"""
+        return self.execute_sql_arrow(sql_query).to_pandas()
     
-    def generate_sql(self, question: str) -> str:
+    def schema_for(self, question: str, embedding=None) -> str:
+        """Schema text for the prompt: only the relevant columns when a retriever is configured"""
+        if self.schema_retriever is None:
+            return self._with_session_views(self.schema_description)
+        try:
+            return self._with_session_views(self.schema_retriever.describe(question, embedding))
+        except Exception as e:
+            logger.warning(f"Schema retrieval failed, using full schema: {e}")
+            return self._with_session_views(self.schema_description)
+
+    @staticmethod
+    def _with_session_views(schema: str) -> str:
+        """Append the current session's result views, so follow-ups can refine them instead of rescanning"""
+        session = get_session()
+        views = session.describe_views() if session is not None else ""
+        if not views:
+            return schema
+        return (
+            f"{schema}\n\nSESSION RESULT VIEWS (earlier results of this conversation; "
+            f"query them like tables to refine or combine them):\n{views}"
+        )
+
+    @staticmethod
+    def _clean_sql(text: str) -> str:
+        return text.strip().replace("```sql", "").replace("```", "").strip()
+
+    def generate_sql(self, question: str, embedding=None) -> str:
         """Generate SQL query from natural language"""
         prompt = self.sql_prompt.format(
-            schema=self.schema_description,
+            schema=self.schema_for(question, embedding),
             question=question
         )
         
         response = self.llm.invoke(prompt)
-        sql_query = response.content.strip()
-        
-        # Clean up the SQL query
-        sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
-        
-        return sql_query
+        return self._clean_sql(response.content)
+
+    async def agenerate_sql(self, question: str, embedding=None) -> str:
+        """generate_sql over the async client"""
+        if embedding is None and self.schema_retriever is not None:
+            embedding = await self.schema_retriever.aembed_question(question)
+        prompt = self.sql_prompt.format(
+            schema=self.schema_for(question, embedding),
+            question=question
+        )
+        response = await self.llm.ainvoke(prompt)
+        return self._clean_sql(response.content)
     
+    def _repair_prompt_for(self, question: str, sql_query: str, error: str) -> str:
+        # Full schema here: the failure may be a column the pruned schema left out
+        return self.repair_prompt.format(
+            schema=self._with_session_views(self.schema_description),
+            question=question,
+            sql=sql_query,
+            error=error,
+        )
+
+    def repair_sql(self, question: str, sql_query: str, error: str) -> str:
+        """Ask the LLM to fix SQL that failed with a deterministic DuckDB error"""
+        response = self.llm.invoke(self._repair_prompt_for(question, sql_query, error))
+        return self._clean_sql(response.content)
+
+    async def arepair_sql(self, question: str, sql_query: str, error: str) -> str:
+        """repair_sql over the async client"""
+        response = await self.llm.ainvoke(self._repair_prompt_for(question, sql_query, error))
+        return self._clean_sql(response.content)
+
+    def _guarded_execute(self, sql_query: str) -> tuple:
+        """Fix literals, guard and execute SQL; returns (executed_sql, result_table, notes)"""
+        # Fix literals against known column values before spending a round trip on them
+        notes = []
+        executed_sql = sql_query
+        if self.column_stats:
+            executed_sql, notes = self.column_stats.fix_literals(executed_sql)
+        # Static checks and plan cost run first; rejections are repaired like DuckDB errors
+        if self.guard:
+            session = self._session_for(executed_sql)
+            if session is None:
+                guarded = self.guard.check(executed_sql)
+            else:
+                with session.lock:
+                    guarded = self.guard.check(executed_sql, session.conn)
+            executed_sql = guarded.sql
+            notes = notes + guarded.notes
+        return executed_sql, self.execute_sql_arrow(executed_sql), notes
+
+    def _repairable(self, error: Exception, attempt: int, max_repairs: int) -> bool:
+        """Whether a failed execution goes back to the LLM for a fix"""
+        if isinstance(error, (SQLTimeoutError, QueryCancelledError)):
+            # Not a SQL bug: report to the agent instead of asking the LLM to patch it
+            return False
+        if is_transient_error(error) or attempt >= max_repairs:
+            if max_repairs and not is_transient_error(error):
+                model_routing_telemetry.record_outcome("sql", False)
+            return False
+        logger.warning(
+            f"SQL failed with {type(error).__name__}, repair attempt "
+            f"{attempt + 1}/{max_repairs}: {error}"
+        )
+        return True
+
+    def _execute_with_repair(self, question: str, sql_query: str, max_repairs: Optional[int] = None) -> tuple:
+        """Guard and execute SQL, feeding deterministic errors back to the LLM for a bounded number of fixes.
+
+        Transient errors are retried with backoff inside execute_sql and are
+        re-raised here unchanged. Returns (executed_sql, result_table, notes).
+        """
+        if max_repairs is None:
+            max_repairs = Config.SQL_MAX_REPAIR_ATTEMPTS
+        attempt = 0
+        while True:
+            try:
+                executed_sql, result_table, notes = self._guarded_execute(sql_query)
+            except Exception as e:
+                if not self._repairable(e, attempt, max_repairs):
+                    raise
+                attempt += 1
+                QueryLogger.log_sql_query(sql_query, error=str(e))
+                sql_query = self.repair_sql(question, sql_query, str(e))
+                logger.info(f"Repaired SQL Query:\n{sql_query}")
+                print(f"[SQL REPAIR {attempt}] {sql_query}\n")
+                continue
+            if max_repairs:
+                # Generated SQL that runs without a repair is the SQL model's accuracy signal
+                model_routing_telemetry.record_outcome("sql", attempt == 0)
+            return executed_sql, result_table, notes
+
+    async def _aexecute_with_repair(self, question: str, sql_query: str, max_repairs: Optional[int] = None) -> tuple:
+        """_execute_with_repair with DuckDB on the tool executor and repairs over the async client"""
+        if max_repairs is None:
+            max_repairs = Config.SQL_MAX_REPAIR_ATTEMPTS
+        attempt = 0
+        while True:
+            try:
+                executed_sql, result_table, notes = await run_blocking(self._guarded_execute, sql_query)
+            except Exception as e:
+                if not self._repairable(e, attempt, max_repairs):
+                    raise
+                attempt += 1
+                QueryLogger.log_sql_query(sql_query, error=str(e))
+                sql_query = await self.arepair_sql(question, sql_query, str(e))
+                logger.info(f"Repaired SQL Query:\n{sql_query}")
+                print(f"[SQL REPAIR {attempt}] {sql_query}\n")
+                continue
+            if max_repairs:
+                model_routing_telemetry.record_outcome("sql", attempt == 0)
+            return executed_sql, result_table, notes
+
+    def _start(self, question: str) -> Optional[str]:
+        """Announce the tool and return template SQL when the question matches a known shape"""
+        record_tool_usage("SQL TOOL USED")
+        print("[TOOL] SQL TOOL USED")
+        logger.info("[TOOL] SQL_Query invoked")
+        logger.info(f"[SQL QUESTION] {' '.join(question.split())}")
+        # Common question shapes map straight to template SQL without an LLM call;
+        # questions about session views are not covered by the base-table templates
+        template = self.templates.match(question) if self.templates and not self._session_for(question) else None
+        if template is None:
+            return None
+        sql_query = template.render()
+        if sql_query:
+            logger.info(f"Using template SQL ({template.template}):\n{sql_query}")
+        return sql_query
+
+    @staticmethod
+    def _show_sql(sql_query: str, source: str):
+        print(f"\n{'='*80}")
+        print(f"[SQL QUERY]{source}")
+        print(f"{sql_query}")
+        print(f"{'='*80}\n")
+
+    def _fast_path_failed(self, error: Exception, sql_query: str, cached: bool):
+        """Drop template or cached SQL that no longer works so fresh SQL is generated"""
+        logger.warning(f"{'Cached' if cached else 'Template'} SQL failed, regenerating: {error}")
+        if cached:
+            self.sql_cache.evict(sql_query)
+
+    @staticmethod
+    def _register_result(question: str, sql_query: str, result_table, notes: list):
+        """Keep a non-empty result as a view of the current session and tell the agent its name"""
+        session = get_session()
+        if session is None or result_table.num_rows == 0:
+            return
+        try:
+            view = session.register(result_table, "SQL_Query", question, sql_query)
+        except Exception as e:
+            logger.warning(f"Could not keep SQL result as a session view: {e}")
+            return
+        notes.append(f"Result saved as session view {view.name}; later questions can query it like a table.")
+
+    def _format_output(self, sql_query: str, result_table, notes: list) -> str:
+        """Budgeted view of the result for the agent, logged and printed"""
+        # Keep the full result retrievable by reference; the agent only sees a budgeted view
+        result_id = None
+        if result_table.num_rows > Config.RESULT_SUMMARY_TOP_N:
+            result_id = uuid.uuid4().hex[:12]
+            result_store.set(result_id, result_table, sql_query)
+
+        # Format output
+        # output = f"SQL Query:\n{sql_query}\n\n"
+        output = format_result_for_llm(result_table, result_id=result_id)
+        for note in notes:
+            output += f"\nNote: {note}"
+
+        # Log results
+        QueryLogger.log_sql_query(sql_query, result=output)
+
+        print(f"[RESULT] Found {result_table.num_rows} rows:")
+        print(output)
+        print()
+
+        return output
+
+    def _error_output(self, error: Exception, sql_query: Optional[str]) -> str:
+        if isinstance(error, (SQLTimeoutError, QueryCancelledError)):
+            # Structured so the agent can react, e.g. by simplifying the question
+            details = {
+                "error": "timeout" if isinstance(error, SQLTimeoutError) else "cancelled",
+                "message": str(error),
+                "timeout_seconds": Config.SQL_QUERY_TIMEOUT,
+                "sql": sql_query,
+            }
+            if isinstance(error, SQLTimeoutError):
+                details["suggestion"] = (
+                    "Simplify the request: add filters, aggregate before joining, "
+                    "or ask for fewer columns/rows."
+                )
+            logger.error(f"SQL {details['error']}: {error}")
+            QueryLogger.log_sql_query(details["sql"] or "N/A", error=str(error))
+            print(f"\n[ERROR] {error}\n")
+            return json.dumps(details)
+        error_msg = f"Error executing SQL query: {str(error)}"
+        logger.error(error_msg)
+        QueryLogger.log_sql_query(sql_query or "N/A", error=str(error))
+        print(f"\n[ERROR] {error_msg}\n")
+        return error_msg
+
+    @traced("SQL_Query", kind="tool")
     def run(self, question: str) -> str:
         """Main execution method for the tool"""
+        sql_query = None
         try:
-            record_tool_usage("SQL TOOL USED")
-            print("[TOOL] SQL TOOL USED")
-            logger.info("[TOOL] SQL_Query invoked")
-            # Generate SQL
-            logger.info(f"Generating SQL for question: {question}")
-            sql_query = self.generate_sql(question)
-            
-            logger.info(f"Generated SQL Query:\n{sql_query}")
-            print(f"\n{'='*80}")
-            print(f"[SQL QUERY]")
-            print(f"{sql_query}")
-            print(f"{'='*80}\n")
-            
-            # Execute SQL with retry
-            result_df = self.execute_sql(sql_query)
-            
-            # Log results
-            QueryLogger.log_sql_query(sql_query, result=result_df)
-            
-            # Format output
-            # output = f"SQL Query:\n{sql_query}\n\n"
-            output = ""
-            
-            if len(result_df) == 0:
-                output += "No results found."
-                print("[RESULT] No results found.\n")
+            template_sql = self._start(question)
+
+            # Reuse SQL generated for the same or a paraphrased question
+            cached_sql, question_embedding = None, None
+            # SQL over one session's views is never shared through the cache
+            if self.sql_cache and not template_sql and not self._session_for(question):
+                cached_sql, question_embedding = self.sql_cache.lookup(question, self.schema_fingerprint)
+
+            if template_sql:
+                sql_query = template_sql
+            elif cached_sql:
+                sql_query = cached_sql
+                logger.info(f"Using cached SQL Query:\n{sql_query}")
             else:
-                output += f"Results ({len(result_df)} rows):\n"
-                output += result_df.to_string(index=False)
-                
-                print(f"[RESULT] Found {len(result_df)} rows:")
-                print(result_df.to_string(index=False))
-                print()
-            
-            return output
+                # Generate SQL
+                logger.info(f"Generating SQL for question: {question}")
+                sql_query = self.generate_sql(question, question_embedding)
+                logger.info(f"Generated SQL Query:\n{sql_query}")
+            self._show_sql(sql_query, " (template)" if template_sql else " (cached)" if cached_sql else "")
             
+            # Execute SQL (transient errors back off, deterministic errors go to repair)
+            result_table, notes = None, []
+            if template_sql or cached_sql:
+                try:
+                    sql_query, result_table, notes = self._execute_with_repair(question, sql_query, max_repairs=0)
+                except (SQLTimeoutError, QueryCancelledError):
+                    raise
+                except Exception as e:
+                    self._fast_path_failed(e, sql_query, cached=bool(cached_sql))
+                    template_sql = cached_sql = None
+                    sql_query = self.generate_sql(question, question_embedding)
+                    logger.info(f"Generated SQL Query:\n{sql_query}")
+            if result_table is None:
+                sql_query, result_table, notes = self._execute_with_repair(question, sql_query)
+
+            if self.sql_cache and not cached_sql and not template_sql and not self._session_for(sql_query):
+                self.sql_cache.store(question, sql_query, self.schema_fingerprint, question_embedding)
+
+            self._register_result(question, sql_query, result_table, notes)
+            return self._format_output(sql_query, result_table, notes)
+        except Exception as e:
+            return self._error_output(e, sql_query)
+
+    @traced("SQL_Query", kind="tool")
+    async def arun(self, question: str) -> str:
+        """Coroutine version of run: LLM and embedding calls are awaited, DuckDB work runs on the tool executor"""
+        sql_query = None
+        try:
+            template_sql = self._start(question)
+
+            cached_sql, question_embedding = None, None
+            if self.sql_cache and not template_sql and not self._session_for(question):
+                cached_sql, question_embedding = await self.sql_cache.alookup(question, self.schema_fingerprint)
+
+            if template_sql:
+                sql_query = template_sql
+            elif cached_sql:
+                sql_query = cached_sql
+                logger.info(f"Using cached SQL Query:\n{sql_query}")
+            else:
+                logger.info(f"Generating SQL for question: {question}")
+                sql_query = await self.agenerate_sql(question, question_embedding)
+                logger.info(f"Generated SQL Query:\n{sql_query}")
+            self._show_sql(sql_query, " (template)" if template_sql else " (cached)" if cached_sql else "")
+
+            result_table, notes = None, []
+            if template_sql or cached_sql:
+                try:
+                    sql_query, result_table, notes = await self._aexecute_with_repair(question, sql_query, max_repairs=0)
+                except (SQLTimeoutError, QueryCancelledError):
+                    raise
+                except Exception as e:
+                    self._fast_path_failed(e, sql_query, cached=bool(cached_sql))
+                    template_sql = cached_sql = None
+                    sql_query = await self.agenerate_sql(question, question_embedding)
+                    logger.info(f"Generated SQL Query:\n{sql_query}")
+            if result_table is None:
+                sql_query, result_table, notes = await self._aexecute_with_repair(question, sql_query)
+
+            if self.sql_cache and not cached_sql and not template_sql and not self._session_for(sql_query):
+                await run_blocking(self.sql_cache.store, question, sql_query, self.schema_fingerprint, question_embedding)
+
+            await run_blocking(self._register_result, question, sql_query, result_table, notes)
+            return await run_blocking(self._format_output, sql_query, result_table, notes)
         except Exception as e:
-            error_msg = f"Error executing SQL query: {str(e)}"
-            logger.error(error_msg)
-            QueryLogger.log_sql_query(
-                sql_query if 'sql_query' in locals() else "N/A",
-                error=str(e)
-            )
-            print(f"\n[ERROR] {error_msg}\n")
-            return error_msg
+            return self._error_output(e, sql_query)
     
     def as_tool(self) -> Tool:
         """Convert to LangChain Tool"""
         return Tool(
             name="SQL_Query",
             func=self.run,
+            coroutine=self.arun,
             description="""Use this tool for analytical queries that require calculations, aggregations, or filtering by exact values.
             
 Examples:
@@ -0,0 +1,359 @@
+"""
+Request-scoped tracing: spans for agent steps, LLM calls, tools, SQL, FAISS and ML training
+"""
+import contextvars
+import inspect
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOOL_STATUS = "INCUBATOR RESPONSE (NO TOOL USED)"
+
+
+@dataclass
+class Span:
+    name: str
+    kind: str  # request, agent_step, llm, tool, duckdb_execution, faiss_search, embedding, ml_training, ...
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    parent_id: Optional[str] = None
+    start: float = field(default_factory=time.time)
+    end: Optional[float] = None
+    status: str = "ok"
+    error: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return None if self.end is None else round((self.end - self.start) * 1000, 2)
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.end = time.time()
+        if error is not None:
+            self.status = "error"
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    """All spans of one request, plus the tool status shown to the user while it runs"""
+
+    def __init__(self, question: str, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.question = question
+        self.root = Span(name="request", kind="request", attributes={"question": question})
+        self.spans: List[Span] = [self.root]
+        self.tool_status = DEFAULT_TOOL_STATUS
+        self._run_spans: Dict[Any, tuple] = {}  # LangChain run_id -> (span, owned), for callback-created spans
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> Span:
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def bind_run(self, run_id, span: Span, owned: bool = True):
+        """Map a run to a span; unowned runs (chains nested in a step) only point at their step's span"""
+        with self._lock:
+            self._run_spans[run_id] = (span, owned)
+
+    def pop_run(self, run_id) -> tuple:
+        with self._lock:
+            return self._run_spans.pop(run_id, (None, False))
+
+    def run_span(self, run_id) -> Optional[Span]:
+        with self._lock:
+            return self._run_spans.get(run_id, (None, False))[0]
+
+    def spans_of_kind(self, kind: str) -> List[Span]:
+        with self._lock:
+            return [span for span in self.spans if span.kind == kind]
+
+    def breakdown(self) -> Dict[str, Any]:
+        """Total time, call count and LLM tokens per span kind and name"""
+        totals: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "total_ms": 0.0})
+        tokens = {"input_tokens": 0, "output_tokens": 0, "cached_tokens": 0}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            if span is self.root or span.duration_ms is None:
+                continue
+            key = span.kind if span.kind == span.name else f"{span.kind}:{span.name}"
+            totals[key]["count"] += 1
+            totals[key]["total_ms"] = round(totals[key]["total_ms"] + span.duration_ms, 2)
+            if span.kind == "llm":
+                for name in tokens:
+                    tokens[name] += span.attributes.get(name, 0) or 0
+        return {
+            "trace_id": self.trace_id,
+            "total_ms": self.root.duration_ms,
+            "stages": dict(totals),
+            "llm_tokens": tokens,
+        }
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        return {
+            "trace_id": self.trace_id,
+            "question": self.question,
+            "status": self.root.status,
+            "duration_ms": self.root.duration_ms,
+            "breakdown": self.breakdown(),
+            "spans": spans,
+        }
+
+
+class TraceStore:
+    """Most recent finished traces, for the admin endpoints"""
+
+    def __init__(self, max_traces: int = 200):
+        self.max_traces = max_traces
+        self._traces: "OrderedDict[str, Trace]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self._traces[trace.trace_id] = trace
+            self._traces.move_to_end(trace.trace_id)
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        with self._lock:
+            return self._traces.get(trace_id)
+
+    def recent(self, limit: int = 50) -> List[dict]:
+        with self._lock:
+            traces = list(self._traces.values())[-limit:]
+        return [
+            {
+                "trace_id": t.trace_id,
+                "question": t.question,
+                "status": t.root.status,
+                "started_at": t.root.start,
+                "duration_ms": t.root.duration_ms,
+                "spans": len(t.spans),
+            }
+            for t in reversed(traces)
+        ]
+
+
+trace_store = TraceStore(Config.TRACE_MAX_STORED)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def _reset(var: contextvars.ContextVar, token):
+    # Async generators may be resumed from another context; the value then simply goes out of scope
+    try:
+        var.reset(token)
+    except ValueError:
+        pass
+
+
+def _export(trace: Trace):
+    if not Config.TRACE_EXPORT_FILE:
+        return
+    try:
+        with open(Config.TRACE_EXPORT_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(trace.to_dict(), default=str) + "\n")
+    except OSError as e:
+        logger.warning(f"Could not export trace {trace.trace_id}: {e}")
+
+
+@contextmanager
+def start_trace(question: str, trace_id: Optional[str] = None):
+    """Open a request trace; everything called within records its spans into it"""
+    trace = Trace(question, trace_id)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(trace.root)
+    error = None
+    try:
+        yield trace
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        trace.root.finish(error)
+        _reset(_current_span, span_token)
+        _reset(_current_trace, trace_token)
+        trace_store.add(trace)
+        _export(trace)
+        logger.info(f"[TRACE] {trace.trace_id} {json.dumps(trace.breakdown()['stages'])}")
+
+
+@contextmanager
+def trace_span(name: str, kind: Optional[str] = None, **attributes):
+    """Record a span in the current trace (a no-op outside of one)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _current_span.get()
+    span = trace.add(Span(name=name, kind=kind or name, parent_id=parent.span_id if parent else None,
+                          attributes=dict(attributes)))
+    token = _current_span.set(span)
+    error = None
+    try:
+        yield span
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        span.finish(error)
+        _reset(_current_span, token)
+
+
+def traced(name: str, kind: Optional[str] = None) -> Callable:
+    """Decorator form of trace_span, for plain functions and coroutines"""
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with trace_span(name, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with trace_span(name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_tool_status(message: str):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.tool_status = message
+
+
+def get_tool_status() -> str:
+    trace = _current_trace.get()
+    return trace.tool_status if trace is not None else DEFAULT_TOOL_STATUS
+
+
+def _token_usage(response) -> Dict[str, int]:
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                details = usage.get("input_token_details") or {}
+                return {
+                    "input_tokens": usage.get("input_tokens", 0),
+                    "output_tokens": usage.get("output_tokens", 0),
+                    "cached_tokens": details.get("cache_read", 0) or 0,
+                }
+    token_usage = (response.llm_output or {}).get("token_usage") or {}
+    return {
+        "input_tokens": token_usage.get("prompt_tokens", 0),
+        "output_tokens": token_usage.get("completion_tokens", 0),
+        "cached_tokens": (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0,
+    }
+
+
+class TracingCallback(BaseCallbackHandler):
+    """Turns LangChain callbacks into spans of the current trace.
+
+    Attached to each chat model (LLM spans with token counts, named by
+    role) and to agent runs (one span per graph step). Spans are keyed by
+    run_id because start and end callbacks may run in different contexts;
+    chains nested inside a step map to the step's span so the planner's
+    LLM calls nest under it. Tools record their own spans with @traced so
+    that SQL, FAISS and ML spans nest under the tool.
+    """
+
+    run_inline = True  # Called on the event loop for async runs, so it sees the request's context
+
+    def __init__(self, name: Optional[str] = None, llm: bool = True, graph: bool = False):
+        self.name = name
+        self.llm = llm
+        self.graph = graph
+
+    def _open(self, run_id, parent_run_id, name: str, kind: str, **attributes):
+        trace = _current_trace.get()
+        if trace is None:
+            return
+        parent = trace.run_span(parent_run_id) if parent_run_id else None
+        parent = parent or _current_span.get() or trace.root
+        span = trace.add(Span(name=name, kind=kind, parent_id=parent.span_id, attributes=attributes))
+        trace.bind_run(run_id, span)
+
+    def _close(self, run_id, error: Optional[BaseException] = None, **attributes):
+        trace = _current_trace.get()
+        if trace is None:
+            return
+        span, owned = trace.pop_run(run_id)
+        if span is not None and owned:
+            span.attributes.update(attributes)
+            span.finish(error)
+
+    # LLM calls
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        if self.llm:
+            model = ((kwargs.get("invocation_params") or {}).get("model")
+                     or (kwargs.get("metadata") or {}).get("ls_model_name"))
+            self._open(run_id, parent_run_id, self.name or "llm", "llm", model=model)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        if self.llm:
+            self._open(run_id, parent_run_id, self.name or "llm", "llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        if self.llm:
+            self._close(run_id, **_token_usage(response))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        if self.llm:
+            self._close(run_id, error)
+
+    # Agent graph steps
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        trace = _current_trace.get()
+        if not self.graph or trace is None:
+            return
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        if node and kwargs.get("name") == node:
+            self._open(run_id, parent_run_id, node, "agent_step", step=metadata.get("langgraph_step"))
+        elif parent_run_id is not None:
+            parent = trace.run_span(parent_run_id)
+            if parent is not None:
+                trace.bind_run(run_id, parent, owned=False)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        if self.graph:
+            self._close(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        if self.graph:
+            self._close(run_id, error)
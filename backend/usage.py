@@ -0,0 +1,173 @@
+"""
+Token, cost and latency accounting per request, kept in a local DuckDB table
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional, Tuple
+import duckdb
+from config import Config
+from tracing import Trace
+from utils import dataframe_to_records
+import logging
+
+logger = logging.getLogger(__name__)
+
+USAGE_GROUPS = ("question_type", "status", "cached", "day")
+
+
+def model_price(model: Optional[str]) -> Optional[Tuple[float, float, float]]:
+    """(input, cached input, output) USD per 1M tokens of the longest matching price entry"""
+    if not model:
+        return None
+    matches = [name for name in Config.MODEL_PRICING if model.startswith(name)]
+    if not matches:
+        return None
+    return Config.MODEL_PRICING[max(matches, key=len)]
+
+
+def llm_cost(model: Optional[str], input_tokens: int, cached_tokens: int, output_tokens: int) -> float:
+    """USD cost of one call; cached prompt tokens are billed at the cached input rate"""
+    price = model_price(model)
+    if price is None:
+        return 0.0
+    input_price, cached_price, output_price = price
+    uncached = max(input_tokens - cached_tokens, 0)
+    return (uncached * input_price + cached_tokens * cached_price + output_tokens * output_price) / 1_000_000
+
+
+def usage_summary(trace: Trace) -> Dict[str, Any]:
+    """Tokens, cost and LLM time of a request, in total and per LLM role"""
+    totals = {"llm_calls": 0, "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0, "cost_usd": 0.0, "llm_ms": 0.0}
+    by_role: Dict[str, Dict[str, Any]] = defaultdict(lambda: dict.fromkeys(totals, 0))
+    unpriced = set()
+    for span in trace.spans_of_kind("llm"):
+        attrs = span.attributes
+        call = {
+            "llm_calls": 1,
+            "input_tokens": attrs.get("input_tokens", 0) or 0,
+            "cached_tokens": attrs.get("cached_tokens", 0) or 0,
+            "output_tokens": attrs.get("output_tokens", 0) or 0,
+            "llm_ms": span.duration_ms or 0.0,
+        }
+        call["cost_usd"] = llm_cost(attrs.get("model"), call["input_tokens"], call["cached_tokens"], call["output_tokens"])
+        if model_price(attrs.get("model")) is None:
+            unpriced.add(attrs.get("model") or "unknown")
+        role = by_role[span.name]
+        role["model"] = attrs.get("model")
+        for name, value in call.items():
+            totals[name] += value
+            role[name] += value
+    for values in [totals, *by_role.values()]:
+        values["cost_usd"] = round(values["cost_usd"], 6)
+        values["llm_ms"] = round(values["llm_ms"], 2)
+    if unpriced:
+        logger.warning(f"[USAGE] No price configured for models: {sorted(unpriced)}")
+    tools = sorted({span.name for span in trace.spans_of_kind("tool")})
+    return dict(totals, tools=tools, by_role=dict(by_role))
+
+
+class UsageStore:
+    """One row per request in the query_usage table, for cost and latency reports.
+
+    The table lives in its own DuckDB file (Config.USAGE_DB_PATH) so
+    rebuilding the data index does not wipe the history.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = duckdb.connect(self.db_path or Config.USAGE_DB_PATH)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_usage (
+                    trace_id VARCHAR,
+                    created_at TIMESTAMP,
+                    question VARCHAR,
+                    question_type VARCHAR,
+                    status VARCHAR,
+                    cached BOOLEAN,
+                    total_ms DOUBLE,
+                    ttft_ms DOUBLE,
+                    llm_ms DOUBLE,
+                    llm_calls INTEGER,
+                    input_tokens BIGINT,
+                    cached_tokens BIGINT,
+                    output_tokens BIGINT,
+                    cost_usd DOUBLE,
+                    by_role VARCHAR
+                )
+            """)
+        return self._conn
+
+    def record(self, trace: Trace, usage: Dict[str, Any], status: str = "ok", cached: bool = False,
+               total_ms: Optional[float] = None, ttft_ms: Optional[float] = None):
+        """Insert one request's usage; failures are logged, never raised into the request"""
+        if not Config.USAGE_TRACKING_ENABLED:
+            return
+        if cached:
+            question_type = "cached"
+        else:
+            question_type = "+".join(usage["tools"]) or "direct"
+        row = (
+            trace.trace_id,
+            time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(trace.root.start)),
+            trace.question,
+            question_type,
+            status,
+            cached,
+            total_ms if total_ms is not None else trace.root.duration_ms,
+            ttft_ms,
+            usage["llm_ms"],
+            usage["llm_calls"],
+            usage["input_tokens"],
+            usage["cached_tokens"],
+            usage["output_tokens"],
+            usage["cost_usd"],
+            json.dumps(usage["by_role"]),
+        )
+        try:
+            with self._lock:
+                self._connection().execute(
+                    "INSERT INTO query_usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row
+                )
+        except Exception as e:
+            logger.warning(f"Could not record usage for trace {trace.trace_id}: {e}")
+
+    def summary(self, group_by: str = "question_type", limit: int = 20) -> list:
+        """Requests, tokens, cost and latency percentiles per group, most expensive first"""
+        if group_by not in USAGE_GROUPS:
+            raise ValueError(f"group_by must be one of {', '.join(USAGE_GROUPS)}")
+        group = "CAST(created_at AS DATE)" if group_by == "day" else group_by
+        with self._lock:
+            result = self._connection().execute(f"""
+                SELECT CAST({group} AS VARCHAR) AS "group",
+                       COUNT(*) AS requests,
+                       CAST(SUM(llm_calls) AS BIGINT) AS llm_calls,
+                       CAST(SUM(input_tokens) AS BIGINT) AS input_tokens,
+                       CAST(SUM(cached_tokens) AS BIGINT) AS cached_tokens,
+                       CAST(SUM(output_tokens) AS BIGINT) AS output_tokens,
+                       ROUND(SUM(cost_usd), 6) AS cost_usd,
+                       ROUND(AVG(cost_usd), 6) AS avg_cost_usd,
+                       ROUND(quantile_cont(total_ms, 0.5), 1) AS p50_ms,
+                       ROUND(quantile_cont(total_ms, 0.95), 1) AS p95_ms,
+                       ROUND(quantile_cont(ttft_ms, 0.5), 1) AS p50_ttft_ms
+                FROM query_usage
+                GROUP BY 1
+                ORDER BY cost_usd DESC, requests DESC
+                LIMIT ?
+            """, [limit]).fetchdf()
+        return dataframe_to_records(result)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+usage_store = UsageStore()
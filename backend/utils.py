@@ -1,12 +1,24 @@
 """
 Utility functions for logging, caching, and retry logic
 """
+import asyncio
+import contextvars
+import functools
+import inspect
 import logging
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from functools import wraps
-from typing import Any, Callable
+from typing import Any, Callable, Optional
 from datetime import datetime
 from config import Config
+from metrics import llm_call_duration, llm_call_errors, metrics, stage_duration
+from tracing import TracingCallback, get_tool_status, set_tool_status, trace_span
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_openai import ChatOpenAI
 from openai import OpenAI
 import httpx
 
@@ -78,8 +90,53 @@ class QueryLogger:
         logger.info(f"[OBSERVATION] {observation}\n")
 
 
-def retry_with_backoff(max_retries: int = None, delay: float = None):
-    """Decorator for retry logic with exponential backoff"""
+# DuckDB raises these for problems in the statement itself; retrying the same SQL cannot help
+DETERMINISTIC_ERROR_TYPES = {
+    "ParserException",
+    "SyntaxException",
+    "BinderException",
+    "CatalogException",
+    "ConversionException",
+    "InvalidInputException",
+    "NotImplementedException",
+    "TypeMismatchException",
+    "OutOfRangeException",
+    "ConstraintException",
+    "PermissionException",
+    # The same plan exhausts the same memory limit again (it already spills what it can);
+    # the query has to change, e.g. aggregate or filter before joining
+    "OutOfMemoryException",
+    "SQLGuardError",
+}
+
+# Errors caused by the environment (locks, I/O, network) that may succeed later
+TRANSIENT_ERROR_TYPES = {
+    "IOException",
+    "TransactionException",
+    "ConnectionException",
+    "HTTPException",
+    "TimeoutError",
+    "ConnectionError",
+    "APITimeoutError",
+    "APIConnectionError",
+    "RateLimitError",
+}
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Classify an exception as transient (worth backing off) or deterministic"""
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if names & DETERMINISTIC_ERROR_TYPES:
+        return False
+    return bool(names & TRANSIENT_ERROR_TYPES)
+
+
+def retry_with_backoff(max_retries: int = None, delay: float = None, retry_if: Callable = is_transient_error):
+    """Decorator for retry logic with exponential backoff.
+
+    Only errors accepted by ``retry_if`` are retried; anything else is raised
+    immediately so callers can handle deterministic failures (e.g. repair the SQL).
+    """
     if max_retries is None:
         max_retries = Config.SQL_MAX_RETRIES
     if delay is None:
@@ -93,6 +150,8 @@ def retry_with_backoff(max_retries: int = None, delay: float = None):
                 try:
                     return func(*args, **kwargs)
                 except Exception as e:
+                    if not retry_if(e):
+                        raise
                     retries += 1
                     if retries >= max_retries:
                         logger.error(f"Failed after {max_retries} retries: {str(e)}")
@@ -107,6 +166,43 @@ def retry_with_backoff(max_retries: int = None, delay: float = None):
     return decorator
 
 
+class RateLimiter:
+    """Thread-safe limiter spacing calls at most rate_per_second apart (0 disables)"""
+
+    def __init__(self, rate_per_second: float):
+        self.interval = 1.0 / rate_per_second if rate_per_second and rate_per_second > 0 else 0.0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def latency_summary(latencies: list) -> dict:
+    """p50/p90/p99/max of a list of latencies in seconds"""
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "p50": round(percentile(50), 3),
+        "p90": round(percentile(90), 3),
+        "p99": round(percentile(99), 3),
+        "max": round(ordered[-1], 3),
+        "mean": round(sum(ordered) / len(ordered), 3),
+    }
+
+
 class SimpleCache:
     """Simple in-memory cache for ML predictions and queries"""
     
@@ -150,12 +246,34 @@ def generate_cache_key(func_name: str, *args, **kwargs) -> str:
     return hashlib.md5(key_string.encode()).hexdigest()
 
 
+def compute_dataset_version(path: str) -> str:
+    """Content hash identifying a dataset file, used to key per-dataset caches"""
+    import hashlib
+
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
 def timed_execution(func: Callable) -> Callable:
-    """Decorator to measure execution time"""
+    """Decorator to measure execution time (logged, and traced as a span of the current request)"""
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start_time = time.time()
+            with trace_span(func.__qualname__, kind="function"):
+                result = await func(*args, **kwargs)
+            logger.info(f"[TIMING] {func.__name__} executed in {time.time() - start_time:.2f}s")
+            return result
+        return async_wrapper
+
     @wraps(func)
     def wrapper(*args, **kwargs):
         start_time = time.time()
-        result = func(*args, **kwargs)
+        with trace_span(func.__qualname__, kind="function"):
+            result = func(*args, **kwargs)
         end_time = time.time()
         execution_time = end_time - start_time
         
@@ -203,38 +321,454 @@ def format_dataframe_for_llm(df, max_rows: int = 10) -> str:
     return result
 
 
-# --- Tool usage tracking ---------------------------------------------------
-class ToolUsageTracker:
-    """Tracks which tool handled the latest query."""
+_token_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken for the configured model (falls back to ~4 chars/token)"""
+    global _token_encoding
+    try:
+        if _token_encoding is None:
+            import tiktoken
+            try:
+                _token_encoding = tiktoken.encoding_for_model(Config.LLM_MODEL)
+            except KeyError:
+                _token_encoding = tiktoken.get_encoding("o200k_base")
+        return len(_token_encoding.encode(text))
+    except Exception:
+        return len(text) // 4
+
+
+def _column_aggregates(table) -> str:
+    """count/sum/min/max/distinct per column of an Arrow table, computed by DuckDB"""
+    import duckdb
+
+    con = duckdb.connect()
+    con.register("result", table)
+    lines = []
+    for name, dtype in zip(table.column_names, table.schema.types):
+        col = '"' + name.replace('"', '""') + '"'
+        is_numeric = str(dtype).startswith(("int", "uint", "float", "double", "decimal"))
+        if is_numeric:
+            count, total, lo, hi, distinct = con.execute(
+                f"SELECT COUNT({col}), SUM({col}), MIN({col}), MAX({col}), "
+                f"LEAST(APPROX_COUNT_DISTINCT({col}), COUNT({col})) FROM result"
+            ).fetchone()
+            lines.append(
+                f"  - {name}: count={count}, sum={total:.2f}, min={lo}, max={hi}, distinct~{distinct}"
+                if total is not None else f"  - {name}: count={count}"
+            )
+        else:
+            count, lo, hi, distinct = con.execute(
+                f"SELECT COUNT({col}), MIN({col}), MAX({col}), LEAST(APPROX_COUNT_DISTINCT({col}), COUNT({col})) FROM result"
+            ).fetchone()
+            lines.append(f"  - {name}: count={count}, distinct~{distinct}, min={lo}, max={hi}")
+    con.close()
+    return "\n".join(lines)
+
+
+def format_result_for_llm(table, token_budget: int = None, result_id: str = None) -> str:
+    """Format an Arrow result within a token budget.
+
+    Small results are returned in full. Larger ones are reduced to the top-N
+    rows that fit plus per-column aggregates, with a reference to the full
+    result when it has been stored.
+    """
+    if token_budget is None:
+        token_budget = Config.SQL_RESULT_TOKEN_BUDGET
+    total_rows = table.num_rows
+    if total_rows == 0:
+        return "No results found."
+
+    # Only render the full table when it could plausibly fit
+    if total_rows <= Config.RESULT_FULL_MAX_ROWS:
+        full_text = f"Results ({total_rows} rows):\n" + table.to_pandas().to_string(index=False)
+        if count_tokens(full_text) <= token_budget:
+            return full_text
+
+    aggregates = f"Column aggregates over all {total_rows} rows:\n" + _column_aggregates(table)
+    reference = f"\nFull result stored as result_id={result_id}" if result_id else ""
+
+    n = min(Config.RESULT_SUMMARY_TOP_N, total_rows)
+    while True:
+        top = table.slice(0, n).to_pandas().to_string(index=False)
+        text = (
+            f"Results ({total_rows} rows, showing first {n}):\n{top}\n\n{aggregates}{reference}"
+        )
+        if n <= 1 or count_tokens(text) <= token_budget:
+            return text
+        n //= 2
+
+
+def fetch_arrow(result):
+    """Fetch a DuckDB result as a pyarrow Table across DuckDB versions"""
+    fetch = getattr(result, "to_arrow_table", None) or result.fetch_arrow_table
+    return fetch()
 
-    DEFAULT_MESSAGE = "INCUBATOR RESPONSE (NO TOOL USED)"
+
+def dataframe_to_records(df) -> list:
+    """Convert a DataFrame to JSON-safe records (NaN -> None, numpy -> python types)"""
+    import json
+    return json.loads(df.to_json(orient="records", date_format="iso"))
+
+
+# --- Request cancellation ---------------------------------------------------
+class QueryCancelledError(Exception):
+    """The request that owns this work was cancelled (e.g. the client disconnected)"""
+
+
+class QueryCancellation:
+    """Cancellation scope for one request: interrupts every DuckDB cursor it owns."""
 
     def __init__(self):
-        self.reset()
+        self._cancelled = threading.Event()
+        self._cursors = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            cursors = list(self._cursors)
+        for cursor in cursors:
+            try:
+                cursor.interrupt()
+            except Exception as e:
+                logger.warning(f"Failed to interrupt cursor: {e}")
+        if cursors:
+            logger.info(f"[CANCEL] Interrupted {len(cursors)} running queries")
+
+    def register(self, cursor):
+        with self._lock:
+            self._cursors.add(cursor)
+        if self.cancelled:
+            cursor.interrupt()
+
+    def unregister(self, cursor):
+        with self._lock:
+            self._cursors.discard(cursor)
+
+
+# Tools run on executor threads; LangChain copies the context, so the scope follows the request
+_current_cancellation: contextvars.ContextVar = contextvars.ContextVar("query_cancellation", default=None)
+
+
+def get_cancellation() -> Optional[QueryCancellation]:
+    return _current_cancellation.get()
+
+
+@contextmanager
+def cancellation_scope():
+    """Install a new cancellation scope for the work done inside the block"""
+    scope = QueryCancellation()
+    token = _current_cancellation.set(scope)
+    try:
+        yield scope
+    finally:
+        try:
+            _current_cancellation.reset(token)
+        except ValueError:
+            # Async generators may finish in a different context than they started in
+            pass
+
+
+# --- Blocking work from async tools ------------------------------------------
+class InstrumentedExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that counts its queued and running calls for the metrics gauges"""
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = ""):
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.queued = 0
+        self.running = 0
+        self._counts_lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs):
+        def run():
+            with self._counts_lock:
+                self.queued -= 1
+                self.running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._counts_lock:
+                    self.running -= 1
+
+        def on_done(future):
+            # Cancelled before a worker picked it up
+            if future.cancelled():
+                with self._counts_lock:
+                    self.queued -= 1
+
+        with self._counts_lock:
+            self.queued += 1
+        try:
+            future = super().submit(run)
+        except BaseException:
+            with self._counts_lock:
+                self.queued -= 1
+            raise
+        future.add_done_callback(on_done)
+        return future
+
+
+_blocking_executor: Optional[InstrumentedExecutor] = None
+_blocking_executor_lock = threading.Lock()
+
+
+def get_blocking_executor() -> InstrumentedExecutor:
+    """Dedicated pool for DuckDB, FAISS and pandas work, separate from the event loop's default executor"""
+    global _blocking_executor
+    with _blocking_executor_lock:
+        if _blocking_executor is None:
+            _blocking_executor = InstrumentedExecutor(
+                max_workers=Config.TOOL_EXECUTOR_WORKERS, thread_name_prefix="tool-io"
+            )
+        return _blocking_executor
+
+
+metrics.gauge(
+    "tool_executor_queue_depth", "Blocking tool calls waiting for a tool-io worker",
+    lambda: _blocking_executor.queued if _blocking_executor is not None else 0,
+)
 
-    def record(self, message: str):
-        self._last_message = message
 
-    def reset(self):
-        self._last_message = self.DEFAULT_MESSAGE
+async def run_in_executor(executor: ThreadPoolExecutor, func: Callable, *args, **kwargs):
+    """Await a blocking call on executor.
 
-    def get(self) -> str:
-        return self._last_message
+    The call runs in a copy of the caller's context, so trace spans, stage
+    timings and the request's cancellation scope follow it onto the thread.
+    """
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(executor, call)
 
 
-_tool_usage_tracker = ToolUsageTracker()
+async def run_blocking(func: Callable, *args, **kwargs):
+    """Await a blocking call on the tool executor"""
+    return await run_in_executor(get_blocking_executor(), func, *args, **kwargs)
 
 
+# --- Tool usage tracking ---------------------------------------------------
 def record_tool_usage(message: str):
-    _tool_usage_tracker.record(message)
+    """Set the tool status of the current request's trace"""
+    set_tool_status(message)
 
 
-def reset_tool_usage():
-    _tool_usage_tracker.reset()
+def get_tool_usage_status() -> str:
+    return get_tool_status()
 
 
-def get_tool_usage_status() -> str:
-    return _tool_usage_tracker.get()
+# --- Stage timings -----------------------------------------------------------
+_stage_timings: contextvars.ContextVar = contextvars.ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def collect_stage_timings():
+    """Collect (stage, seconds) pairs recorded by timed_stage within this context"""
+    timings = []
+    token = _stage_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        try:
+            _stage_timings.reset(token)
+        except ValueError:
+            pass
+
+
+def record_stage(stage: str, seconds: float):
+    stage_duration.observe(seconds, stage=stage)
+    timings = _stage_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed_stage(stage: str, **attributes):
+    """Time a pipeline stage (SQL generation, DuckDB execution, embedding, ...) and trace it as a span"""
+    start = time.perf_counter()
+    try:
+        with trace_span(stage, **attributes) as span:
+            yield span
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+class StageTimingCallback(BaseCallbackHandler):
+    """Records the wall time of each chat model call under a stage name"""
+
+    run_inline = True  # Cheap; keeps async calls from hopping to a thread per event
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._starts = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            record_stage(self.stage, time.perf_counter() - start)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(run_id, None)
+
+
+# --- Prompt cache telemetry -------------------------------------------------
+class PromptCacheTelemetry(BaseCallbackHandler):
+    """Records cached vs. uncached prompt tokens for every chat model call.
+
+    OpenAI reuses a cached prompt prefix (tools, system message, earlier
+    turns) when it is at least 1024 tokens and byte-identical to a recent
+    request; cached tokens are reported in the usage details.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    @staticmethod
+    def _usage(response) -> tuple:
+        """(prompt_tokens, cached_tokens, model) from an LLMResult"""
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    details = usage.get("input_token_details") or {}
+                    model = (generation.message.response_metadata or {}).get("model_name", "")
+                    return usage.get("input_tokens", 0), details.get("cache_read", 0) or 0, model
+        llm_output = response.llm_output or {}
+        token_usage = llm_output.get("token_usage") or {}
+        details = token_usage.get("prompt_tokens_details") or {}
+        return token_usage.get("prompt_tokens", 0), details.get("cached_tokens", 0) or 0, llm_output.get("model_name", "")
+
+    def on_llm_end(self, response, **kwargs):
+        prompt_tokens, cached_tokens, model = self._usage(response)
+        if not prompt_tokens:
+            return
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+        logger.info(
+            f"[PROMPT CACHE] {model} prompt={prompt_tokens} cached={cached_tokens} "
+            f"uncached={prompt_tokens - cached_tokens}"
+        )
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "uncached_tokens": self.prompt_tokens - self.cached_tokens,
+                "cached_fraction": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0,
+            }
+
+
+# Global telemetry handler, attached to every ChatOpenAI instance
+prompt_cache_telemetry = PromptCacheTelemetry()
+
+
+# --- Model routing telemetry ------------------------------------------------
+class _RoleCallback(BaseCallbackHandler):
+    """Times each chat model call of one role and reports it to the routing telemetry"""
+
+    run_inline = True
+
+    def __init__(self, telemetry: "ModelRoutingTelemetry", role: str):
+        self.telemetry = telemetry
+        self.role = role
+        self._starts = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            self.telemetry.record_call(self.role, time.perf_counter() - start)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        self.telemetry.record_call(self.role, time.perf_counter() - start if start else 0.0, error=True)
+
+
+class ModelRoutingTelemetry:
+    """Per-role call latency, errors and task outcomes, to compare models assigned to each role.
+
+    Latency and errors come from the chat model callbacks. Outcomes come
+    from the callers, which know whether the output was usable: generated
+    SQL that ran without repair, scenario keys that map to real columns,
+    agent runs that finished with an answer.
+    """
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self.window = window
+        self._roles = {}
+
+    def _stats(self, role: str) -> dict:
+        if role not in self._roles:
+            self._roles[role] = {"calls": 0, "errors": 0, "latencies": deque(maxlen=self.window), "ok": 0, "failed": 0}
+        return self._roles[role]
+
+    def callback(self, role: str) -> BaseCallbackHandler:
+        return _RoleCallback(self, role)
+
+    def record_call(self, role: str, seconds: float, error: bool = False):
+        with self._lock:
+            stats = self._stats(role)
+            stats["calls"] += 1
+            if error:
+                stats["errors"] += 1
+            else:
+                stats["latencies"].append(seconds)
+        if error:
+            llm_call_errors.inc(role=role)
+        else:
+            llm_call_duration.observe(seconds, role=role)
+
+    def record_outcome(self, role: str, ok: bool):
+        with self._lock:
+            self._stats(role)["ok" if ok else "failed"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            roles = {role: dict(stats, latencies=list(stats["latencies"])) for role, stats in self._roles.items()}
+        report = {}
+        for role in sorted(set(Config.LLM_ROLE_MODELS) | set(roles)):
+            settings = Config.llm_settings(role)
+            stats = roles.get(role, {"calls": 0, "errors": 0, "latencies": [], "ok": 0, "failed": 0})
+            judged = stats["ok"] + stats["failed"]
+            report[role] = {
+                "model": settings["model"],
+                "base_url": settings["base_url"] or "https://api.openai.com/v1",
+                "calls": stats["calls"],
+                "errors": stats["errors"],
+                "latency_s": latency_summary(stats["latencies"]),
+                "outcomes": judged,
+                "accuracy": round(stats["ok"] / judged, 4) if judged else None,
+            }
+        return report
+
+
+# Global routing telemetry, attached to every role's chat model by get_chat_model
+model_routing_telemetry = ModelRoutingTelemetry(Config.LLM_ROLE_LATENCY_WINDOW)
 
 
 # --- OpenAI client factory ---
@@ -265,6 +799,27 @@ def get_openai_client() -> OpenAI:
         http_client = get_httpx_client()
         _openai_client = OpenAI(
             api_key=Config.OPENAI_API_KEY,
+            base_url=Config.OPENAI_BASE_URL,
             http_client=http_client
         )
-    return _openai_client
\ No newline at end of file
+    return _openai_client
+
+
+def get_chat_model(role: str, stage: str, **kwargs) -> ChatOpenAI:
+    """ChatOpenAI for an LLM role (planner, sql, interpreter, extractor) with its configured model and endpoint"""
+    settings = Config.llm_settings(role)
+    return ChatOpenAI(
+        model=settings["model"],
+        temperature=Config.LLM_TEMPERATURE,
+        openai_api_key=settings["api_key"],
+        base_url=settings["base_url"],
+        http_client=get_httpx_client(),
+        http_async_client=get_httpx_client(async_mode=True),
+        callbacks=[
+            prompt_cache_telemetry,
+            StageTimingCallback(stage),
+            model_routing_telemetry.callback(role),
+            TracingCallback(name=role),
+        ],
+        **kwargs,
+    )
@@ -176,6 +176,10 @@ export class AppComponent implements OnInit {
               this.streamingMessage += data.content;
               this.messages[streamMessageIndex].text = navigationPrefix + this.streamingMessage;
               this.scrollToBottom();
+            } else if (data.type === 'reset') {
+              // Planner text that turned out to precede a tool call
+              this.streamingMessage = '';
+              this.messages[streamMessageIndex].text = navigationPrefix;
             } else if (data.type === 'done') {
               if (data.content && !this.streamingMessage) {
                 this.messages[streamMessageIndex].text = navigationPrefix + data.content;
@@ -180,6 +180,20 @@ export class DetailsPageComponent implements OnInit, OnDestroy {
   }
 
   populateFilterOptions(promotions: Promotion[]): void {
+    // Prefer the backend facet catalog; fall back to scanning promotions client-side
+    this.dataService.getFacets().pipe(takeUntil(this.destroy$)).subscribe({
+      next: (response) => {
+        const values = (column: string) => (response.facets[column] || []).map(f => f.value);
+        this.availableRegions = values('Region').sort();
+        this.availableCustomers = values('Channel_Customer').sort();
+        this.availableProducts = values('ProductDescription').sort();
+        this.availableYears = values('Promo_Year').map(y => Number(y)).filter(y => !isNaN(y)).sort((a, b) => b - a);
+      },
+      error: () => this.populateFilterOptionsFromPromotions(promotions)
+    });
+  }
+
+  populateFilterOptionsFromPromotions(promotions: Promotion[]): void {
     // Extract unique values for filters
     this.availableRegions = [...new Set(promotions.map(p => p.Region).filter(r => r))].sort();
     this.availableCustomers = [...new Set(promotions.map(p => p.Channel_Customer).filter(c => c))].sort();
@@ -100,9 +100,81 @@ export class GanttPageComponent implements OnInit, OnDestroy {
       filtered = filtered.filter(p => p.Actual_RAG === this.filters.ragStatus);
     }
 
-    const ganttData = this.transformToGanttData(filtered);
-    this.chartOption = this.createGanttChart(ganttData);
     this.calculateKPIs(filtered);
+    this.loadTimelineBars(filtered);
+  }
+
+  /**
+   * Fetch only the visible bars from the backend interval index,
+   * falling back to client-side layout if the endpoint is unavailable
+   */
+  loadTimelineBars(filtered: Promotion[]): void {
+    const range = this.getVisibleRange(filtered);
+    if (!range) {
+      this.chartOption = this.createGanttChart([]);
+      return;
+    }
+
+    this.dataService.getTimeline({
+      start: range.start,
+      end: range.end,
+      region: this.filters.region,
+      status: this.filters.status,
+      year: this.filters.year ? Number(this.filters.year) : undefined,
+      rag: this.filters.ragStatus,
+      limit: 20
+    }).pipe(takeUntil(this.destroy$)).subscribe({
+      next: (response) => {
+        const ganttData = (response.bars || []).map(bar => {
+          const startDate = this.toDisplayDate(bar.start_date);
+          const endDate = this.toDisplayDate(bar.end_date);
+          return {
+            name: bar.PromoID,
+            status: bar.Promotion_Status || 'UNKNOWN',
+            start: this.parseDate(startDate).getTime(),
+            end: this.parseDate(endDate).getTime(),
+            startDate,
+            endDate,
+            duration: this.calculateDuration(startDate, endDate)
+          };
+        });
+        this.chartOption = this.createGanttChart(ganttData);
+      },
+      error: (error) => {
+        console.warn('Timeline endpoint unavailable, using client-side layout:', error);
+        this.chartOption = this.createGanttChart(this.transformToGanttData(filtered));
+      }
+    });
+  }
+
+  getVisibleRange(promotions: Promotion[]): { start: string; end: string } | null {
+    if (this.filters.year) {
+      return { start: `${this.filters.year}-01-01`, end: `${this.filters.year}-12-31` };
+    }
+    let min = Infinity;
+    let max = -Infinity;
+    promotions.forEach(p => {
+      if (p.Start_Prom && p.End_Prom) {
+        min = Math.min(min, this.parseDate(p.Start_Prom).getTime());
+        max = Math.max(max, this.parseDate(p.End_Prom).getTime());
+      }
+    });
+    if (!isFinite(min) || !isFinite(max)) {
+      return null;
+    }
+    return { start: this.toIsoDate(new Date(min)), end: this.toIsoDate(new Date(max)) };
+  }
+
+  toIsoDate(date: Date): string {
+    const month = String(date.getMonth() + 1).padStart(2, '0');
+    const day = String(date.getDate()).padStart(2, '0');
+    return `${date.getFullYear()}-${month}-${day}`;
+  }
+
+  toDisplayDate(isoDate: string): string {
+    // yyyy-mm-dd -> dd-mm-yyyy to match the CSV format used elsewhere
+    const [year, month, day] = isoDate.split('-');
+    return `${day}-${month}-${year}`;
   }
 
   calculateKPIs(promotions: Promotion[]): void {
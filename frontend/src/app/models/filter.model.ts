@@ -24,3 +24,42 @@ export interface LLMResponse {
     answer: string;
     navigation?: NavigationInstruction;
 }
+
+export interface TimelineQuery {
+    start: string; // yyyy-mm-dd
+    end: string; // yyyy-mm-dd
+    bucket?: 'day' | 'week' | 'month' | 'quarter' | 'year';
+    region?: string;
+    status?: string;
+    year?: number;
+    rag?: string;
+    limit?: number;
+}
+
+export interface TimelineBar {
+    PromoID: string;
+    Region?: string;
+    Promotion_Status?: string;
+    Promo_Year?: number;
+    Actual_RAG?: string;
+    start_date: string; // yyyy-mm-dd
+    end_date: string; // yyyy-mm-dd
+    row_count: number;
+}
+
+export interface TimelineResponse {
+    total?: number;
+    bars?: TimelineBar[];
+    bucket?: string;
+    buckets?: { bucket_start: string; bucket_end: string; status: string | null; active_count: number }[];
+}
+
+export interface FacetValue {
+    value: string;
+    count: number;
+}
+
+export interface FacetResponse {
+    dataset_version: string;
+    facets: Record<string, FacetValue[]>;
+}
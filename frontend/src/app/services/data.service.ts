@@ -2,7 +2,7 @@ import { Injectable, isDevMode } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
 import { Observable, BehaviorSubject, map } from 'rxjs';
 import { Promotion } from '../models/promotion.model';
-import { DashboardFilters } from '../models/filter.model';
+import { DashboardFilters, FacetResponse, TimelineQuery, TimelineResponse } from '../models/filter.model';
 
 @Injectable({
   providedIn: 'root'
@@ -175,6 +175,28 @@ export class DataService {
     return [...new Set(promotions.map(p => p.Brand))].filter(b => b).sort();
   }
 
+  /**
+   * Get promotion bars active between two dates (yyyy-mm-dd) from the backend interval index
+   */
+  getTimeline(query: TimelineQuery): Observable<TimelineResponse> {
+    const baseUrl = isDevMode() ? 'http://localhost:8000' : '';
+    const params: Record<string, string> = {};
+    Object.entries(query).forEach(([key, value]) => {
+      if (value !== undefined && value !== null && value !== '') {
+        params[key] = String(value);
+      }
+    });
+    return this.http.get<TimelineResponse>(`${baseUrl}/api/timeline`, { params });
+  }
+
+  /**
+   * Get precomputed facet values with counts, narrowed by the current selection
+   */
+  getFacets(selection: Record<string, string[]> = {}): Observable<FacetResponse> {
+    const baseUrl = isDevMode() ? 'http://localhost:8000' : '';
+    return this.http.get<FacetResponse>(`${baseUrl}/api/facets`, { params: selection });
+  }
+
   /**
    * Refresh data
    */